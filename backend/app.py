@@ -1,21 +1,42 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from contextlib import asynccontextmanager
-from typing import List
-import uvicorn
-from pydantic import BaseModel
+from typing import List, Optional, Union
+from pydantic import BaseModel, Field
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
+from datetime import datetime
 import os
 import time
+import json
 import numpy as np
+import asyncio
 from websocket.market_data import MarketDataWebSocket
+from websocket.shared_feed import SharedMarketDataWebSocket
+from models.slippage import SlippageModel
+from tick_store import CANDLE_INTERVALS, iso_timestamps
+from models.fee import FeeCalculator
+from models.execution import STRATEGIES, run_simulation, summarize, shutdown_pool
+from models.volatility import ESTIMATORS, HORIZONS, SECONDS_PER_YEAR
+from models.simulation import FEE_RATES, DEFAULT_FEE_RATE, fee_rates_for, build_grid, simulate_batch, iter_chunks
+from database import db
+from archive import archive
+from cache import ResultCache, quantize
+from metrics import metrics, monitor_event_loop
 
 # Load .env
 load_dotenv()
 
-# Initialize WebSocket handler
-market_ws = MarketDataWebSocket()
+# Initialize WebSocket handler. With SHARED_MARKET_STATE=1 the exchange feed runs once in the
+# ingest process (python -m ingest) and every API worker reads its state from shared memory,
+# so uvicorn can serve with several workers
+if os.getenv('SHARED_MARKET_STATE') == '1':
+    market_ws = SharedMarketDataWebSocket()
+else:
+    market_ws = MarketDataWebSocket()
+# One slippage model per instrument, so each caches the snapshot of its own book
+slippage_models = {symbol: SlippageModel() for symbol in market_ws.instruments}
+fee_calculator = FeeCalculator()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -23,8 +44,11 @@ async def lifespan(app: FastAPI):
         await market_ws.start()
     except Exception as e:
         print(f"Failed to start market data connection: {e}")
+    loop_monitor = asyncio.create_task(monitor_event_loop(metrics.histogram('event_loop_lag')))
     yield
+    loop_monitor.cancel()
     await market_ws.stop()
+    shutdown_pool()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -43,123 +67,511 @@ async def health_check():
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "market_ws_connected": market_ws.ws is not None
+        "market_ws_connected": market_ws.connected,
+        "db_writer": db.writer.stats(),
+        "clients": market_ws.clients.stats()
     }
 
+@app.get("/metrics")
+async def get_metrics():
+    writer_stats = db.writer.stats()
+    cache_stats = simulate_cache.stats()
+    gauges = market_ws.gauges() + [
+        ('db_queue_depth', 'gauge', 'Documents waiting in the write-behind queue',
+         [({'collection': name}, stats['depth']) for name, stats in writer_stats.items()]),
+        ('db_flushed_total', 'counter', 'Documents persisted by the write-behind queue',
+         [({'collection': name}, stats['flushed']) for name, stats in writer_stats.items()]),
+        ('db_dropped_total', 'counter', 'Documents dropped by the write-behind queue',
+         [({'collection': name}, stats['dropped']) for name, stats in writer_stats.items()]),
+        ('db_spilled_total', 'counter', 'Documents spilled to disk by the write-behind queue',
+         [({'collection': name}, stats['spilled']) for name, stats in writer_stats.items()]),
+        ('db_failed_total', 'counter', 'Documents that failed to persist',
+         [({'collection': name}, stats['failed']) for name, stats in writer_stats.items()]),
+        ('simulate_cache_entries', 'gauge', 'Results held in the /api/simulate cache',
+         [({}, cache_stats['entries'])]),
+        ('simulate_cache_hits_total', 'counter', 'Simulations served from the cache',
+         [({}, cache_stats['hits'])]),
+        ('simulate_cache_misses_total', 'counter', 'Simulations computed on a cache miss',
+         [({}, cache_stats['misses'])]),
+        ('simulate_cache_coalesced_total', 'counter', 'Simulations that waited on an identical in-flight miss',
+         [({}, cache_stats['coalesced'])]),
+        ('simulate_cache_evictions_total', 'counter', 'Cached simulations evicted by the size bound',
+         [({}, cache_stats['evictions'])]),
+        ('recent_requests_total', 'counter', 'Requests for recent trades and book snapshots',
+         [({'dataset': name}, count) for name, count in recent_requests.items()]),
+        ('recent_db_reads_total', 'counter', 'Recent trade and book requests that read MongoDB',
+         [({'dataset': name}, count) for name, count in db.reads.items()])
+    ]
+    return PlainTextResponse(metrics.render(gauges), media_type="text/plain; version=0.0.4")
+
 @app.websocket("/ws/market-data")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
     await market_ws.register(websocket)
     try:
         while True:
-            await websocket.receive_text()
+            await market_ws.handle_client_message(websocket, await websocket.receive_text())
     except WebSocketDisconnect:
         await market_ws.unregister(websocket)
     except Exception as e:
         print(f"WebSocket error: {e}")
         await market_ws.unregister(websocket)
 
+# Execution horizon (seconds) and child-order count assumed for market impact
+IMPACT_HORIZON = float(os.getenv('IMPACT_HORIZON', '60'))
+IMPACT_STEPS = int(os.getenv('IMPACT_STEPS', '10'))
+# Live estimate used by /api/simulate when the request leaves out volatility
+VOLATILITY_ESTIMATOR = os.getenv('VOLATILITY_ESTIMATOR', 'ewma')
+VOLATILITY_HORIZON = os.getenv('VOLATILITY_HORIZON', '15m')
+
+# Results of /api/simulate, keyed by quantized parameters and tagged with the symbol state version
+simulate_cache = ResultCache(int(os.getenv('SIMULATE_CACHE_SIZE', '1024')),
+                             float(os.getenv('SIMULATE_CACHE_TTL', '2')))
+SIMULATE_CACHE_DIGITS = int(os.getenv('SIMULATE_CACHE_DIGITS', '6'))
+
 # Models
 class SimulationParams(BaseModel):
     asset: str
     quantity: float
-    volatility: float
+    volatility: Optional[float] = None
     feeTier: str
 
+def _cost_columns(state, quantity: np.ndarray, volatility: np.ndarray, fee_rate: np.ndarray) -> dict:
+    """The /api/simulate cost model for columns of inputs, with the symbol's live models."""
+    impact = None
+    impact_params = state.impact_model.params
+    if impact_params is not None:
+        # Almgren-Chriss impact from the latest calibration; quantity is in USD
+        impact = state.impact_model.total_impact(np.asarray(quantity) / impact_params.price,
+                                                 IMPACT_HORIZON, IMPACT_STEPS, params=impact_params)
+    return simulate_batch(quantity, volatility, fee_rate, impact, state.maker_taker.predict())
+
+def _simulate(state, quantity: float, volatility: float, fee_tier: str) -> dict:
+    fee_rate = FEE_RATES.get(fee_tier, DEFAULT_FEE_RATE)
+    columns = _cost_columns(state, np.array([quantity]), np.array([volatility]), np.array([fee_rate]))
+    slippage = float(columns['slippage'][0])
+    impact = float(columns['impact'][0])
+    net_cost = float(columns['netCost'][0])
+
+    return {
+        'slippage': slippage,
+        'fee': fee_rate,
+        'impact': impact,
+        'netCost': net_cost,
+        'makerTakerProbability': {
+            'maker': float(columns['maker'][0]),
+            'taker': float(columns['taker'][0])
+        }
+    }
+
 @app.post("/api/simulate")
 async def simulate_trade(params: SimulationParams):
     start_time = time.time()
     if params.quantity <= 0:
         return {"error": "Quantity must be positive"}
-    if not (0 <= params.volatility <= 1):
+    if params.volatility is not None and not (0 <= params.volatility <= 1):
         return {"error": "Volatility must be between 0 and 1"}
 
-    fee_rates = {
-        'VIP1': 0.002,
-        'VIP2': 0.0018,
-        'VIP3': 0.0015,
-        'VIP4': 0.0012,
-        'VIP5': 0.001
+    state = market_ws.state(params.asset)
+    volatility = params.volatility
+    if volatility is None:
+        # Live annualized estimate, capped to the range the models accept
+        volatility = state.volatility.estimate(VOLATILITY_ESTIMATOR, VOLATILITY_HORIZON)
+        if volatility is None:
+            return {"error": "No live volatility estimate yet; pass volatility"}
+        volatility = min(volatility, 1.0)
+    quantity = quantize(params.quantity, SIMULATE_CACHE_DIGITS)
+    volatility = quantize(volatility, SIMULATE_CACHE_DIGITS)
+    result = await simulate_cache.get((state.symbol, quantity, volatility, params.feeTier), state.version,
+                                      lambda: _simulate(state, quantity, volatility, params.feeTier))
+    latency = (time.time() - start_time) * 1000
+    metrics.observe('api_simulate', latency / 1000)
+
+    # The cached result is shared, so the per-request latency goes on a copy
+    return dict(result, volatility=volatility, latency=round(latency, 2))
+
+@app.get("/api/volatility")
+async def get_volatility(symbol: Optional[str] = None):
+    state = market_ws.state(symbol)
+    return {
+        'symbol': state.symbol,
+        'estimators': list(ESTIMATORS),
+        'horizons': list(HORIZONS),
+        'volatility': state.volatility.to_dict()
     }
-    fee_rate = fee_rates.get(params.feeTier, 0.002)
 
-    slippage = 0.0005 + (params.volatility * 0.001)
-    impact = 0.0005 + (params.quantity / 10000) * params.volatility
-    net_cost = params.quantity * (1 + slippage + fee_rate + impact)
-    taker_prob = 0.3 + (params.volatility * 0.4)
-    maker_prob = 1 - taker_prob
-    latency = (time.time() - start_time) * 1000
+@app.get("/api/cost-curve")
+async def get_cost_curve(quantity: List[float] = Query(...), volatility: float = 0.0, symbol: Optional[str] = None):
+    start_time = time.perf_counter()
+    book = market_ws.state(symbol).book
+    if not book.synced:
+        return {"error": "Order book not available"}
+    snapshot = slippage_models[book.symbol].snapshot(book)
+    curve = slippage_models[book.symbol].slippage_curve(snapshot, volatility, np.asarray(quantity, dtype=np.float64))
+    latency = (time.perf_counter() - start_time) * 1000
+    return {
+        'bookVersion': snapshot.version,
+        'quantity': quantity,
+        'buy': {name: np.nan_to_num(col).tolist() for name, col in curve['buy'].items()},
+        'sell': {name: np.nan_to_num(col).tolist() for name, col in curve['sell'].items()},
+        'latency': round(latency, 3)
+    }
 
+@app.get("/api/impact")
+async def get_impact_trajectories(quantity: float, horizon: List[float] = Query(...), steps: int = IMPACT_STEPS,
+                                  symbol: Optional[str] = None):
+    model = market_ws.state(symbol).impact_model
+    impact_params = model.params
+    if impact_params is None:
+        return {"error": "Impact model not calibrated yet"}
+    if quantity <= 0:
+        return {"error": "Quantity must be positive"}
+    if not all(np.isfinite(h) and h > 0 for h in horizon):
+        return {"error": "Horizon must be positive"}
+    if not (1 <= steps <= MAX_EXECUTION_STEPS):
+        return {"error": f"Steps must be between 1 and {MAX_EXECUTION_STEPS}"}
+    result = model.trajectories(quantity / impact_params.price, horizon, steps, params=impact_params)
+    notional = quantity
     return {
-        'slippage': slippage,
+        'params': impact_params._asdict(),
+        'horizon': horizon,
+        'holdings': (result['holdings'] * impact_params.price).tolist(),
+        'expectedCost': (result['expected_cost'] / notional).tolist(),
+        'risk': (np.sqrt(result['variance']) / notional).tolist()
+    }
+
+# Execution simulation
+MAX_EXECUTION_PATHS = int(os.getenv('MAX_EXECUTION_PATHS', '1000000'))
+MAX_EXECUTION_STEPS = int(os.getenv('MAX_EXECUTION_STEPS', '1000'))
+
+class ExecutionParams(BaseModel):
+    asset: str
+    quantity: float
+    side: str = 'buy'
+    strategy: str = 'TWAP'
+    horizon: float = IMPACT_HORIZON
+    steps: int = IMPACT_STEPS
+    paths: int = 10000
+    participation: float = 0.1
+    feeTier: str = 'VIP1'
+    # Annualized, like /api/simulate; the paths use it per sqrt(second)
+    volatility: Optional[float] = Field(None, ge=0, allow_inf_nan=False)
+    seed: Optional[int] = None
+
+async def _live_volatility(state) -> Optional[float]:
+    """Return volatility per sqrt(second) from the impact calibration, else from recent 1m candles."""
+    impact_params = state.impact_model.params
+    if impact_params is not None:
+        return impact_params.sigma / impact_params.price
+    now = time.time()
+    candles = await state.tick_store.get_candles('1m', now - 3600, now)
+    if len(candles) < 3:
+        return None
+    returns = np.diff(np.log(candles['close']))
+    return float(returns.std() / np.sqrt(60))
+
+async def _volume_profile(state, horizon: float, steps: int) -> Optional[np.ndarray]:
+    """Traded volume per step over the same clock window one day earlier, for VWAP schedules."""
+    start_ts = time.time() - 86400
+    candles = await state.tick_store.get_candles('1m', start_ts, start_ts + horizon)
+    if len(candles) == 0:
+        return None
+    profile, _ = np.histogram(candles['ts'], bins=steps, range=(start_ts, start_ts + horizon),
+                              weights=candles['volume'])
+    return profile
+
+@app.post("/api/simulate/execution")
+async def simulate_execution(params: ExecutionParams):
+    start_time = time.perf_counter()
+    strategy = params.strategy.upper()
+    if strategy not in STRATEGIES:
+        return {"error": f"Strategy must be one of {list(STRATEGIES)}"}
+    if params.side not in ('buy', 'sell'):
+        return {"error": "Side must be 'buy' or 'sell'"}
+    if params.quantity <= 0 or params.horizon <= 0:
+        return {"error": "Quantity and horizon must be positive"}
+    if not (1 <= params.steps <= MAX_EXECUTION_STEPS):
+        return {"error": f"Steps must be between 1 and {MAX_EXECUTION_STEPS}"}
+    if not (1 <= params.paths <= MAX_EXECUTION_PATHS):
+        return {"error": f"Paths must be between 1 and {MAX_EXECUTION_PATHS}"}
+    if not (0 < params.participation <= 1):
+        return {"error": "Participation must be between 0 and 1"}
+
+    state = market_ws.state(params.asset)
+    book = state.book
+    price = book.mid_price() if book.synced else None
+    if price is None:
+        last = state.tick_store.ticks.last()
+        price = float(last['price']) if last is not None else None
+    if price is None:
+        return {"error": "No market price available"}
+
+    if params.volatility is not None:
+        sigma = params.volatility / np.sqrt(SECONDS_PER_YEAR)
+    else:
+        sigma = await _live_volatility(state)
+    if sigma is None:
+        return {"error": "No live volatility estimate yet; pass volatility"}
+
+    taker_prob = state.maker_taker.predict()
+    maker_prob = 0.0 if taker_prob is None else 1 - taker_prob
+    quantity = params.quantity / price
+    fee_rate, _ = fee_calculator.calculate_fee(params.feeTier, quantity, maker_prob)
+
+    profile = await _volume_profile(state, params.horizon, params.steps) if strategy == 'VWAP' else None
+    impact_params = state.impact_model.params
+    levels = (book.asks.levels(), book.bids.levels()) if book.synced else (np.zeros((0, 2)), np.zeros((0, 2)))
+    costs = await run_simulation(
+        levels, price, quantity, params.side, strategy, params.horizon, params.steps, params.paths,
+        sigma, fee_rate,
+        profile=profile,
+        participation=params.participation,
+        volume_rate=impact_params.volume_rate if impact_params is not None else 0.0,
+        seed=params.seed
+    )
+    latency = (time.perf_counter() - start_time) * 1000
+    return {
+        'strategy': strategy,
+        'paths': params.paths,
+        'price': price,
+        'volatility': float(sigma * np.sqrt(SECONDS_PER_YEAR)),
         'fee': fee_rate,
-        'impact': impact,
-        'netCost': round(net_cost, 2),
-        'makerTakerProbability': {
-            'maker': round(maker_prob, 3),
-            'taker': round(taker_prob, 3)
-        },
+        'bookVersion': book.version,
+        'cost': summarize(costs, params.quantity),
         'latency': round(latency, 2)
     }
 
+# Batch simulation
+MAX_BATCH_ROWS = int(os.getenv('MAX_BATCH_ROWS', '10000000'))
+STREAM_THRESHOLD_ROWS = int(os.getenv('STREAM_THRESHOLD_ROWS', '100000'))
+STREAM_CHUNK_ROWS = 50000
+
+class RangeSpec(BaseModel):
+    start: float
+    stop: float
+    num: int
+
+class GridSpec(BaseModel):
+    quantity: Union[List[float], RangeSpec]
+    volatility: Union[List[float], RangeSpec]
+    feeTier: List[str]
+
+class BatchSimulationParams(BaseModel):
+    asset: str
+    quantity: Optional[List[float]] = None
+    volatility: Optional[List[float]] = None
+    feeTier: Optional[List[str]] = None
+    grid: Optional[GridSpec] = None
+    stream: bool = False
+
+def _axis(values):
+    if isinstance(values, RangeSpec):
+        return np.linspace(values.start, values.stop, values.num)
+    return np.asarray(values, dtype=np.float64)
+
+def _columns_json(columns):
+    return json.dumps({name: col.tolist() for name, col in columns.items()})
+
+@app.post("/api/simulate/batch")
+async def simulate_batch_trades(params: BatchSimulationParams):
+    start_time = time.perf_counter()
+    if params.grid is not None:
+        quantity = _axis(params.grid.quantity)
+        volatility = _axis(params.grid.volatility)
+        rows = len(quantity) * len(volatility) * len(params.grid.feeTier)
+        if rows > MAX_BATCH_ROWS:
+            return {"error": f"Grid has {rows} rows, limit is {MAX_BATCH_ROWS}"}
+        inputs = build_grid(quantity, volatility, params.grid.feeTier)
+    elif params.quantity is not None and params.volatility is not None:
+        rows = len(params.quantity)
+        if len(params.volatility) != rows:
+            return {"error": "quantity and volatility must have the same length"}
+        fee_tiers = params.feeTier or ['VIP1']
+        if len(fee_tiers) not in (1, rows):
+            return {"error": "feeTier must have one value or one per row"}
+        inputs = {
+            'quantity': np.asarray(params.quantity, dtype=np.float64),
+            'volatility': np.asarray(params.volatility, dtype=np.float64),
+            'fee': fee_rates_for(fee_tiers)
+        }
+    else:
+        return {"error": "Provide either quantity/volatility columns or a grid"}
+
+    if np.any(inputs['quantity'] <= 0):
+        return {"error": "Quantity must be positive"}
+    if np.any((inputs['volatility'] < 0) | (inputs['volatility'] > 1)):
+        return {"error": "Volatility must be between 0 and 1"}
+
+    results = _cost_columns(market_ws.state(params.asset), inputs['quantity'], inputs['volatility'], inputs['fee'])
+    columns = {'quantity': inputs['quantity'], 'volatility': inputs['volatility'], **results}
+    rows = len(columns['quantity'])
+    latency = (time.perf_counter() - start_time) * 1000
+
+    if params.stream or rows > STREAM_THRESHOLD_ROWS:
+        def generate():
+            yield json.dumps({'rows': rows, 'columns': list(columns), 'latency': round(latency, 3)}) + '\n'
+            for chunk in iter_chunks(columns, STREAM_CHUNK_ROWS):
+                yield _columns_json(chunk) + '\n'
+        return StreamingResponse(generate(), media_type='application/x-ndjson')
+
+    return {
+        'rows': rows,
+        'columns': {name: col.tolist() for name, col in columns.items()},
+        'latency': round(latency, 3)
+    }
+
+def _interval_range(days: int, interval: str):
+    seconds = CANDLE_INTERVALS[interval][0]
+    end_ts = time.time()
+    start_ts = end_ts - days * 86400
+    return start_ts - start_ts % seconds, end_ts
+
 @app.get("/api/historical")
-async def get_historical_data(days: int = 90):
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=days)
-    dates = [start_date + timedelta(days=x) for x in range(days + 1)]
-    trend_cycle = np.sin(np.linspace(0, 4*np.pi, len(dates)))
-    base_volume = 1000000
-    data = []
-
-    for i, date in enumerate(dates):
-        daily_volatility = 0.3 + 0.2 * trend_cycle[i] + np.random.random() * 0.2
-        volume = base_volume * (1 + trend_cycle[i] * 0.3 + np.random.normal(0, 0.1))
-        slippage = 0.0005 + (daily_volatility * 0.001)
-        impact = 0.0005 + (volume / base_volume) * daily_volatility * 0.001
-        data.append({
-            'timestamp': date.isoformat(),
-            'slippage': round(slippage, 6),
-            'impact': round(impact, 6),
-            'volume': round(volume, 2)
-        })
-    return data
+async def get_historical_data(days: int = 90, interval: str = '1d', symbol: Optional[str] = None):
+    if interval not in CANDLE_INTERVALS:
+        return {"error": f"Interval must be one of {list(CANDLE_INTERVALS)}"}
+    start_ts, end_ts = _interval_range(days, interval)
+    candles = await market_ws.state(symbol).tick_store.get_candles(interval, start_ts, end_ts, db=db)
+    if len(candles) == 0:
+        return []
+
+    # Range-based volatility per candle drives the same cost formulas as /api/simulate
+    close = candles['close']
+    volume = candles['volume']
+    candle_volatility = np.clip((candles['high'] - candles['low']) / close, 0, 1)
+    mean_volume = volume.mean() or 1.0
+    slippage = np.round(0.0005 + candle_volatility * 0.001, 6)
+    impact = np.round(0.0005 + (volume / mean_volume) * candle_volatility * 0.001, 6)
+    timestamps = iso_timestamps(candles['ts'])
+    keys = ('timestamp', 'slippage', 'impact', 'volume')
+    return [dict(zip(keys, row)) for row in zip(timestamps.tolist(), slippage.tolist(),
+                                               impact.tolist(), np.round(volume, 2).tolist())]
 
 @app.get("/api/price-history")
-async def get_price_history(days: int = 90):
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=days)
-    dates = [start_date + timedelta(days=x) for x in range(days + 1)]
-    base_price = 50000
-    base_volume = 1000000
-    trend = np.cumsum(np.random.normal(0, 1, len(dates))) * 100
-    volatility = np.abs(np.sin(np.linspace(0, 8*np.pi, len(dates)))) * 200 + 100
-    data = []
-
-    for i, date in enumerate(dates):
-        price_base = base_price + trend[i]
-        daily_range = volatility[i] * np.random.random()
-        open_price = price_base + np.random.normal(0, volatility[i])
-        close_price = open_price + np.random.normal(0, volatility[i])
-        high_price = max(open_price, close_price) + daily_range
-        low_price = min(open_price, close_price) - daily_range
-        price_change = abs(close_price - open_price)
-        volume = base_volume * (1 + price_change / price_base) * (1 + np.random.normal(0, 0.2))
-
-        data.append({
-            'timestamp': date.isoformat(),
-            'open': round(open_price, 2),
-            'high': round(high_price, 2),
-            'low': round(low_price, 2),
-            'close': round(close_price, 2),
-            'volume': round(volume, 2)
-        })
-    return data
+async def get_price_history(days: int = 90, interval: str = '1d', symbol: Optional[str] = None):
+    if interval not in CANDLE_INTERVALS:
+        return {"error": f"Interval must be one of {list(CANDLE_INTERVALS)}"}
+    start_ts, end_ts = _interval_range(days, interval)
+    candles = await market_ws.state(symbol).tick_store.get_candles(interval, start_ts, end_ts, db=db)
+    timestamps = iso_timestamps(candles['ts'])
+    columns = [np.round(candles[field], 2).tolist() for field in ('open', 'high', 'low', 'close', 'volume')]
+    keys = ('timestamp', 'open', 'high', 'low', 'close', 'volume')
+    return [dict(zip(keys, row)) for row in zip(timestamps.tolist(), *columns)]
+
+# Largest page of trades or book snapshots one request may ask for
+RECENT_MAX_LIMIT = int(os.getenv('RECENT_MAX_LIMIT', '1000'))
+recent_requests = {'trades': 0, 'orderbook': 0}
+
+def _trade_rows(trades: np.ndarray) -> List[dict]:
+    """Trades newest first, `ts` in epoch milliseconds and `id` the exchange tradeId."""
+    trades = trades[::-1]
+    keys = ('ts', 'id', 'price', 'size', 'side')
+    sides = np.where(trades['side'] > 0, 'buy', 'sell')
+    return [dict(zip(keys, row)) for row in zip(np.round(trades['ts'] * 1000).astype(np.int64).tolist(),
+                                               trades['id'].tolist(), trades['price'].tolist(),
+                                               trades['size'].tolist(), sides.tolist())]
+
+async def _trade_page(symbol: Optional[str], before: Optional[int], limit: int, before_id: Optional[int] = None):
+    if not 1 <= limit <= RECENT_MAX_LIMIT:
+        return None, {"error": f"limit must be between 1 and {RECENT_MAX_LIMIT}"}
+    recent_requests['trades'] += 1
+    state = market_ws.state(symbol)
+    end_ts = before / 1000 if before is not None else time.time() + 1
+    return state, await state.tick_store.get_trades(end_ts, limit, db=db, end_id=before_id)
+
+@app.get("/api/trades/recent")
+async def get_recent_trades(symbol: Optional[str] = None, limit: int = 100):
+    """Latest trades, newest first; served from the trade ring buffer."""
+    state, trades = await _trade_page(symbol, None, limit)
+    if state is None:
+        return trades
+    return {'symbol': state.symbol, 'trades': _trade_rows(trades)}
+
+@app.get("/api/trades/history")
+async def get_trade_history(symbol: Optional[str] = None, before: Optional[int] = None,
+                            before_id: Optional[int] = None, limit: int = 100):
+    """
+    Trades before `before` (epoch ms, default now), newest first, a page at a time.
+
+    Pass the returned `next` and `next_id` as `before` and `before_id` for
+    the following page. The cursor is the oldest trade's (ts, tradeId), so
+    trades sharing its millisecond are split exactly between pages.
+    """
+    state, trades = await _trade_page(symbol, before, limit, before_id)
+    if state is None:
+        return trades
+    full = len(trades) == limit
+    return {
+        'symbol': state.symbol,
+        'trades': _trade_rows(trades),
+        'next': int(round(trades['ts'][0] * 1000)) if full else None,
+        'next_id': int(trades['id'][0]) if full else None
+    }
+
+@app.get("/api/orderbook")
+async def get_orderbook(symbol: Optional[str] = None, depth: int = 20):
+    """The live order book, from memory."""
+    book = market_ws.state(symbol).book
+    if not book.synced:
+        return {"error": "Order book not available"}
+    return dict(book.to_dict(max(1, depth)), symbol=book.symbol, ts=book.ts)
+
+@app.get("/api/orderbook/snapshots")
+async def get_orderbook_snapshots(symbol: Optional[str] = None, before: Optional[int] = None, limit: int = 100):
+    """Stored book snapshots before `before` (epoch ms, default now), newest first."""
+    if not 1 <= limit <= RECENT_MAX_LIMIT:
+        return {"error": f"limit must be between 1 and {RECENT_MAX_LIMIT}"}
+    recent_requests['orderbook'] += 1
+    symbol = market_ws.state(symbol).symbol
+    snapshots = await db.get_recent_orderbooks(limit, symbol, None if before is None else before / 1000)
+    return {
+        'symbol': symbol,
+        'snapshots': snapshots,
+        'next': snapshots[-1]['ts'] if len(snapshots) == limit else None
+    }
+
+def _archive_range(start: Optional[int], end: Optional[int]):
+    """Default to the last day; both bounds are epoch milliseconds."""
+    end = end if end is not None else int(time.time() * 1000)
+    start = start if start is not None else end - 86400 * 1000
+    return start, end
+
+@app.get("/api/archive/{dataset}")
+async def get_archive(dataset: str, symbol: Optional[str] = None, start: Optional[int] = None,
+                      end: Optional[int] = None, columns: Optional[List[str]] = Query(None)):
+    start_time = time.perf_counter()
+    start, end = _archive_range(start, end)
+    symbol = symbol or market_ws.default_symbol
+    try:
+        result = await asyncio.to_thread(archive.query, dataset, symbol, start, end, columns)
+    except ValueError as e:
+        return {"error": str(e)}
+    return {
+        'dataset': dataset,
+        'symbol': symbol,
+        'rows': len(result['ts']),
+        'columns': {name: col.tolist() for name, col in result.items()},
+        'latency': round((time.perf_counter() - start_time) * 1000, 3)
+    }
+
+@app.get("/api/archive/{dataset}/export")
+async def export_archive(dataset: str, symbol: Optional[str] = None, start: Optional[int] = None,
+                         end: Optional[int] = None, columns: Optional[List[str]] = Query(None)):
+    start, end = _archive_range(start, end)
+    try:
+        archive.columns(dataset, columns)
+    except ValueError as e:
+        return {"error": str(e)}
+    rows = archive.export(dataset, symbol or market_ws.default_symbol, start, end, columns)
+    return StreamingResponse(rows, media_type='application/x-ndjson')
 
 @app.get("/api/assets")
 async def get_assets():
     return {
-        'assets': ['BTC-USDT']
+        'assets': market_ws.instruments
     }
 
 if __name__ == "__main__":
-    uvicorn.run("app:app", host="0.0.0.0", port=5000, reload=True)
+    import uvicorn
+    workers = int(os.getenv('API_WORKERS', '1'))
+    uvicorn.run("app:app", host="0.0.0.0", port=5000, reload=workers == 1, workers=workers)
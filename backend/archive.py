@@ -0,0 +1,481 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+
+if TYPE_CHECKING:
+    # Imported where the compactor needs it, so the API does not load pandas at startup
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+DAY_MS = 86400 * 1000
+
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'archive')
+# Seconds documents stay in MongoDB before the compactor moves them to the archive
+ARCHIVE_AFTER = float(os.getenv('ARCHIVE_AFTER', '3600'))
+ARCHIVE_INTERVAL = float(os.getenv('ARCHIVE_INTERVAL', '300'))
+# Documents read from MongoDB per compaction batch
+ARCHIVE_BATCH = int(os.getenv('ARCHIVE_BATCH', '50000'))
+# Book levels kept per side; shallower books are padded with zero price and size
+ARCHIVE_BOOK_DEPTH = int(os.getenv('ARCHIVE_BOOK_DEPTH', '20'))
+
+SIDES = {'buy': 1, 'sell': -1}
+SIDE_NAMES = {1: 'buy', -1: 'sell'}
+
+# Columns of every dataset; 'ts' (epoch milliseconds) is always first and sorted within a part
+DATASETS = {
+    'trades': (('ts', 'i8'), ('price', 'f8'), ('size', 'f8'), ('side', 'i1')),
+    'ticks': (('ts', 'i8'), ('last', 'f8'), ('last_size', 'f8'), ('bid_px', 'f8'), ('bid_size', 'f8'),
+              ('ask_px', 'f8'), ('ask_size', 'f8')),
+    'books': (('ts', 'i8'), ('ask_px', 'f8'), ('ask_size', 'f8'), ('bid_px', 'f8'), ('bid_size', 'f8'))
+}
+# MongoDB collection compacted into each dataset
+COLLECTIONS = {'trades': 'trades', 'ticks': 'market_data', 'books': 'orderbook'}
+BOOK_COLUMNS = ('ask_px', 'ask_size', 'bid_px', 'bid_size')
+TICK_FIELDS = (('last', 'last'), ('last_size', 'lastSz'), ('bid_px', 'bidPx'), ('bid_size', 'bidSz'),
+               ('ask_px', 'askPx'), ('ask_size', 'askSz'))
+
+Columns = Dict[str, np.ndarray]
+# Written into merged parts: the names of the parts they were merged from
+SOURCES_FILE = 'sources.json'
+
+
+def _epoch_ms(timestamps: 'pd.Series') -> np.ndarray:
+    """Parse stored UTC timestamps (strings, or dates in time-series collections) into epoch milliseconds."""
+    import pandas as pd
+    strings = pd.api.types.is_string_dtype(timestamps)
+    parsed = pd.to_datetime(timestamps, format=TIMESTAMP_FORMAT if strings else None, utc=True)
+    return parsed.dt.as_unit('ms').astype('int64').to_numpy()
+
+
+def _day(ts_ms: int) -> str:
+    return datetime.fromtimestamp(ts_ms / 1000, timezone.utc).strftime('%Y-%m-%d')
+
+
+def trade_columns(docs: List[Dict]) -> 'pd.DataFrame':
+    import pandas as pd
+    frame = pd.DataFrame.from_records(docs, columns=['timestamp', 'symbol', 'price', 'size', 'side'])
+    return pd.DataFrame({
+        'symbol': frame['symbol'],
+        'ts': _epoch_ms(frame['timestamp']),
+        'price': pd.to_numeric(frame['price'], errors='coerce'),
+        'size': pd.to_numeric(frame['size'], errors='coerce'),
+        'side': frame['side'].map(SIDES).fillna(0).astype(np.int8)
+    }).dropna()
+
+
+def tick_columns(docs: List[Dict]) -> 'pd.DataFrame':
+    """
+    Ticker fields of `market_data` snapshots. The same collection also keeps a copy of every
+    trade frame; those are already archived from `trades` and are dropped here.
+    """
+    import pandas as pd
+    rows = []
+    for doc in docs:
+        message = doc.get('data') or {}
+        if (message.get('arg') or {}).get('channel') != 'tickers':
+            continue
+        for entry in message.get('data') or ():
+            rows.append((doc['symbol'], entry.get('ts'), *(entry.get(field) for _, field in TICK_FIELDS)))
+    frame = pd.DataFrame.from_records(rows, columns=['symbol', 'ts', *(name for name, _ in TICK_FIELDS)])
+    numeric = frame.columns.drop('symbol')
+    frame[numeric] = frame[numeric].apply(pd.to_numeric, errors='coerce')
+    return frame.dropna().astype({'ts': np.int64})
+
+
+def book_columns(docs: List[Dict], depth: int = ARCHIVE_BOOK_DEPTH) -> Tuple['pd.DataFrame', Columns]:
+    """
+    Timestamps and symbols of `orderbook` snapshots as a frame, with the levels as
+    (rows, depth) float arrays aligned to it.
+    """
+    import pandas as pd
+    frame = pd.DataFrame.from_records(docs, columns=['timestamp', 'symbol'])
+    frame = pd.DataFrame({'symbol': frame['symbol'], 'ts': _epoch_ms(frame['timestamp'])})
+    levels = {name: np.zeros((len(docs), depth)) for name in BOOK_COLUMNS}
+    for row, doc in enumerate(docs):
+        for side in ('asks', 'bids'):
+            entries = doc.get(side) or ()
+            if not entries:
+                continue
+            values = np.asarray(entries[:depth], dtype=np.float64)
+            levels[f'{side[:3]}_px'][row, :len(values)] = values[:, 0]
+            levels[f'{side[:3]}_size'][row, :len(values)] = values[:, 1]
+    return frame, levels
+
+
+class Part:
+    """
+    One immutable directory of column files covering [first, last] of a symbol's day.
+
+    Parts written by the compactor are named `{first}-{last}-{rows}`. Once a day
+    is complete its parts are merged into `day-{generation}-{first}-{last}-{rows}`,
+    which from then on is the only part readers use for that day. A merged
+    part lists the parts it was merged from in `sources.json`.
+    """
+    __slots__ = ('path', 'generation', 'first', 'last', 'rows')
+
+    def __init__(self, path: str, generation: Optional[int], first: int, last: int, rows: int):
+        self.path = path
+        self.generation = generation
+        self.first = first
+        self.last = last
+        self.rows = rows
+
+    @classmethod
+    def parse(cls, directory: str, name: str) -> Optional['Part']:
+        fields = name.split('-')
+        try:
+            if fields[0] == 'day' and len(fields) == 5:
+                return cls(os.path.join(directory, name), int(fields[1]), *map(int, fields[2:]))
+            if len(fields) == 3:
+                return cls(os.path.join(directory, name), None, *map(int, fields))
+        except ValueError:
+            pass
+        return None
+
+    @property
+    def merged(self) -> bool:
+        return self.generation is not None
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.path)
+
+    def sources(self) -> List[str]:
+        """Names of the parts a merged part was made from."""
+        try:
+            with open(os.path.join(self.path, SOURCES_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+
+    def column(self, name: str) -> np.ndarray:
+        # Memory-mapped, so only the pages of the requested rows are read
+        return np.load(os.path.join(self.path, f'{name}.npy'), mmap_mode='r')
+
+    def bounds(self, start: int, end: int) -> Tuple[int, int]:
+        """Row range with start <= ts < end."""
+        if start <= self.first and self.last < end:
+            return 0, self.rows
+        ts = self.column('ts')
+        return int(np.searchsorted(ts, start, 'left')), int(np.searchsorted(ts, end, 'left'))
+
+
+class ColumnarArchive:
+    """
+    Market data history stored as typed column files, partitioned by dataset, symbol and UTC day:
+
+        {root}/{dataset}/{symbol}/{YYYY-MM-DD}/{part}/{column}.npy
+
+    Parts are written to a temporary directory and renamed into place, and
+    are never modified afterwards, so readers in other processes need no
+    locking. Queries skip days and parts outside the requested range using
+    directory names only, then memory-map just the requested columns.
+    """
+
+    def __init__(self, root: str = ARCHIVE_DIR):
+        self.root = root
+
+    def _symbol_dir(self, dataset: str, symbol: str) -> str:
+        return os.path.join(self.root, dataset, symbol)
+
+    def symbols(self, dataset: str) -> List[str]:
+        directory = os.path.join(self.root, dataset)
+        return sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+
+    def days(self, dataset: str, symbol: str) -> List[str]:
+        directory = self._symbol_dir(dataset, symbol)
+        return sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+
+    def _day_dir(self, dataset: str, symbol: str, day: str) -> str:
+        return os.path.join(self._symbol_dir(dataset, symbol), day)
+
+    def _all_parts(self, dataset: str, symbol: str, day: str) -> List[Part]:
+        directory = self._day_dir(dataset, symbol, day)
+        if not os.path.isdir(directory):
+            return []
+        return [part for part in (Part.parse(directory, name) for name in os.listdir(directory)) if part]
+
+    def day_parts(self, dataset: str, symbol: str, day: str) -> Tuple[Optional[Part], List[Part]]:
+        """The newest merged part of a day, if any, and its unmerged parts in time order."""
+        parts = self._all_parts(dataset, symbol, day)
+        merged = [part for part in parts if part.merged]
+        unmerged = sorted((part for part in parts if not part.merged), key=lambda part: part.first)
+        return max(merged, key=lambda part: part.generation, default=None), unmerged
+
+    def parts(self, dataset: str, symbol: str, start: int, end: int) -> List[Part]:
+        """Parts that may hold rows with start <= ts < end, in time order."""
+        first_day, last_day = _day(start), _day(max(start, end - 1))
+        selected = []
+        for day in self.days(dataset, symbol):
+            if day < first_day or day > last_day:
+                continue
+            merged, unmerged = self.day_parts(dataset, symbol, day)
+            for part in ([merged] if merged else unmerged):
+                if part.first < end and part.last >= start:
+                    selected.append(part)
+        return selected
+
+    def write(self, dataset: str, symbol: str, columns: Columns, generation: Optional[int] = None,
+              sources: Optional[List[str]] = None) -> Optional[Part]:
+        """
+        Write one part; every row must fall on the same UTC day.
+
+        Args:
+            dataset: One of DATASETS
+            symbol: Instrument the rows belong to
+            columns: Arrays for every column of the dataset, 'ts' in epoch milliseconds
+            generation: Generation of a merged day part, None for a compactor part
+            sources: Names of the parts a merged part is made from
+
+        Returns:
+            The new part, or None if there were no rows
+        """
+        order = np.argsort(columns['ts'], kind='stable')
+        rows = len(order)
+        if rows == 0:
+            return None
+        ts = columns['ts'][order]
+        first, last = int(ts[0]), int(ts[-1])
+        directory = os.path.join(self._symbol_dir(dataset, symbol), _day(first))
+        name = f"{first}-{last}-{rows}" if generation is None else f"day-{generation:04d}-{first}-{last}-{rows}"
+        path = os.path.join(directory, name)
+        if os.path.isdir(path):
+            # Identical rows were already written by an earlier run that failed to delete them
+            return Part.parse(directory, name)
+
+        tmp = os.path.join(directory, f".{name}.{os.getpid()}.tmp")
+        os.makedirs(tmp, exist_ok=True)
+        for column, dtype in DATASETS[dataset]:
+            np.save(os.path.join(tmp, f'{column}.npy'), np.ascontiguousarray(columns[column][order], dtype=dtype))
+        if sources is not None:
+            with open(os.path.join(tmp, SOURCES_FILE), 'w') as f:
+                json.dump(sources, f)
+        os.rename(tmp, path)
+        return Part.parse(directory, name)
+
+    def merge_day(self, dataset: str, symbol: str, day: str) -> Optional[Part]:
+        """
+        Merge the unmerged parts of a complete day, and any earlier merged part, into a new merged part.
+
+        The new part is visible before the old ones are removed, and readers only
+        use the newest merged part of a day, so no query sees a row twice. Parts
+        the newest merged part already covers are left over from a merge that
+        stopped before removing them, and are removed instead of merged again.
+        """
+        merged, unmerged = self.day_parts(dataset, symbol, day)
+        if merged:
+            covered = set(merged.sources())
+            for part in self._all_parts(dataset, symbol, day):
+                if part.name in covered:
+                    shutil.rmtree(part.path, ignore_errors=True)
+            unmerged = [part for part in unmerged if part.name not in covered]
+        if not unmerged:
+            return None
+        sources = ([merged] if merged else []) + unmerged
+        columns = {column: np.concatenate([part.column(column) for part in sources])
+                   for column, _ in DATASETS[dataset]}
+        part = self.write(dataset, symbol, columns, generation=(merged.generation + 1) if merged else 0,
+                          sources=[source.name for source in sources])
+        for source in sources:
+            shutil.rmtree(source.path, ignore_errors=True)
+        return part
+
+    def query(self, dataset: str, symbol: str, start: int, end: int,
+              columns: Optional[List[str]] = None) -> Columns:
+        """
+        Rows of one symbol with start <= ts < end, as one array per column.
+
+        Args:
+            dataset: One of DATASETS
+            symbol: Instrument to read
+            start: Range start, epoch milliseconds
+            end: Range end, epoch milliseconds
+            columns: Columns to read; 'ts' is always included. Defaults to all columns
+
+        Returns:
+            Dict of column name to array, ordered by ts. Book level columns are (rows, depth)
+
+        Raises:
+            ValueError: For an unknown dataset or column
+        """
+        names = self.columns(dataset, columns)
+        for attempt in range(2):
+            try:
+                chunks = list(self._scan(dataset, symbol, start, end, names))
+                break
+            except FileNotFoundError:
+                # A part was merged away between listing and reading it
+                if attempt:
+                    raise
+        if not chunks:
+            return {name: np.zeros((0, ARCHIVE_BOOK_DEPTH) if name in BOOK_COLUMNS else 0, dtype=dtype)
+                    for name, dtype in DATASETS[dataset] if name in names}
+        result = {name: np.concatenate([chunk[name] for chunk in chunks]) for name in names}
+        ts = result['ts']
+        if len(chunks) > 1 and np.any(ts[1:] < ts[:-1]):
+            # Parts of late documents can overlap earlier ones until their day is merged
+            order = np.argsort(ts, kind='stable')
+            result = {name: col[order] for name, col in result.items()}
+        return result
+
+    def export(self, dataset: str, symbol: str, start: int, end: int,
+               columns: Optional[List[str]] = None, chunk_rows: int = 10000) -> Iterator[str]:
+        """
+        Stream rows as NDJSON, one object per row, holding at most `chunk_rows` rows in memory.
+
+        Trade sides are written as 'buy'/'sell'; book levels as 'asks' and 'bids'
+        lists of [price, size] without the padding.
+        """
+        names = self.columns(dataset, columns)
+        for part in self.parts(dataset, symbol, start, end):
+            lo, hi = part.bounds(start, end)
+            for offset in range(lo, hi, chunk_rows):
+                stop = min(offset + chunk_rows, hi)
+                chunk = {name: part.column(name)[offset:stop] for name in names}
+                yield ''.join(json.dumps(row) + '\n' for row in self._rows(dataset, chunk))
+
+    def columns(self, dataset: str, columns: Optional[List[str]] = None) -> List[str]:
+        if dataset not in DATASETS:
+            raise ValueError(f"Dataset must be one of {list(DATASETS)}")
+        available = [name for name, _ in DATASETS[dataset]]
+        if not columns:
+            return available
+        unknown = [name for name in columns if name not in available]
+        if unknown:
+            raise ValueError(f"Unknown columns for {dataset}: {unknown}; available: {available}")
+        return ['ts'] + [name for name in available[1:] if name in columns]
+
+    def _scan(self, dataset: str, symbol: str, start: int, end: int, names: List[str]) -> Iterator[Columns]:
+        for part in self.parts(dataset, symbol, start, end):
+            lo, hi = part.bounds(start, end)
+            if hi > lo:
+                yield {name: np.array(part.column(name)[lo:hi]) for name in names}
+
+    @staticmethod
+    def _rows(dataset: str, chunk: Columns) -> Iterator[Dict]:
+        lists = {name: col.tolist() for name, col in chunk.items()}
+        if dataset == 'trades' and 'side' in lists:
+            lists['side'] = [SIDE_NAMES.get(side) for side in lists['side']]
+        if dataset == 'books':
+            for side in ('ask', 'bid'):
+                if f'{side}_px' in lists and f'{side}_size' in lists:
+                    prices, sizes = lists.pop(f'{side}_px'), lists.pop(f'{side}_size')
+                    lists[f'{side}s'] = [[[px, sz] for px, sz in zip(p, s) if sz > 0] for p, s in zip(prices, sizes)]
+        keys = list(lists)
+        for values in zip(*lists.values()):
+            yield dict(zip(keys, values))
+
+
+class ArchiveCompactor:
+    """
+    Background task that moves documents older than `archive_after` seconds from MongoDB to the archive.
+
+    Each pass reads every aged collection in timestamp order, `batch` documents
+    at a time, writes one part per symbol and day, and only then deletes the
+    documents, so a crash can repeat a batch but never lose one. Days that are
+    entirely older than the cutoff then have their parts merged into one.
+    """
+
+    def __init__(self, database, archive: ColumnarArchive,
+                 archive_after: float = ARCHIVE_AFTER,
+                 interval: float = ARCHIVE_INTERVAL,
+                 batch: int = ARCHIVE_BATCH):
+        self.db = database
+        self.archive = archive
+        self.archive_after = archive_after
+        self.interval = interval
+        self.batch = batch
+        self.archived = {dataset: 0 for dataset in DATASETS}
+        self.removed = {dataset: 0 for dataset in DATASETS}
+        self.last_run_seconds = 0.0
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self):
+        while True:
+            try:
+                await self.compact()
+            except Exception as e:
+                logger.error(f"Archive compaction failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def compact(self, now: Optional[float] = None):
+        """Run one compaction pass over every dataset."""
+        started = time.perf_counter()
+        cutoff = (now or time.time()) - self.archive_after
+        loop = asyncio.get_running_loop()
+        for dataset in DATASETS:
+            while True:
+                docs = await self.db.find_before(COLLECTIONS[dataset], cutoff, self.batch)
+                if not docs:
+                    break
+                rows = await loop.run_in_executor(None, self._write_batch, dataset, docs)
+                await self.db.delete_ids(COLLECTIONS[dataset], [doc['_id'] for doc in docs])
+                self.archived[dataset] += rows
+                self.removed[dataset] += len(docs)
+                if len(docs) < self.batch:
+                    break
+            await loop.run_in_executor(None, self._merge_days, dataset, int(cutoff * 1000))
+        self.last_run_seconds = time.perf_counter() - started
+        logger.info(f"Archive compaction took {self.last_run_seconds:.2f}s, archived rows: {self.archived}")
+
+    def _write_batch(self, dataset: str, docs: List[Dict]) -> int:
+        levels = None
+        if dataset == 'trades':
+            frame = trade_columns(docs)
+        elif dataset == 'ticks':
+            frame = tick_columns(docs)
+        else:
+            frame, levels = book_columns(docs)
+        if frame.empty:
+            return 0
+
+        rows = 0
+        for (symbol, _), group in frame.groupby(['symbol', frame['ts'] // DAY_MS], sort=False):
+            index = group.index.to_numpy()
+            columns = {name: group[name].to_numpy() for name in group.columns if name != 'symbol'}
+            if levels is not None:
+                columns.update({name: values[index] for name, values in levels.items()})
+            self.archive.write(dataset, symbol, columns)
+            rows += len(group)
+        return rows
+
+    def _merge_days(self, dataset: str, cutoff_ms: int):
+        for symbol in self.archive.symbols(dataset):
+            for day in self.archive.days(dataset, symbol):
+                day_end = datetime.strptime(day, '%Y-%m-%d').replace(tzinfo=timezone.utc).timestamp() * 1000 + DAY_MS
+                if day_end <= cutoff_ms:
+                    self.archive.merge_day(dataset, symbol, day)
+
+    def gauges(self) -> List[tuple]:
+        return [
+            ('archive_rows_total', 'counter', 'Rows written to the columnar archive',
+             [({'dataset': dataset}, rows) for dataset, rows in self.archived.items()]),
+            ('archive_documents_removed_total', 'counter', 'MongoDB documents removed after archiving',
+             [({'dataset': dataset}, count) for dataset, count in self.removed.items()]),
+            ('archive_last_run_seconds', 'gauge', 'Duration of the last compaction pass',
+             [({}, round(self.last_run_seconds, 3))])
+        ]
+
+
+archive = ColumnarArchive()
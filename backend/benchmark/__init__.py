@@ -0,0 +1,3 @@
+"""
+This file makes the benchmark directory a proper Python package.
+"""
\ No newline at end of file
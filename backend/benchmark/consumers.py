@@ -0,0 +1,85 @@
+import asyncio
+import json
+import logging
+import re
+import time
+import aiohttp
+from datetime import datetime
+from typing import Dict, List, Optional
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+# Messages whose `timestamp` is the exchange event time, so fan-out latency can be measured;
+# only these are decoded, keeping the consumers cheap enough not to become the bottleneck
+TIMED_PREFIXES = ('{"type":"trade"', '{"type":"orderbook"')
+TIMESTAMP = re.compile(r'"timestamp":"([^"]+)"')
+
+
+class ConsumerSwarm:
+    """
+    N `/ws/market-data` clients that count messages and measure fan-out latency.
+
+    Latency is client receive time minus the exchange event time carried in
+    trade and order book messages, so with the synthetic exchange (which
+    stamps pushes at send time) it covers the whole ingest-to-client path.
+    """
+
+    def __init__(self, url: str, clients: int, symbols: Optional[List[str]] = None):
+        self.url = url
+        self.clients = clients
+        self.symbols = symbols
+        self.latency = Histogram()
+        self.received = 0
+        self.connected = 0
+        self.errors = 0
+        self._tasks: List[asyncio.Task] = []
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def _client(self, index: int):
+        try:
+            async with self._session.ws_connect(self.url, heartbeat=30) as ws:
+                self.connected += 1
+                if self.symbols:
+                    await ws.send_str(json.dumps({'op': 'subscribe', 'symbols': self.symbols}))
+                async for msg in ws:
+                    if msg.type != aiohttp.WSMsgType.TEXT:
+                        break
+                    now = time.time()
+                    self.received += 1
+                    if msg.data.startswith(TIMED_PREFIXES):
+                        match = TIMESTAMP.search(msg.data)
+                        if match:
+                            self.latency.record(now - datetime.fromisoformat(match.group(1)).timestamp())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Consumer {index} failed: {e}")
+        finally:
+            self.connected -= 1
+
+    async def start(self):
+        self._session = aiohttp.ClientSession()
+        self._tasks = [asyncio.create_task(self._client(i)) for i in range(self.clients)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._session:
+            await self._session.close()
+
+    def reset(self):
+        """Discard samples collected during warm-up."""
+        self.latency = Histogram()
+        self.received = 0
+
+    def report(self, elapsed: float) -> Dict:
+        return {
+            'clients': self.clients,
+            'errors': self.errors,
+            'messages': self.received,
+            'messages_per_sec': round(self.received / elapsed, 1) if elapsed > 0 else 0.0,
+            'fanout_latency': self.latency.summary()
+        }
@@ -0,0 +1,208 @@
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from aiohttp import web
+from typing import Dict, List, Set, Tuple
+from websocket.orderbook import OrderBook
+
+logger = logging.getLogger(__name__)
+
+BOOK_LEVELS = 50
+TICK_SIZE = 0.1
+# Book updates between full snapshots that re-center the book on the price
+SNAPSHOT_EVERY = 2000
+
+
+class SyntheticInstrument:
+    """Random-walk market for one instrument, producing OKX-shaped pushes."""
+
+    def __init__(self, symbol: str, price: float):
+        self.symbol = symbol
+        self.price = price
+        self.book = OrderBook(symbol)
+        self.seq_id = 0
+        self.updates = 0
+
+    def _px(self, price: float) -> str:
+        return f"{price:.1f}"
+
+    def _sz(self) -> str:
+        return f"{random.uniform(0.01, 5):.3f}"
+
+    def _step(self):
+        self.price = max(TICK_SIZE, self.price + random.gauss(0, 2) * TICK_SIZE)
+
+    def _envelope(self, channel: str, data: List[dict], action: str = None) -> dict:
+        message = {'arg': {'channel': channel, 'instId': self.symbol}, 'data': data}
+        if action:
+            message['action'] = action
+        return message
+
+    def book_snapshot(self, ts: str) -> dict:
+        mid = round(self.price / TICK_SIZE) * TICK_SIZE
+        asks = [[self._px(mid + (i + 1) * TICK_SIZE), self._sz(), '0', '1'] for i in range(BOOK_LEVELS)]
+        bids = [[self._px(mid - i * TICK_SIZE), self._sz(), '0', '1'] for i in range(BOOK_LEVELS)]
+        self.seq_id += 1
+        entry = {'asks': asks, 'bids': bids, 'ts': ts, 'seqId': self.seq_id, 'prevSeqId': -1}
+        self.book.apply('snapshot', entry)
+        entry['checksum'] = self.book.checksum()
+        self.updates = 0
+        return self._envelope('books', [entry], 'snapshot')
+
+    def book_update(self, ts: str) -> dict:
+        self.updates += 1
+        if self.updates >= SNAPSHOT_EVERY:
+            return self.book_snapshot(ts)
+        asks, bids = [], []
+        for _ in range(3):
+            side_levels, out = (self.book.asks, asks) if random.random() < 0.5 else (self.book.bids, bids)
+            levels = side_levels.raw_levels(BOOK_LEVELS)
+            if levels:
+                px, _ = random.choice(levels)
+                out.append([px, self._sz(), '0', '1'])
+        prev = self.seq_id
+        self.seq_id += 1
+        entry = {'asks': asks, 'bids': bids, 'ts': ts, 'seqId': self.seq_id, 'prevSeqId': prev}
+        self.book.apply('update', entry)
+        entry['checksum'] = self.book.checksum()
+        return self._envelope('books', [entry], 'update')
+
+    def trade(self, ts: str) -> dict:
+        self._step()
+        return self._envelope('trades', [{
+            'instId': self.symbol, 'tradeId': str(self.seq_id), 'px': self._px(self.price),
+            'sz': self._sz(), 'side': random.choice(('buy', 'sell')), 'ts': ts
+        }])
+
+    def ticker(self, ts: str) -> dict:
+        px = self._px(self.price)
+        return self._envelope('tickers', [{
+            'instType': 'SWAP', 'instId': self.symbol, 'last': px, 'lastSz': self._sz(),
+            'askPx': self._px(self.price + TICK_SIZE), 'askSz': self._sz(),
+            'bidPx': px, 'bidSz': self._sz(),
+            'open24h': self._px(self.price * 0.99), 'high24h': self._px(self.price * 1.02),
+            'low24h': self._px(self.price * 0.97), 'volCcy24h': '12345.6', 'vol24h': '1234567', 'ts': ts
+        }])
+
+
+class SyntheticExchange:
+    """
+    Local WebSocket server that speaks enough of the OKX public API for the ingest path.
+
+    Clients subscribe to `tickers`, `trades` and `books` for any instrument;
+    each connection then receives pushes at `rate` messages per second, split
+    across its subscriptions. Every push carries the send time as `ts`, so
+    consumers can measure exchange-to-client latency.
+    """
+
+    def __init__(self, rate: float = 1000, host: str = '127.0.0.1', port: int = 18443, start_price: float = 45000.0):
+        self.rate = rate
+        self.host = host
+        self.port = port
+        self.start_price = start_price
+        self.instruments: Dict[str, SyntheticInstrument] = {}
+        self.sent = 0
+        self.connections = 0
+        self._runner = None
+
+    def instrument(self, symbol: str) -> SyntheticInstrument:
+        if symbol not in self.instruments:
+            self.instruments[symbol] = SyntheticInstrument(symbol, self.start_price)
+        return self.instruments[symbol]
+
+    def _push(self, channel: str, instrument: SyntheticInstrument) -> dict:
+        ts = str(int(time.time() * 1000))
+        if channel == 'tickers':
+            return instrument.ticker(ts)
+        if channel == 'trades':
+            return instrument.trade(ts)
+        return instrument.book_update(ts)
+
+    async def _stream(self, ws: web.WebSocketResponse, subscriptions: Set[Tuple[str, str]]):
+        tick = 0.01
+        per_tick = self.rate * tick
+        budget = 0.0
+        next_time = time.perf_counter()
+        while not ws.closed:
+            next_time += tick
+            budget += per_tick
+            subs = list(subscriptions)
+            while budget >= 1 and subs:
+                channel, symbol = random.choice(subs)
+                await ws.send_str(json.dumps(self._push(channel, self.instrument(symbol))))
+                self.sent += 1
+                budget -= 1
+            await asyncio.sleep(max(0.0, next_time - time.perf_counter()))
+
+    async def handle(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        self.connections += 1
+        subscriptions: Set[Tuple[str, str]] = set()
+        streamer = asyncio.create_task(self._stream(ws, subscriptions))
+        try:
+            async for msg in ws:
+                if msg.type != web.WSMsgType.TEXT:
+                    continue
+                request_data = json.loads(msg.data)
+                op = request_data.get('op')
+                for arg in request_data.get('args', []):
+                    key = (arg.get('channel'), arg.get('instId'))
+                    if op == 'subscribe':
+                        subscriptions.add(key)
+                        await ws.send_str(json.dumps({'event': 'subscribe', 'arg': arg}))
+                        if key[0].startswith('books'):
+                            ts = str(int(time.time() * 1000))
+                            await ws.send_str(json.dumps(self.instrument(key[1]).book_snapshot(ts)))
+                    elif op == 'unsubscribe':
+                        subscriptions.discard(key)
+                        await ws.send_str(json.dumps({'event': 'unsubscribe', 'arg': arg}))
+        finally:
+            streamer.cancel()
+            self.connections -= 1
+        return ws
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({'sent': self.sent, 'connections': self.connections})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/ws/v5/public', self.handle)
+        app.router.add_get('/stats', self.stats)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Synthetic exchange on ws://{self.host}:{self.port}/ws/v5/public at {self.rate} msg/s")
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}/ws/v5/public"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local synthetic OKX WebSocket server")
+    parser.add_argument('--rate', type=float, default=1000, help="Messages per second per connection")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18443)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    async def serve():
+        exchange = SyntheticExchange(args.rate, args.host, args.port)
+        await exchange.start()
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
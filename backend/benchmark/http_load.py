@@ -0,0 +1,63 @@
+import asyncio
+import logging
+import time
+import aiohttp
+from typing import Dict, List, Optional, Tuple
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+# (name, path, JSON body) for each simulate endpoint under load
+DEFAULT_TARGETS: List[Tuple[str, str, dict]] = [
+    ('simulate', '/api/simulate',
+     {'asset': 'BTC-USDT-SWAP', 'quantity': 1000, 'volatility': 0.2, 'feeTier': 'VIP1'}),
+    ('simulate_batch', '/api/simulate/batch',
+     {'asset': 'BTC-USDT-SWAP', 'grid': {'quantity': {'start': 100, 'stop': 100000, 'num': 100},
+                                          'volatility': {'start': 0.01, 'stop': 0.5, 'num': 50},
+                                          'feeTier': ['VIP1', 'VIP3']}}),
+    ('simulate_execution', '/api/simulate/execution',
+     {'asset': 'BTC-USDT-SWAP', 'quantity': 100000, 'strategy': 'TWAP', 'paths': 10000,
+      'volatility': 0.5})
+]
+
+
+class HttpLoad:
+    """Closed-loop HTTP load: `concurrency` workers per target, each issuing requests back to back."""
+
+    def __init__(self, base_url: str, concurrency: int,
+                 targets: Optional[List[Tuple[str, str, dict]]] = None):
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.targets = targets or DEFAULT_TARGETS
+        self.latency: Dict[str, Histogram] = {name: Histogram() for name, _, _ in self.targets}
+        self.errors: Dict[str, int] = {name: 0 for name, _, _ in self.targets}
+
+    async def _worker(self, session: aiohttp.ClientSession, name: str, path: str, body: dict, deadline: float):
+        url = self.base_url + path
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                async with session.post(url, json=body) as response:
+                    payload = await response.json()
+                    if response.status != 200 or (isinstance(payload, dict) and 'error' in payload):
+                        self.errors[name] += 1
+            except Exception as e:
+                self.errors[name] += 1
+                logger.debug(f"{name} request failed: {e}")
+            self.latency[name].record(time.perf_counter() - start)
+
+    async def run(self, duration: float) -> Dict:
+        deadline = time.perf_counter() + duration
+        connector = aiohttp.TCPConnector(limit=self.concurrency * len(self.targets))
+        async with aiohttp.ClientSession(connector=connector) as session:
+            await asyncio.gather(*(
+                self._worker(session, name, path, body, deadline)
+                for name, path, body in self.targets
+                for _ in range(self.concurrency)
+            ))
+        return {
+            name: dict(self.latency[name].summary(),
+                       requests_per_sec=round(self.latency[name].count / duration, 1),
+                       errors=self.errors[name])
+            for name, _, _ in self.targets
+        }
@@ -0,0 +1,250 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import signal
+import subprocess
+import sys
+import time
+import aiohttp
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from benchmark.consumers import ConsumerSwarm
+from benchmark.http_load import HttpLoad
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=30)
+METRIC_LINE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[^}]*\})?\s+(\S+)$')
+
+# Result paths compared by --compare, and whether higher is better
+KEY_RESULTS: List[Tuple[str, bool]] = [
+    ('ingest.messages_per_sec', True),
+    ('fanout.messages_per_sec', True),
+    ('fanout.fanout_latency.p50_ms', False),
+    ('fanout.fanout_latency.p99_ms', False),
+    ('fanout.fanout_latency.p99.9_ms', False),
+    ('event_loop_lag.p99_ms', False),
+    ('event_loop_lag.max_ms', False),
+    ('memory.growth_kb', False),
+    ('http.simulate.requests_per_sec', True),
+    ('http.simulate.p99_ms', False),
+    ('http.simulate_batch.requests_per_sec', True),
+    ('http.simulate_execution.requests_per_sec', True)
+]
+
+
+def parse_metrics(text: str) -> Dict[str, float]:
+    """Parse Prometheus text into {'name{labels}': value}."""
+    samples = {}
+    for line in text.splitlines():
+        match = METRIC_LINE.match(line)
+        if match:
+            samples[match.group(1) + (match.group(2) or '')] = float(match.group(3))
+    return samples
+
+
+def metric_sum(samples: Dict[str, float], name: str) -> float:
+    return sum(value for key, value in samples.items() if key == name or key.startswith(name + '{'))
+
+
+def rss_kb(pid: int) -> Optional[int]:
+    """Resident set size of a process from /proc (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=BACKEND_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def lookup(results: Dict, path: str) -> Optional[float]:
+    # Keys such as 'p99.9_ms' contain dots, so match the longest key at each level
+    node = results
+    while path:
+        if not isinstance(node, dict):
+            return None
+        key = next((k for k in sorted(node, key=len, reverse=True) if path == k or path.startswith(k + '.')), None)
+        if key is None:
+            return None
+        node = node[key]
+        path = path[len(key) + 1:]
+    return node if isinstance(node, (int, float)) else None
+
+
+def compare(current: Dict, baseline: Dict) -> List[Dict]:
+    rows = []
+    for path, higher_is_better in KEY_RESULTS:
+        new, old = lookup(current, path), lookup(baseline, path)
+        if new is None or old is None:
+            continue
+        change = (new - old) / old * 100 if old else 0.0
+        regressed = change < 0 if higher_is_better else change > 0
+        rows.append({'metric': path, 'baseline': old, 'current': new,
+                     'change_pct': round(change, 2), 'regressed': regressed})
+    return rows
+
+
+async def wait_for_server(url: str, path: str, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with _session() as session:
+        while time.monotonic() < deadline:
+            # A server that failed to start (e.g. port in use) must not be mistaken for another one
+            if process.poll() is not None:
+                raise RuntimeError(f"Server for {url} exited with code {process.returncode}")
+            try:
+                async with session.get(url + path) as response:
+                    if response.status == 200:
+                        return
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError(f"Server at {url} did not become healthy within {timeout}s")
+
+
+def _session() -> aiohttp.ClientSession:
+    # No keep-alive: a connection idle for the whole run may have been closed by the server
+    return aiohttp.ClientSession(timeout=REQUEST_TIMEOUT, connector=aiohttp.TCPConnector(force_close=True))
+
+
+async def scrape(url: str) -> Dict[str, float]:
+    async with _session() as session:
+        async with session.get(url + '/metrics') as response:
+            return parse_metrics(await response.text())
+
+
+async def exchange_sent(url: str) -> int:
+    async with _session() as session:
+        async with session.get(url + '/stats') as response:
+            return (await response.json())['sent']
+
+
+def spawn(args: List[str], env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    # Own process group, so worker processes (e.g. the execution pool) are cleaned up too
+    return subprocess.Popen([sys.executable, '-m'] + args, cwd=BACKEND_DIR, env=env, start_new_session=True)
+
+
+def terminate(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        pass
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.wait()
+
+
+async def run_benchmark(args) -> Dict:
+    # The exchange and the API run in their own processes, so the load generators
+    # in this one do not compete with either for the event loop
+    exchange_url = f"http://127.0.0.1:{args.exchange_port}"
+    exchange = spawn(['benchmark.exchange_server', '--rate', str(args.rate), '--port', str(args.exchange_port)])
+    env = dict(os.environ, OKX_WS_URL=f"ws://127.0.0.1:{args.exchange_port}/ws/v5/public",
+               INSTRUMENTS=args.instruments)
+    api_url = f"http://127.0.0.1:{args.api_port}"
+    server = spawn(['uvicorn', 'app:app', '--host', '127.0.0.1', '--port', str(args.api_port),
+                    '--log-level', 'warning'], env)
+    swarm = ConsumerSwarm(api_url.replace('http', 'ws') + '/ws/market-data', args.clients)
+    try:
+        await wait_for_server(exchange_url, '/stats', exchange)
+        await wait_for_server(api_url, '/health', server)
+        await swarm.start()
+        await asyncio.sleep(args.warmup)
+        swarm.reset()
+
+        memory: List[int] = []
+        before = await scrape(api_url)
+        sent_before = await exchange_sent(exchange_url)
+        start = time.perf_counter()
+
+        async def sample_memory():
+            while True:
+                rss = rss_kb(server.pid)
+                if rss is not None:
+                    memory.append(rss)
+                await asyncio.sleep(1)
+
+        sampler = asyncio.create_task(sample_memory())
+        http_results = await HttpLoad(api_url, args.http_concurrency).run(args.duration) \
+            if args.http_concurrency > 0 else await asyncio.sleep(args.duration, result={})
+        elapsed = time.perf_counter() - start
+        sampler.cancel()
+        after = await scrape(api_url)
+        sent = await exchange_sent(exchange_url) - sent_before
+
+        processed = metric_sum(after, 'trade_simulator_symbol_messages_total') - \
+            metric_sum(before, 'trade_simulator_symbol_messages_total')
+        lag = {
+            'p50_ms': after.get('trade_simulator_stage_latency_seconds{quantile="0.5",stage="event_loop_lag"}', 0) * 1000,
+            'p99_ms': after.get('trade_simulator_stage_latency_seconds{quantile="0.99",stage="event_loop_lag"}', 0) * 1000,
+            'max_ms': after.get('trade_simulator_stage_latency_seconds_max{stage="event_loop_lag"}', 0) * 1000
+        }
+        return {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            'config': {
+                'rate': args.rate, 'instruments': args.instruments, 'clients': args.clients,
+                'http_concurrency': args.http_concurrency, 'duration': args.duration, 'warmup': args.warmup
+            },
+            'ingest': {
+                'sent': sent,
+                'processed': int(processed),
+                'messages_per_sec': round(processed / elapsed, 1)
+            },
+            'fanout': swarm.report(elapsed),
+            'event_loop_lag': {name: round(value, 4) for name, value in lag.items()},
+            'memory': {
+                'start_kb': memory[0] if memory else None,
+                'end_kb': memory[-1] if memory else None,
+                'peak_kb': max(memory) if memory else None,
+                'growth_kb': memory[-1] - memory[0] if memory else None
+            },
+            'http': http_results
+        }
+    finally:
+        await swarm.stop()
+        terminate(server)
+        terminate(exchange)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the ingest pipeline and simulate endpoints")
+    parser.add_argument('--rate', type=float, default=2000, help="Synthetic exchange messages/sec per connection")
+    parser.add_argument('--instruments', default='BTC-USDT-SWAP', help="Comma separated INSTRUMENTS for the API")
+    parser.add_argument('--clients', type=int, default=50, help="Number of /ws/market-data consumers")
+    parser.add_argument('--http-concurrency', type=int, default=4, help="Concurrent requests per simulate endpoint")
+    parser.add_argument('--duration', type=float, default=30, help="Measured run length in seconds")
+    parser.add_argument('--warmup', type=float, default=5, help="Seconds to run before measuring")
+    parser.add_argument('--api-port', type=int, default=18000)
+    parser.add_argument('--exchange-port', type=int, default=18443)
+    parser.add_argument('--output', default='benchmark-results.json', help="Where to write the results JSON")
+    parser.add_argument('--compare', help="Results JSON of a previous run to compare against")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    results = asyncio.run(run_benchmark(args))
+    if args.compare:
+        with open(args.compare) as f:
+            results['comparison'] = compare(results, json.load(f))
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import asyncio
+import inspect
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+def quantize(value: float, digits: int = 6) -> float:
+    """Round to `digits` significant figures, so nearly equal inputs share a cache entry."""
+    if value == 0 or not math.isfinite(value):
+        return value
+    return round(value, digits - 1 - int(math.floor(math.log10(abs(value)))))
+
+
+class CacheEntry:
+    __slots__ = ('version', 'expires', 'value')
+
+    def __init__(self, version: Hashable, expires: float, value: Any):
+        self.version = version
+        self.expires = expires
+        self.value = value
+
+
+class ResultCache:
+    """
+    LRU cache of computed results, tagged with the version of the state they were computed from.
+
+    An entry is served only while its version matches the caller's current
+    version and its TTL has not expired; otherwise it is dropped and
+    recomputed. Concurrent misses for the same key and version share a
+    single computation. Everything runs on the event loop, so no locking
+    is needed.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 2.0):
+        """
+        Args:
+            max_entries: Entries kept before the least recently used is evicted
+            ttl: Seconds an entry may be served, even if its version is still current
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: 'OrderedDict[Hashable, CacheEntry]' = OrderedDict()
+        self._inflight: Dict[Tuple[Hashable, Hashable], asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, key: Hashable, version: Hashable) -> Tuple[bool, Any]:
+        """Return (found, value) for a current entry, dropping it if it is stale."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        if entry.version != version or entry.expires <= time.monotonic():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, entry.value
+
+    def put(self, key: Hashable, version: Hashable, value: Any):
+        self._entries[key] = CacheEntry(version, time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get(self, key: Hashable, version: Hashable, compute: Callable[[], Any]) -> Any:
+        """
+        Return the cached result for `key` at `version`, computing it on a miss.
+
+        Args:
+            key: Hashable request key
+            version: Version of the state the result depends on
+            compute: Callable returning the result, or an awaitable of it
+
+        Returns:
+            The cached or freshly computed result; callers must not mutate it
+        """
+        found, value = self.lookup(key, version)
+        if found:
+            self.hits += 1
+            return value
+
+        flight = (key, version)
+        future = self._inflight.get(flight)
+        if future is not None:
+            # An identical request is already computing this result
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[flight] = future
+        try:
+            value = compute()
+            if inspect.isawaitable(value):
+                value = await value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark it retrieved, in case no other request was waiting
+            future.exception()
+            raise
+        finally:
+            del self._inflight[flight]
+        future.set_result(value)
+        self.put(key, version, value)
+        return value
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'evictions': self.evictions
+        }
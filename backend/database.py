@@ -1,78 +1,414 @@
+from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorClient
-from datetime import datetime
+from collections import deque
+from datetime import datetime, timezone
+import asyncio
 import os
 import logging
+import numpy as np
+from typing import Deque, Dict, List
+from write_behind import WriteBehindBuffer
+from tick_store import CANDLE_DTYPE, TRADE_DTYPE
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+# Create missing trades, books and raw market data collections as time-series collections, with native
+# dates and numbers. Existing collections keep their layout; each collection is written in the format it has
+MONGO_TIMESERIES = os.getenv('MONGO_TIMESERIES') == '1'
+# Seconds start-up waits for collection and index setup before going on without it
+MONGO_SETUP_TIMEOUT = float(os.getenv('MONGO_SETUP_TIMEOUT', '10'))
+# Book snapshots per symbol kept in memory in front of the orderbook collection
+RECENT_BOOKS = int(os.getenv('RECENT_BOOKS', '1000'))
+COLLECTIONS = ('trades', 'orderbook', 'market_data')
 
 logger = logging.getLogger(__name__)
 
 class Database:
-    def __init__(self):
+    def __init__(self, timeseries: bool = MONGO_TIMESERIES):
         self.client = None
         self.db = None
+        self.timeseries = timeseries
+        # Collection -> whether it is a time-series collection storing native dates and numbers.
+        # Known once setup has listed the collections; until then documents are written as strings
+        self.native = {name: False for name in COLLECTIONS}
+        self.writer = WriteBehindBuffer(self)
+        # Symbol -> latest book snapshots queued here or, in API workers, seen on the shared feed; oldest first
+        self.recent_books: Dict[str, Deque[Dict]] = {}
+        # Recent-data reads that missed memory and went to MongoDB, per collection
+        self.reads = {'trades': 0, 'orderbook': 0}
 
     async def connect(self):
         try:
             self.client = AsyncIOMotorClient(os.getenv('MONGO_URI', 'mongodb://localhost:27017'))
             self.db = self.client.trade_simulator
             logger.info("Connected to MongoDB")
+            await self.writer.start()
         except Exception as e:
             logger.error(f"Failed to connect to MongoDB: {e}")
             raise
+        try:
+            await asyncio.wait_for(self.setup_collections(), MONGO_SETUP_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"MongoDB collection setup did not complete: {e!r}")
+
+    async def setup_collections(self):
+        """
+        Create the time-series collections (with MONGO_TIMESERIES) and the indexes reads rely on.
+
+        Every collection gets a (symbol, timestamp) index for per-symbol
+        range and recent reads, and a timestamp index for the archive
+        compactor's scans of aged documents. Existing collections and
+        indexes are left as they are, and the document format of each
+        collection follows its actual type rather than the flag.
+        """
+        existing = {info['name']: info.get('options', {}) async for info in await self.db.list_collections()}
+        for name in COLLECTIONS:
+            if name not in existing:
+                if self.timeseries:
+                    await self.db.create_collection(name, timeseries={
+                        'timeField': 'timestamp', 'metaField': 'symbol', 'granularity': 'seconds'
+                    })
+                self.native[name] = self.timeseries
+            else:
+                self.native[name] = 'timeseries' in existing[name]
+                if self.timeseries and not self.native[name]:
+                    logger.warning(f"MONGO_TIMESERIES is set but {name} exists as a standard collection; "
+                                   "it keeps string timestamps and numbers")
+            await self.db[name].create_index([('symbol', 1), ('timestamp', -1)])
+            await self.db[name].create_index([('timestamp', 1)])
+        await self.db.trades.create_index([('symbol', 1), ('ts', -1), ('tradeId', -1)])
+        layout = ', '.join(f"{name}: {'time-series' if self.native[name] else 'standard'}" for name in COLLECTIONS)
+        logger.info(f"MongoDB collections ready ({layout})")
+
+    async def convert_local_timestamps(self, timezone_name: str, stored_before: datetime) -> Dict[str, int]:
+        """
+        One-off conversion of timestamps written in server local time to UTC.
+
+        Earlier versions formatted the server's local time with a 'Z'
+        suffix; current ones write UTC. Documents inserted before
+        `stored_before`, told apart by the creation time in their ObjectId,
+        are re-read as local time in `timezone_name` (DST aware) and
+        rewritten as UTC. Only string timestamps are touched, so run it
+        once: a second run would shift the same documents again.
+
+        Args:
+            timezone_name: IANA time zone the old server ran in, e.g. 'Asia/Kolkata'
+            stored_before: When the upgraded version first wrote, timezone-aware
+
+        Returns:
+            Documents converted per collection
+        """
+        local = {'$dateFromString': {'dateString': {'$substrBytes': ['$timestamp', 0, 19]},
+                                     'format': '%Y-%m-%dT%H:%M:%S', 'timezone': timezone_name}}
+        pipeline = [{'$set': {'timestamp': {'$dateToString': {'date': local, 'format': '%Y-%m-%dT%H:%M:%SZ'}}}}]
+        query = {'_id': {'$lt': ObjectId.from_datetime(stored_before)}, 'timestamp': {'$type': 'string'}}
+        converted = {}
+        for name in COLLECTIONS:
+            result = await self.db[name].update_many(query, pipeline)
+            converted[name] = result.modified_count
+        return converted
+
+    async def flush(self):
+        """Persist every document still queued in the write-behind buffer."""
+        await self.writer.flush()
 
     async def close(self):
+        await self.writer.stop()
         if self.client:
             self.client.close()
             logger.info("Closed MongoDB connection")
 
-    async def store_market_data(self, data):
+    async def insert_many(self, collection, docs):
+        """Insert a batch of documents into a collection."""
+        if self.native.get(collection):
+            # Documents spilled as plain JSON by earlier versions carry their dates as strings
+            for doc in docs:
+                if isinstance(doc['timestamp'], str):
+                    doc['timestamp'] = datetime.fromisoformat(doc['timestamp'])
+        await self.db[collection].insert_many(docs, ordered=False)
+
+    def _timestamp(self, ts, collection):
+        """Stored form of an epoch-seconds time in a collection: a date in time-series collections, else a string."""
+        moment = datetime.fromtimestamp(ts, timezone.utc)
+        return moment if self.native.get(collection) else moment.strftime(TIMESTAMP_FORMAT)
+
+    def _number(self, value, collection):
+        return float(value) if self.native.get(collection) else str(float(value))
+
+    @staticmethod
+    def _epoch(timestamp) -> float:
+        """Epoch seconds of a stored timestamp; dates come back from MongoDB as naive UTC."""
+        if isinstance(timestamp, str):
+            timestamp = datetime.strptime(timestamp, TIMESTAMP_FORMAT)
+        return timestamp.replace(tzinfo=timezone.utc).timestamp()
+
+    def format_market_data(self, data, symbol='BTC-USDT-SWAP'):
+        return {
+            'timestamp': self._timestamp(datetime.now(timezone.utc).timestamp(), 'market_data'),
+            'exchange': 'OKX',
+            'symbol': symbol,
+            'data': data
+        }
+
+    def format_trade(self, trade_data, symbol='BTC-USDT-SWAP'):
+        return {
+            'timestamp': self._timestamp(int(trade_data['ts']) / 1000, 'trades'),
+            'exchange': 'OKX',
+            'symbol': symbol,
+            'price': self._number(trade_data['px'], 'trades'),
+            'size': self._number(trade_data['sz'], 'trades'),
+            'side': trade_data['side'],
+            # Epoch milliseconds and exchange trade id: the (ts, tradeId) order trade history pages by
+            'ts': int(trade_data['ts']),
+            'tradeId': int(trade_data.get('tradeId') or 0)
+        }
+
+    def format_orderbook(self, orderbook_data, symbol='BTC-USDT-SWAP', ts=None):
+        ts = int(datetime.now(timezone.utc).timestamp() * 1000) if ts is None else int(ts)
+        return {
+            'timestamp': self._timestamp(ts / 1000, 'orderbook'),
+            'exchange': 'OKX',
+            'symbol': symbol,
+            'asks': [[self._number(price, 'orderbook'), self._number(size, 'orderbook')]
+                     for price, size in orderbook_data.get('asks', [])],
+            'bids': [[self._number(price, 'orderbook'), self._number(size, 'orderbook')]
+                     for price, size in orderbook_data.get('bids', [])],
+            # Epoch milliseconds of the exchange update; string timestamps only keep whole seconds
+            'ts': ts
+        }
+
+    def _book_entry(self, doc) -> Dict:
+        """Response form of a stored book snapshot: epoch milliseconds and [price, size] floats."""
+        return {
+            # Snapshots stored before the `ts` field existed only have the timestamp
+            'ts': int(doc['ts']) if 'ts' in doc else int(self._epoch(doc['timestamp']) * 1000),
+            'asks': [[float(price), float(size)] for price, size in doc.get('asks', [])],
+            'bids': [[float(price), float(size)] for price, size in doc.get('bids', [])]
+        }
+
+    async def queue_market_data(self, data, symbol='BTC-USDT-SWAP'):
+        """Queue a market data snapshot for batched persistence."""
+        try:
+            await self.writer.put('market_data', self.format_market_data(data, symbol))
+        except Exception as e:
+            logger.error(f"Failed to queue market data: {e}")
+
+    async def queue_trade(self, trade_data, symbol='BTC-USDT-SWAP'):
+        """Queue a trade for batched persistence."""
+        try:
+            await self.writer.put('trades', self.format_trade(trade_data, symbol))
+        except Exception as e:
+            logger.error(f"Failed to queue trade: {e}")
+
+    async def queue_trades(self, trades, symbol='BTC-USDT-SWAP'):
+        """Queue every trade of one exchange push for batched persistence."""
+        for trade_data in trades:
+            await self.queue_trade(trade_data, symbol)
+
+    def cache_orderbook(self, orderbook_data, symbol='BTC-USDT-SWAP', ts=None):
+        """
+        Keep a book snapshot in the recent book cache without persisting it.
+
+        API workers call this for every snapshot the ingest process stores
+        that they see on the shared feed, so their snapshot reads are served
+        from memory like the ingest process's own. `ts` is the exchange time
+        of the update in epoch milliseconds, the same one the ingest process
+        stores the snapshot under.
+        """
+        self._cache_book(symbol, self._book_entry(self.format_orderbook(orderbook_data, symbol, ts)))
+
+    def _cache_book(self, symbol, entry):
+        recent = self.recent_books.get(symbol)
+        if recent is None:
+            recent = self.recent_books[symbol] = deque(maxlen=RECENT_BOOKS)
+        recent.append(entry)
+
+    async def queue_orderbook(self, orderbook_data, symbol='BTC-USDT-SWAP', ts=None):
+        """Queue an orderbook snapshot for batched persistence, keeping it in the recent book cache."""
+        try:
+            doc = self.format_orderbook(orderbook_data, symbol, ts)
+            # Cached before the insert adds an _id to the document
+            self._cache_book(symbol, self._book_entry(doc))
+            await self.writer.put('orderbook', doc)
+        except Exception as e:
+            logger.error(f"Failed to queue orderbook: {e}")
+
+    async def store_market_data(self, data, symbol='BTC-USDT-SWAP'):
         """Store market data snapshot."""
         try:
-            formatted_data = {
-                'timestamp': datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ"),
-                'exchange': 'OKX',
-                'symbol': 'BTC-USDT-SWAP',
-                'data': data
-            }
-            await self.db.market_data.insert_one(formatted_data)
+            await self.db.market_data.insert_one(self.format_market_data(data, symbol))
         except Exception as e:
             logger.error(f"Failed to store market data: {e}")
 
-    async def store_trade(self, trade_data):
+    async def store_trade(self, trade_data, symbol='BTC-USDT-SWAP'):
         """Store trade data."""
         try:
-            formatted_trade = {
-                'timestamp': datetime.fromtimestamp(int(trade_data['ts']) / 1000).strftime("%Y-%m-%dT%H:%M:%SZ"),
-                'exchange': 'OKX',
-                'symbol': 'BTC-USDT-SWAP',
-                'price': str(float(trade_data['px'])),  # Convert to string format
-                'size': str(float(trade_data['sz'])),   # Convert to string format
-                'side': trade_data['side']
-            }
-            await self.db.trades.insert_one(formatted_trade)
+            await self.db.trades.insert_one(self.format_trade(trade_data, symbol))
         except Exception as e:
             logger.error(f"Failed to store trade: {e}")
 
-    async def get_recent_trades(self, limit=100):
-        """Get recent trades."""
+    async def get_recent_trades(self, limit=100, symbol=None):
+        """Get recent trades, optionally for a single symbol."""
         try:
-            cursor = self.db.trades.find().sort('timestamp', -1).limit(limit)
+            query = {'symbol': symbol} if symbol else {}
+            cursor = self.db.trades.find(query).sort('timestamp', -1).limit(limit)
             return await cursor.to_list(length=limit)
         except Exception as e:
             logger.error(f"Failed to get recent trades: {e}")
             return []
 
-    async def store_orderbook(self, orderbook_data):
+    async def find_trades(self, before_ts, limit, symbol='BTC-USDT-SWAP', before_id=None):
+        """
+        Newest stored trades of a symbol before a cutoff, by (ts, tradeId).
+
+        Only trades stored with their millisecond `ts` and `tradeId` are
+        read, so a cutoff inside a millisecond splits it exactly.
+
+        Args:
+            before_ts: Cutoff, epoch seconds
+            limit: Maximum number of trades
+            symbol: Instrument to read
+            before_id: With before_id, trades at before_ts with a lower tradeId are included
+
+        Returns:
+            Structured array with tick_store.TRADE_DTYPE fields, in time order
+        """
+        if self.db is None or limit <= 0:
+            return np.zeros(0, dtype=TRADE_DTYPE)
+        self.reads['trades'] += 1
+        try:
+            before_ms = int(round(before_ts * 1000))
+            query = {'symbol': symbol, 'ts': {'$lt': before_ms}}
+            if before_id is not None:
+                query = {'symbol': symbol, '$or': [{'ts': {'$lt': before_ms}},
+                                                   {'ts': before_ms, 'tradeId': {'$lt': before_id}}]}
+            projection = {'_id': 0, 'ts': 1, 'tradeId': 1, 'price': 1, 'size': 1, 'side': 1}
+            cursor = self.db.trades.find(query, projection).sort([('ts', -1), ('tradeId', -1)]).limit(limit)
+            docs = await cursor.to_list(length=limit)
+            return np.array([(doc['ts'] / 1000, float(doc['price']), float(doc['size']),
+                              1 if doc['side'] == 'buy' else -1, doc['tradeId']) for doc in reversed(docs)],
+                            dtype=TRADE_DTYPE)
+        except Exception as e:
+            logger.error(f"Failed to read trades: {e}")
+            return np.zeros(0, dtype=TRADE_DTYPE)
+
+    async def get_recent_orderbooks(self, limit=100, symbol='BTC-USDT-SWAP', before_ts=None) -> List[Dict]:
+        """
+        Latest book snapshots of a symbol, newest first, read through the in-memory cache.
+
+        Snapshots queued by this process, or seen on the shared feed in an
+        API worker, are served from memory; MongoDB is only read when the
+        cache holds fewer than `limit` snapshots before the cutoff, for the
+        older remainder.
+
+        Args:
+            limit: Maximum number of snapshots
+            symbol: Instrument to read
+            before_ts: Only snapshots before this time, epoch seconds
+
+        Returns:
+            Snapshots as {'ts': epoch ms, 'asks': [[price, size]], 'bids': [[price, size]]}
+        """
+        before_ms = None if before_ts is None else before_ts * 1000
+        cached = [entry for entry in reversed(self.recent_books.get(symbol, ()))
+                  if before_ms is None or entry['ts'] < before_ms][:limit]
+        if len(cached) == limit or self.db is None:
+            return cached
+        cutoff_ms = cached[-1]['ts'] if cached else before_ms
+        query = {'symbol': symbol}
+        if cutoff_ms is not None:
+            # String timestamps are whole seconds, so the cutoff's own second is
+            # read too and split by the millisecond `ts`
+            cutoff = self._timestamp(cutoff_ms / 1000, 'orderbook')
+            query['timestamp'] = {'$lte': cutoff}
+            query['$or'] = [{'ts': {'$lt': cutoff_ms}}, {'ts': {'$exists': False}, 'timestamp': {'$lt': cutoff}}]
+        self.reads['orderbook'] += 1
+        try:
+            cursor = self.db.orderbook.find(query, {'_id': 0}).sort([('timestamp', -1), ('ts', -1)]).limit(
+                limit - len(cached))
+            return cached + [self._book_entry(doc) for doc in await cursor.to_list(length=limit - len(cached))]
+        except Exception as e:
+            logger.error(f"Failed to read order book snapshots: {e}")
+            return cached
+
+    async def find_before(self, collection, before_ts, limit):
+        """
+        Oldest documents of a collection stored before a cutoff, in timestamp order.
+
+        Args:
+            collection: Collection to read
+            before_ts: Cutoff, epoch seconds
+            limit: Maximum number of documents
+
+        Returns:
+            List of documents, empty if there are none or the read failed
+        """
+        if self.db is None:
+            return []
+        try:
+            cutoff = self._timestamp(before_ts, collection)
+            cursor = self.db[collection].find({'timestamp': {'$lt': cutoff}}).sort('timestamp', 1).limit(limit)
+            return await cursor.to_list(length=limit)
+        except Exception as e:
+            logger.error(f"Failed to read aged documents from {collection}: {e}")
+            return []
+
+    async def delete_ids(self, collection, ids):
+        """Delete documents by _id."""
+        await self.db[collection].delete_many({'_id': {'$in': ids}})
+
+    async def aggregate_candles(self, start_ts, end_ts, interval, symbol='BTC-USDT-SWAP'):
+        """
+        Build OHLCV candles from stored trades with a server-side aggregation.
+
+        Args:
+            start_ts: Range start, epoch seconds
+            end_ts: Range end, epoch seconds
+            interval: Candle length in seconds
+            symbol: Instrument to aggregate
+
+        Returns:
+            Structured array with tick_store.CANDLE_DTYPE fields
+        """
+        if self.db is None:
+            return np.zeros(0, dtype=CANDLE_DTYPE)
+        bucket_ms = int(interval * 1000)
+        pipeline = [
+            {'$match': {
+                'symbol': symbol,
+                'timestamp': {
+                    '$gte': self._timestamp(start_ts, 'trades'),
+                    '$lt': self._timestamp(end_ts, 'trades')
+                }
+            }},
+            {'$project': {
+                't': {'$toLong': '$timestamp' if self.native['trades'] else {'$dateFromString': {'dateString': '$timestamp'}}},
+                'price': {'$toDouble': '$price'},
+                'size': {'$toDouble': '$size'}
+            }},
+            {'$sort': {'t': 1}},
+            {'$group': {
+                '_id': {'$subtract': ['$t', {'$mod': ['$t', bucket_ms]}]},
+                'open': {'$first': '$price'},
+                'high': {'$max': '$price'},
+                'low': {'$min': '$price'},
+                'close': {'$last': '$price'},
+                'volume': {'$sum': '$size'}
+            }},
+            {'$sort': {'_id': 1}}
+        ]
+        try:
+            rows = await self.db.trades.aggregate(pipeline, allowDiskUse=True).to_list(length=None)
+            return np.array([(row['_id'] / 1000, row['open'], row['high'], row['low'], row['close'], row['volume'])
+                             for row in rows], dtype=CANDLE_DTYPE)
+        except Exception as e:
+            logger.error(f"Failed to aggregate candles: {e}")
+            return np.zeros(0, dtype=CANDLE_DTYPE)
+
+    async def store_orderbook(self, orderbook_data, symbol='BTC-USDT-SWAP'):
         """Store orderbook snapshot."""
         try:
-            formatted_orderbook = {
-                'timestamp': datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ"),
-                'exchange': 'OKX',
-                'symbol': 'BTC-USDT-SWAP',
-                'asks': [[str(price), str(size)] for price, size in orderbook_data.get('asks', [])],
-                'bids': [[str(price), str(size)] for price, size in orderbook_data.get('bids', [])]
-            }
-            await self.db.orderbook.insert_one(formatted_orderbook)
+            await self.db.orderbook.insert_one(self.format_orderbook(orderbook_data, symbol))
         except Exception as e:
             logger.error(f"Failed to store orderbook: {e}")
 
-db = Database() 
\ No newline at end of file
+db = Database()
\ No newline at end of file
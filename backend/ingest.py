@@ -0,0 +1,87 @@
+import argparse
+import asyncio
+import logging
+import os
+import signal
+from aiohttp import web
+from dotenv import load_dotenv
+from metrics import metrics, monitor_event_loop
+from shared_state import unlink_segments
+from websocket.market_data import MarketDataWebSocket
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_INTERVAL = 1.0
+
+
+async def heartbeat(market_ws):
+    """Report liveness, exchange connectivity and message counts to the API workers."""
+    while True:
+        connected = market_ws.connected
+        for state in market_ws.symbols.values():
+            state.shared.heartbeat(connected, state.messages)
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+
+async def serve_metrics(market_ws, port: int) -> web.AppRunner:
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render(market_ws.gauges()),
+                            content_type='text/plain', charset='utf-8')
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '0.0.0.0', port).start()
+    return runner
+
+
+async def run(metrics_port: int):
+    """
+    Run the exchange feed once for every API worker.
+
+    Books, tickers, ticks, candles and model parameters are published to
+    shared memory; API workers started with SHARED_MARKET_STATE=1 read
+    them from there. Database writes also happen only here.
+    """
+    market_ws = MarketDataWebSocket(shared='publish')
+    await market_ws.start()
+    tasks = [
+        asyncio.create_task(heartbeat(market_ws)),
+        asyncio.create_task(monitor_event_loop(metrics.histogram('event_loop_lag')))
+    ]
+    runner = await serve_metrics(market_ws, metrics_port) if metrics_port else None
+    logger.info(f"Publishing {len(market_ws.instruments)} instruments to shared memory")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    for task in tasks:
+        task.cancel()
+    if runner:
+        await runner.cleanup()
+    await market_ws.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exchange ingest process publishing market state to shared memory")
+    parser.add_argument('--metrics-port', type=int, default=int(os.getenv('INGEST_METRICS_PORT', '0')),
+                        help="Serve Prometheus metrics of the ingest process on this port (0 disables)")
+    parser.add_argument('--unlink', action='store_true',
+                        help="Remove the shared memory segments of INSTRUMENTS and exit")
+    args = parser.parse_args()
+
+    if args.unlink:
+        unlink_segments([symbol.strip() for symbol in os.getenv('INSTRUMENTS', 'BTC-USDT-SWAP').split(',')
+                         if symbol.strip()])
+        return
+    asyncio.run(run(args.metrics_port))
+
+
+if __name__ == "__main__":
+    main()
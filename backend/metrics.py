@@ -0,0 +1,174 @@
+import asyncio
+import time
+import numpy as np
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Log-linear bucketing as in HdrHistogram: values (microseconds) below SUB_BUCKETS
+# get exact buckets, above that every power of two is split into HALF buckets,
+# which keeps the relative error under 1/HALF (~1.6%) over the whole range
+PRECISION_BITS = 7
+SUB_BUCKETS = 1 << PRECISION_BITS
+HALF = SUB_BUCKETS >> 1
+BUCKETS = 2048          # covers up to ~2^31 us (35 minutes); larger values are clamped
+
+QUANTILES = (0.5, 0.99, 0.999)
+
+# Metric line: (labels, value)
+Sample = Tuple[Dict[str, str], float]
+
+
+def _bucket(value_us: int) -> int:
+    if value_us < SUB_BUCKETS:
+        return value_us if value_us > 0 else 0
+    shift = value_us.bit_length() - PRECISION_BITS
+    index = shift * HALF + (value_us >> shift)
+    return index if index < BUCKETS else BUCKETS - 1
+
+
+def _bucket_upper(index: np.ndarray) -> np.ndarray:
+    """Highest value (us) that maps to each bucket."""
+    index = np.asarray(index, dtype=np.int64)
+    shift = np.maximum(index // HALF - 1, 0)
+    mantissa = index - shift * HALF
+    return np.where(index < SUB_BUCKETS, index, ((mantissa + 1) << shift) - 1)
+
+
+class Histogram:
+    """
+    Fixed-size latency histogram with HDR-style log-linear buckets.
+
+    Recording is a bucket computation and a list increment with no locks or
+    allocation; quantiles are only computed when the histogram is read.
+    Everything runs on the event loop, so there is a single writer.
+    """
+
+    def __init__(self):
+        self.counts: List[int] = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        if seconds < 0:
+            seconds = 0.0
+        self.counts[_bucket(int(seconds * 1e6))] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantiles(self, quantiles: Iterable[float] = QUANTILES) -> Dict[float, float]:
+        """Return {quantile: seconds}, each at the upper edge of its bucket."""
+        if self.count == 0:
+            return {q: 0.0 for q in quantiles}
+        cumulative = np.cumsum(self.counts)
+        result = {}
+        for q in quantiles:
+            index = int(np.searchsorted(cumulative, max(1, int(np.ceil(q * self.count))), side='left'))
+            result[q] = min(float(_bucket_upper(index)) / 1e6, self.max)
+        return result
+
+    def summary(self) -> Dict[str, float]:
+        q = self.quantiles()
+        return {
+            'count': self.count,
+            'p50_ms': round(q[0.5] * 1000, 4),
+            'p99_ms': round(q[0.99] * 1000, 4),
+            'p99.9_ms': round(q[0.999] * 1000, 4),
+            'max_ms': round(self.max * 1000, 4)
+        }
+
+
+class Metrics:
+    """Registry of per-stage latency histograms, keyed by stage name and labels."""
+
+    def __init__(self, prefix: str = 'trade_simulator'):
+        self.prefix = prefix
+        self.histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram] = {}
+
+    def histogram(self, stage: str, **labels: str) -> Histogram:
+        key = (stage, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        return histogram
+
+    def observe(self, stage: str, seconds: float, **labels: str):
+        self.histogram(stage, **labels).record(seconds)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return {
+            stage + ''.join(f"[{k}={v}]" for k, v in labels): histogram.summary()
+            for (stage, labels), histogram in self.histograms.items()
+        }
+
+    def render(self, gauges: Iterable[Tuple[str, str, str, List[Sample]]] = ()) -> str:
+        """
+        Render histograms and the given gauges/counters in Prometheus text format.
+
+        Args:
+            gauges: (name, type, help, samples) tuples; type is 'gauge' or 'counter'
+
+        Returns:
+            Exposition text (format version 0.0.4)
+        """
+        lines = []
+        name = f"{self.prefix}_stage_latency_seconds"
+        lines.append(f"# HELP {name} Per-stage message latency")
+        lines.append(f"# TYPE {name} summary")
+        for (stage, labels), histogram in sorted(self.histograms.items()):
+            base = dict(labels, stage=stage)
+            for q, value in histogram.quantiles().items():
+                lines.append(f"{name}{_labels(dict(base, quantile=str(q)))} {value:.6g}")
+            lines.append(f"{name}_sum{_labels(base)} {histogram.total:.6g}")
+            lines.append(f"{name}_count{_labels(base)} {histogram.count}")
+        max_name = f"{name}_max"
+        lines.append(f"# HELP {max_name} Maximum per-stage message latency")
+        lines.append(f"# TYPE {max_name} gauge")
+        for (stage, labels), histogram in sorted(self.histograms.items()):
+            lines.append(f"{max_name}{_labels(dict(labels, stage=stage))} {histogram.max:.6g}")
+
+        for gauge_name, metric_type, help_text, samples in gauges:
+            full_name = f"{self.prefix}_{gauge_name}"
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {metric_type}")
+            for labels, value in samples:
+                lines.append(f"{full_name}{_labels(labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    pairs = []
+    for key, value in sorted(labels.items()):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{key}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class SampledLog:
+    """Rate limiter for periodic log lines on hot paths."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._next = 0.0
+
+    def due(self, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        if now < self._next:
+            return False
+        self._next = now + self.interval
+        return True
+
+
+async def monitor_event_loop(histogram: Histogram, interval: float = 0.1):
+    """Record how late the event loop wakes up from a fixed sleep, as a measure of loop lag."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        histogram.record(loop.time() - start - interval)
+
+
+metrics = Metrics()
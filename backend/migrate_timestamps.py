@@ -0,0 +1,38 @@
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from database import db
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+async def run(timezone_name: str, stored_before: datetime):
+    """Rewrite timestamps stored in server local time by earlier versions as UTC."""
+    await db.connect()
+    try:
+        converted = await db.convert_local_timestamps(timezone_name, stored_before)
+        for name, count in converted.items():
+            logger.info(f"{name}: converted {count} documents")
+    finally:
+        await db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert timestamps stored in local time to UTC, once")
+    parser.add_argument('--timezone', required=True, help="IANA time zone the old server ran in")
+    parser.add_argument('--stored-before', required=True,
+                        help="ISO time the upgraded version first wrote, UTC unless it has an offset")
+    args = parser.parse_args()
+    stored_before = datetime.fromisoformat(args.stored_before)
+    if stored_before.tzinfo is None:
+        stored_before = stored_before.replace(tzinfo=timezone.utc)
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run(args.timezone, stored_before))
+
+
+if __name__ == "__main__":
+    main()
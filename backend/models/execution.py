@@ -0,0 +1,207 @@
+import asyncio
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, Optional, Tuple
+from models.slippage import BookSnapshot
+
+STRATEGIES = ('TWAP', 'VWAP', 'POV')
+# Worker processes simulating paths in parallel
+EXECUTION_WORKERS = int(os.getenv('EXECUTION_WORKERS', str(os.cpu_count() or 1)))
+# Paths per worker task; each chunk draws from its own seed, so results do not depend on the worker count
+EXECUTION_CHUNK_PATHS = int(os.getenv('EXECUTION_CHUNK_PATHS', '1000'))
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """Process pool shared by all execution simulations, created on first use."""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=EXECUTION_WORKERS)
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _schedule(strategy: str,
+              quantity: float,
+              steps: int,
+              rng: np.random.Generator,
+              paths: int,
+              profile: np.ndarray,
+              participation: float,
+              volume_per_step: float) -> np.ndarray:
+    """Child order sizes per path and step, shape (paths, steps)."""
+    if strategy == 'TWAP':
+        return np.full((paths, steps), quantity / steps)
+    if strategy == 'VWAP':
+        return np.broadcast_to(quantity * profile, (paths, steps))
+
+    # POV: trade a fixed share of simulated market volume until the parent is done,
+    # sweeping whatever is left on the final step
+    shape = 2.0
+    market_volume = rng.gamma(shape, volume_per_step / shape, size=(paths, steps))
+    executed = np.minimum(np.cumsum(participation * market_volume, axis=1), quantity)
+    children = np.diff(executed, axis=1, prepend=0.0)
+    children[:, -1] += quantity - executed[:, -1]
+    return children
+
+
+def _simulate_chunk(task: Dict) -> Tuple[int, int]:
+    """
+    Simulate one chunk of paths in a worker process.
+
+    The book is read from, and per-path costs are written to, shared memory
+    blocks created by the parent, so no large arrays are pickled.
+    """
+    book_shm = shared_memory.SharedMemory(name=task['book_shm'])
+    out_shm = shared_memory.SharedMemory(name=task['out_shm'])
+    try:
+        n_asks, n_bids = task['book_shape']
+        levels = np.ndarray((n_asks + n_bids, 2), dtype=np.float64, buffer=book_shm.buf)
+        snapshot = BookSnapshot(levels[:n_asks], levels[n_asks:])
+        costs = np.ndarray((task['total_paths'],), dtype=np.float64, buffer=out_shm.buf)
+
+        start, count = task['start'], task['count']
+        steps = task['steps']
+        quantity = task['quantity']
+        rng = np.random.default_rng(task['seed'])
+
+        # Geometric Brownian motion sampled at each child order time
+        dt = task['horizon'] / steps
+        sigma = task['sigma']
+        shocks = rng.standard_normal((count, steps)) * (sigma * np.sqrt(dt)) - 0.5 * sigma * sigma * dt
+        prices = task['price'] * np.exp(np.cumsum(shocks, axis=1))
+
+        children = _schedule(task['strategy'], quantity, steps, rng, count, task['profile'],
+                             task['participation'], task['volume_per_step'])
+
+        # Each child walks the visible book, which is assumed to refill between children;
+        # the walk's average price relative to the arrival mid (spread included) moves with the path
+        side = task['side']
+        direction = 1.0 if side == 'buy' else -1.0
+        walk = snapshot.walk(children.ravel(), side)
+        ratio = np.nan_to_num(walk['avg_price'] / task['price'], nan=1.0).reshape(children.shape)
+        fills = prices * ratio
+
+        notional = np.sum(children * fills, axis=1)
+        fees = notional * task['fee_rate']
+        # Implementation shortfall against the arrival price, plus fees
+        costs[start:start + count] = direction * (notional - quantity * task['price']) + fees
+        return start, count
+    finally:
+        book_shm.close()
+        out_shm.close()
+
+
+def summarize(costs: np.ndarray, notional: float) -> Dict:
+    """Mean, dispersion, percentiles and CVaR of a cost distribution, in quote currency and bps."""
+    sorted_costs = np.sort(costs)
+    n = len(sorted_costs)
+    p5, p50, p95, p99 = np.percentile(sorted_costs, [5, 50, 95, 99])
+
+    def cvar(level: float) -> float:
+        tail = sorted_costs[int(np.floor(level * n)):]
+        return float(tail.mean()) if len(tail) else float(sorted_costs[-1])
+
+    summary = {
+        'mean': float(sorted_costs.mean()),
+        'std': float(sorted_costs.std()),
+        'p5': float(p5),
+        'p50': float(p50),
+        'p95': float(p95),
+        'p99': float(p99),
+        'cvar95': cvar(0.95),
+        'cvar99': cvar(0.99)
+    }
+    summary['bps'] = {name: value / notional * 1e4 for name, value in summary.items()}
+    return summary
+
+
+async def run_simulation(book_levels: Tuple[np.ndarray, np.ndarray],
+                         price: float,
+                         quantity: float,
+                         side: str,
+                         strategy: str,
+                         horizon: float,
+                         steps: int,
+                         paths: int,
+                         sigma: float,
+                         fee_rate: float,
+                         profile: Optional[np.ndarray] = None,
+                         participation: float = 0.1,
+                         volume_rate: float = 0.0,
+                         seed: Optional[int] = None) -> np.ndarray:
+    """
+    Monte Carlo cost distribution of executing a parent order with child orders.
+
+    Args:
+        book_levels: (asks, bids) arrays of [price, size] rows, best first
+        price: Arrival mid price
+        quantity: Parent order size in base currency
+        side: 'buy' or 'sell'
+        strategy: 'TWAP', 'VWAP' or 'POV'
+        horizon: Execution horizon in seconds
+        steps: Number of child orders
+        paths: Number of simulated price paths
+        sigma: Return volatility per sqrt(second)
+        fee_rate: Expected fee rate charged on traded notional
+        profile: VWAP volume profile over the steps, uniform when omitted
+        participation: POV share of market volume
+        volume_rate: Market volume per second, for POV
+        seed: Seed for reproducible runs, giving the same costs whatever EXECUTION_WORKERS is
+
+    Returns:
+        Array of per-path costs in quote currency
+    """
+    asks, bids = (np.asarray(levels, dtype=np.float64).reshape(-1, 2) for levels in book_levels)
+    if profile is None or len(profile) != steps or profile.sum() <= 0:
+        profile = np.full(steps, 1.0 / steps)
+    else:
+        profile = profile / profile.sum()
+
+    book = np.concatenate([asks, bids]) if len(asks) + len(bids) else np.zeros((1, 2))
+    book_shm = shared_memory.SharedMemory(create=True, size=max(book.nbytes, 1))
+    out_shm = shared_memory.SharedMemory(create=True, size=paths * 8)
+    try:
+        np.ndarray(book.shape, dtype=np.float64, buffer=book_shm.buf)[:] = book
+        pool = get_pool()
+        chunk = EXECUTION_CHUNK_PATHS
+        seeds = np.random.SeedSequence(seed).spawn(-(-paths // chunk))
+        base = {
+            'book_shm': book_shm.name,
+            'out_shm': out_shm.name,
+            'book_shape': (len(asks), len(bids)),
+            'total_paths': paths,
+            'steps': steps,
+            'quantity': quantity,
+            'horizon': horizon,
+            'sigma': sigma,
+            'price': price,
+            'side': side,
+            'strategy': strategy,
+            'profile': profile,
+            'participation': participation,
+            'volume_per_step': volume_rate * horizon / steps,
+            'fee_rate': fee_rate
+        }
+        loop = asyncio.get_running_loop()
+        futures = []
+        for i, start in enumerate(range(0, paths, chunk)):
+            task = dict(base, start=start, count=min(chunk, paths - start),
+                        seed=int(seeds[i].generate_state(1)[0]))
+            futures.append(loop.run_in_executor(pool, _simulate_chunk, task))
+        await asyncio.gather(*futures)
+        return np.ndarray((paths,), dtype=np.float64, buffer=out_shm.buf).copy()
+    finally:
+        book_shm.close()
+        book_shm.unlink()
+        out_shm.close()
+        out_shm.unlink()
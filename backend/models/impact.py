@@ -0,0 +1,216 @@
+import math
+import numpy as np
+from typing import Dict, NamedTuple, Optional
+
+# Seconds per day, used to express the Almgren-Chriss heuristics per second
+SECONDS_PER_DAY = 86400.0
+
+
+class ImpactParams(NamedTuple):
+    """Calibrated Almgren-Chriss parameters, all in price units and seconds."""
+    price: float        # Reference (mid) price
+    sigma: float        # Price volatility per sqrt(second)
+    epsilon: float      # Fixed temporary cost per unit (half spread)
+    eta: float          # Temporary impact per unit of trading rate
+    gamma: float        # Permanent impact per unit traded
+    volume_rate: float  # Traded volume per second
+    version: int
+
+
+class MarketImpactModel:
+    """
+    Almgren-Chriss market impact model calibrated online from trades and the book.
+
+    Every trade and book update folds into exponentially weighted estimates
+    in O(1): return variance per second and volume per second from the
+    trade stream, spread from the book. Impact coefficients follow the
+    Almgren-Chriss heuristics: trading 1% of daily volume per day costs one
+    spread of temporary impact, and trading 10% of daily volume moves the
+    price permanently by one spread. The latest parameters are published as
+    an immutable `ImpactParams` so readers never see a half-updated set.
+    """
+
+    def __init__(self, half_life: float = 300.0, risk_aversion: float = 1e-6):
+        """
+        Args:
+            half_life: Half-life in seconds of the exponentially weighted estimates
+            risk_aversion: Default Almgren-Chriss risk aversion (lambda)
+        """
+        self.decay_rate = math.log(2) / half_life
+        self.risk_aversion = risk_aversion
+        self._last_trade_ts: Optional[float] = None
+        self._last_trade_price: Optional[float] = None
+        self._var_rate = 0.0
+        self._volume_rate = 0.0
+        self._spread: Optional[float] = None
+        self._mid: Optional[float] = None
+        self._trades = 0
+        self.params: Optional[ImpactParams] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.params is not None
+
+    def on_trade(self, price: float, size: float, ts_ms: float):
+        """Fold one trade into the volatility and volume estimates."""
+        ts = ts_ms / 1000.0
+        if self._last_trade_ts is None:
+            self._last_trade_ts = ts
+            self._last_trade_price = price
+            return
+        dt = max(ts - self._last_trade_ts, 1e-3)
+        weight = math.exp(-self.decay_rate * dt)
+        log_return = math.log(price / self._last_trade_price)
+        # Variance and volume per second, weighted by the elapsed time
+        self._var_rate = weight * self._var_rate + (1 - weight) * (log_return * log_return / dt)
+        self._volume_rate = weight * self._volume_rate + (1 - weight) * (size / dt)
+        self._last_trade_ts = ts
+        self._last_trade_price = price
+        self._trades += 1
+        self._publish()
+
+    def snapshot(self) -> Dict:
+        """Estimator state, for a warm restart."""
+        return {
+            'last_trade_ts': self._last_trade_ts,
+            'last_trade_price': self._last_trade_price,
+            'var_rate': self._var_rate,
+            'volume_rate': self._volume_rate,
+            'spread': self._spread,
+            'mid': self._mid,
+            'trades': self._trades,
+            'params': list(self.params) if self.params else None
+        }
+
+    def restore(self, snapshot: Dict):
+        self._last_trade_ts = snapshot['last_trade_ts']
+        self._last_trade_price = snapshot['last_trade_price']
+        self._var_rate = snapshot['var_rate']
+        self._volume_rate = snapshot['volume_rate']
+        self._spread = snapshot['spread']
+        self._mid = snapshot['mid']
+        self._trades = snapshot['trades']
+        self.params = ImpactParams(*snapshot['params']) if snapshot['params'] else None
+
+    def on_book(self, best_bid: float, best_ask: float):
+        """Fold the current top of book into the spread estimate."""
+        spread = best_ask - best_bid
+        if spread <= 0:
+            return
+        self._mid = (best_bid + best_ask) / 2
+        self._spread = spread if self._spread is None else 0.9 * self._spread + 0.1 * spread
+        self._publish()
+
+    def _publish(self):
+        if self._trades < 2 or self._volume_rate <= 0:
+            return
+        price = self._mid or self._last_trade_price
+        spread = self._spread if self._spread is not None else price * 1e-4
+        daily_volume = self._volume_rate * SECONDS_PER_DAY
+        self.params = ImpactParams(
+            price=price,
+            sigma=price * math.sqrt(self._var_rate),
+            epsilon=spread / 2,
+            eta=spread / (0.01 * self._volume_rate),
+            gamma=spread / (0.1 * daily_volume),
+            volume_rate=self._volume_rate,
+            version=(self.params.version + 1) if self.params else 1
+        )
+
+    def trajectories(self,
+                     quantity: float,
+                     horizons,
+                     steps: int = 10,
+                     risk_aversion: Optional[float] = None,
+                     params: Optional[ImpactParams] = None) -> Dict[str, np.ndarray]:
+        """
+        Optimal liquidation trajectories for many horizons at once.
+
+        Args:
+            quantity: Order size in base currency units
+            horizons: Array of execution horizons in seconds
+            steps: Number of child-order intervals per horizon
+            risk_aversion: Almgren-Chriss lambda, defaults to the model's
+            params: Parameters to use, defaults to the latest calibration
+
+        Returns:
+            Dict with 'holdings' (H, steps + 1), 'trades' (H, steps),
+            'expected_cost' and 'variance' (H,), costs in quote currency
+        """
+        params = params or self.params
+        lam = self.risk_aversion if risk_aversion is None else risk_aversion
+        T = np.atleast_1d(np.asarray(horizons, dtype=np.float64))[:, None]
+        tau = T / steps
+        t = tau * np.arange(steps + 1)[None, :]
+
+        eta_tilde = np.maximum(params.eta - 0.5 * params.gamma * tau, 1e-12)
+        kappa_tilde_sq = lam * params.sigma ** 2 / eta_tilde
+        kappa = np.arccosh(0.5 * kappa_tilde_sq * tau ** 2 + 1) / tau
+
+        kT = kappa * T
+        # sinh(k(T - t)) / sinh(kT), written with exponentials so large kT cannot overflow
+        with np.errstate(invalid='ignore', divide='ignore'):
+            curved = np.exp(-kappa * t) * np.expm1(-2 * kappa * (T - t)) / np.expm1(-2 * kT)
+        # Risk-neutral limit is the linear (TWAP) schedule
+        linear = 1 - t / T
+        shape = np.where(kT > 1e-8, curved, linear)
+        holdings = quantity * shape
+        trades = -np.diff(holdings, axis=1)
+
+        expected_cost = (0.5 * params.gamma * quantity ** 2 +
+                         params.epsilon * quantity +
+                         (eta_tilde[:, 0] / tau[:, 0]) * np.sum(trades ** 2, axis=1))
+        variance = params.sigma ** 2 * tau[:, 0] * np.sum(holdings[:, 1:] ** 2, axis=1)
+        return {
+            'holdings': holdings,
+            'trades': trades,
+            'expected_cost': expected_cost,
+            'variance': variance
+        }
+
+    def impact(self, quantity: float, horizon: float, steps: int = 10) -> Optional[Dict[str, float]]:
+        """
+        Expected temporary and permanent impact of executing `quantity` over `horizon` seconds.
+
+        Returns:
+            Dict with 'temporary', 'permanent' and 'total' impact as fractions
+            of notional, or None if the model is not calibrated yet
+        """
+        params = self.params
+        if params is None or quantity <= 0:
+            return None
+        result = self.trajectories(quantity, [horizon], steps, params=params)
+        notional = quantity * params.price
+        permanent = 0.5 * params.gamma * quantity ** 2 / notional
+        total = float(result['expected_cost'][0]) / notional
+        return {
+            'temporary': total - permanent,
+            'permanent': permanent,
+            'total': total,
+            'version': params.version
+        }
+
+    def total_impact(self, quantity: np.ndarray, horizon: float, steps: int = 10,
+                     params: Optional[ImpactParams] = None) -> Optional[np.ndarray]:
+        """
+        The 'total' of `impact` for many order sizes at once.
+
+        The optimal schedule's shape does not depend on the order size, so
+        the expected cost is epsilon * q plus a term quadratic in q and one
+        trajectory of a unit order prices every size.
+
+        Args:
+            quantity: Order sizes in base currency units
+            horizon: Execution horizon in seconds
+            steps: Number of child-order intervals
+            params: Parameters to use, defaults to the latest calibration
+
+        Returns:
+            Total impact as fractions of notional, or None if the model is not calibrated yet
+        """
+        params = params or self.params
+        if params is None:
+            return None
+        unit_cost = float(self.trajectories(1.0, [horizon], steps, params=params)['expected_cost'][0])
+        quantity = np.asarray(quantity, dtype=np.float64)
+        return (params.epsilon + (unit_cost - params.epsilon) * quantity) / params.price
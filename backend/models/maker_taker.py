@@ -0,0 +1,292 @@
+import asyncio
+import logging
+import math
+import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FEATURE_NAMES = ('volatility', 'spread_bps', 'book_imbalance', 'flow_imbalance', 'log_trade_rate')
+
+
+class Coefficients(NamedTuple):
+    """Scaled-space model folded into raw feature space, so inference is a dot product."""
+    weights: np.ndarray
+    bias: float
+    version: int
+    samples: int
+
+
+class Probe(NamedTuple):
+    ts: float
+    price: float
+    features: np.ndarray
+
+
+class MakerTakerClassifier:
+    """
+    Online logistic regression estimating the probability that an order ends up as taker.
+
+    Labels come from probes: every `probe_interval` seconds a virtual passive
+    order is placed at the touch on each side. If a trade reaches its price
+    within `horizon` seconds it would have filled as maker (label 0),
+    otherwise the order would have had to cross the spread (label 1).
+    Resolved probes are grouped into mini-batches and fitted with
+    `partial_fit` on a worker thread; each fit publishes a new
+    `Coefficients` tuple in a single assignment, so predictions never wait
+    on or observe a half-trained model.
+    """
+
+    def __init__(self,
+                 horizon: float = 10.0,
+                 probe_interval: float = 1.0,
+                 batch_size: int = 64,
+                 half_life: float = 30.0,
+                 executor: Optional[ThreadPoolExecutor] = None):
+        """
+        Args:
+            horizon: Seconds a probe waits for a fill before counting as taker
+            probe_interval: Seconds between probes on each side
+            batch_size: Resolved probes per partial_fit call
+            half_life: Half-life in seconds of the streaming feature estimates
+            executor: Worker pool for training, shared between symbols; a private
+                single-thread pool is created when omitted
+        """
+        self.horizon = horizon
+        self.probe_interval = probe_interval
+        self.batch_size = batch_size
+        self.decay_rate = math.log(2) / half_life
+        self.coefficients: Optional[Coefficients] = None
+
+        # Created on the first fit, so sklearn is only imported once there is something to train
+        self._model = None
+        self._scaler = None
+        # Estimator state from a snapshot, loaded into the estimators when they are created
+        self._saved_model: Optional[Dict] = None
+        self._owns_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix='maker-taker-fit')
+        self._training: Optional[asyncio.Future] = None
+        self._samples = 0
+
+        # Streaming feature state
+        self._features = np.zeros(len(FEATURE_NAMES))
+        self._last_price: Optional[float] = None
+        self._last_ts: Optional[float] = None
+        self._abs_return = 0.0
+        self._flow = 0.0
+        self._volume = 0.0
+        self._trade_rate = 0.0
+        self._best_bid: Optional[float] = None
+        self._best_ask: Optional[float] = None
+
+        # Pending probes: resting buys at the bid and sells at the ask
+        self._bid_probes: Deque[Probe] = deque()
+        self._ask_probes: Deque[Probe] = deque()
+        self._last_probe_ts = 0.0
+        self._batch_x: List[np.ndarray] = []
+        self._batch_y: List[int] = []
+
+    @property
+    def ready(self) -> bool:
+        return self.coefficients is not None
+
+    def features(self) -> np.ndarray:
+        """Current market feature vector, in FEATURE_NAMES order."""
+        return self._features.copy()
+
+    def on_book(self, best_bid: float, bid_size: float, best_ask: float, ask_size: float, ts_ms: float):
+        """Update book features and place new probes at the touch."""
+        self._best_bid = best_bid
+        self._best_ask = best_ask
+        mid = (best_bid + best_ask) / 2
+        self._features[1] = (best_ask - best_bid) / mid * 1e4
+        total = bid_size + ask_size
+        self._features[2] = (bid_size - ask_size) / total if total > 0 else 0.0
+
+        ts = ts_ms / 1000.0
+        self._expire(ts)
+        if ts - self._last_probe_ts >= self.probe_interval:
+            self._last_probe_ts = ts
+            features = self._features.copy()
+            self._bid_probes.append(Probe(ts, best_bid, features))
+            self._ask_probes.append(Probe(ts, best_ask, features))
+
+    def on_trade(self, price: float, size: float, side: str, ts_ms: float):
+        """Update flow features and resolve probes the trade would have filled."""
+        ts = ts_ms / 1000.0
+        if self._last_ts is not None:
+            dt = max(ts - self._last_ts, 1e-3)
+            weight = math.exp(-self.decay_rate * dt)
+            self._abs_return = weight * self._abs_return + (1 - weight) * abs(math.log(price / self._last_price))
+            self._trade_rate = weight * self._trade_rate + (1 - weight) / dt
+        else:
+            weight = 0.0
+        signed = size if side == 'buy' else -size
+        self._flow = weight * self._flow + signed
+        self._volume = weight * self._volume + size
+        self._last_price = price
+        self._last_ts = ts
+
+        self._features[0] = self._abs_return * 1e4
+        self._features[3] = self._flow / self._volume if self._volume > 0 else 0.0
+        self._features[4] = math.log1p(self._trade_rate)
+
+        # A sell aggressor fills resting bids at or above its price, a buy fills asks at or below
+        if side == 'sell':
+            self._resolve(self._bid_probes, lambda probe: price <= probe.price)
+        else:
+            self._resolve(self._ask_probes, lambda probe: price >= probe.price)
+        self._expire(ts)
+
+    def _resolve(self, probes: Deque[Probe], filled):
+        remaining = [probe for probe in probes if not filled(probe)]
+        if len(remaining) != len(probes):
+            for probe in probes:
+                if filled(probe):
+                    self._add_sample(probe.features, 0)
+            probes.clear()
+            probes.extend(remaining)
+
+    def _expire(self, ts: float):
+        for probes in (self._bid_probes, self._ask_probes):
+            while probes and ts - probes[0].ts > self.horizon:
+                self._add_sample(probes.popleft().features, 1)
+
+    def _add_sample(self, features: np.ndarray, label: int):
+        self._batch_x.append(features)
+        self._batch_y.append(label)
+        if len(self._batch_x) >= self.batch_size:
+            self._submit_batch()
+
+    def _submit_batch(self):
+        if self._training is not None and not self._training.done():
+            # Previous fit still running; keep accumulating, bounded
+            if len(self._batch_x) > 10 * self.batch_size:
+                del self._batch_x[:self.batch_size]
+                del self._batch_y[:self.batch_size]
+            return
+        X = np.vstack(self._batch_x)
+        y = np.asarray(self._batch_y)
+        self._batch_x = []
+        self._batch_y = []
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._publish(*self._fit(X, y))
+            return
+        self._training = loop.run_in_executor(self._executor, self._fit, X, y)
+        self._training.add_done_callback(self._on_trained)
+
+    def _estimators(self):
+        if self._model is not None:
+            return
+        from sklearn.linear_model import SGDClassifier
+        from sklearn.preprocessing import StandardScaler
+        self._model = SGDClassifier(loss='log_loss', alpha=1e-4, learning_rate='optimal')
+        self._scaler = StandardScaler()
+        saved, self._saved_model = self._saved_model, None
+        if saved is not None:
+            # Fitted attributes are all partial_fit needs to continue where the saved model stopped
+            self._model.classes_ = np.array([0, 1])
+            self._model.coef_ = np.array(saved['model_coef'], dtype=np.float64)
+            self._model.intercept_ = np.array(saved['model_intercept'], dtype=np.float64)
+            self._model.t_ = float(saved['model_t'])
+            self._scaler.mean_ = np.array(saved['scaler_mean'], dtype=np.float64)
+            self._scaler.var_ = np.array(saved['scaler_var'], dtype=np.float64)
+            scale = np.sqrt(self._scaler.var_)
+            self._scaler.scale_ = np.where(scale > 0, scale, 1.0)
+            self._scaler.n_samples_seen_ = np.int64(saved['scaler_samples'])
+
+    def _fit(self, X: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, float, int]:
+        """Runs on the worker thread."""
+        self._estimators()
+        self._scaler.partial_fit(X)
+        Xs = self._scaler.transform(X)
+        self._model.partial_fit(Xs, y, classes=np.array([0, 1]))
+        scale = self._scaler.scale_
+        weights = self._model.coef_[0] / scale
+        bias = float(self._model.intercept_[0] - np.dot(self._model.coef_[0], self._scaler.mean_ / scale))
+        return weights, bias, len(y)
+
+    def _on_trained(self, future: asyncio.Future):
+        try:
+            self._publish(*future.result())
+        except Exception as e:
+            logger.error(f"Maker/taker model training failed: {e}")
+
+    def _publish(self, weights: np.ndarray, bias: float, samples: int):
+        self._samples += samples
+        version = self.coefficients.version + 1 if self.coefficients else 1
+        self.coefficients = Coefficients(weights, bias, version, self._samples)
+
+    def predict(self, features: Optional[np.ndarray] = None) -> Optional[float]:
+        """
+        Probability of taker execution.
+
+        Args:
+            features: Feature vector in FEATURE_NAMES order, defaults to the current market
+
+        Returns:
+            Taker probability (0-1), or None until the first model is trained
+        """
+        coefficients = self.coefficients
+        if coefficients is None:
+            return None
+        x = self._features if features is None else features
+        z = float(np.dot(coefficients.weights, x)) + coefficients.bias
+        return 1.0 / (1.0 + math.exp(-max(min(z, 50.0), -50.0)))
+
+    def load(self, coefficients: Optional[Coefficients], features: np.ndarray):
+        """Adopt coefficients and features published by the process that trains the model."""
+        self.coefficients = coefficients
+        self._features[:] = features
+
+    def snapshot(self) -> Dict:
+        """
+        Coefficients, streaming features and the fitted estimators, for a warm restart.
+
+        The estimators are saved as their fitted arrays. While a fit is
+        running they are left out (the previous save is kept instead), so
+        the training thread is never raced.
+        """
+        coefficients = self.coefficients
+        model = self._saved_model
+        if self._model is not None and (self._training is None or self._training.done()):
+            model = {
+                'model_coef': self._model.coef_.copy(),
+                'model_intercept': self._model.intercept_.copy(),
+                'model_t': float(self._model.t_),
+                'scaler_mean': self._scaler.mean_.copy(),
+                'scaler_var': self._scaler.var_.copy(),
+                'scaler_samples': int(self._scaler.n_samples_seen_)
+            }
+        snapshot = {
+            'coefficients': None if coefficients is None else [
+                coefficients.weights.tolist(), coefficients.bias, coefficients.version, coefficients.samples],
+            'features': self._features.copy(),
+            'streams': [self._last_price, self._last_ts, self._abs_return, self._flow, self._volume,
+                        self._trade_rate, self._samples]
+        }
+        if model is not None:
+            snapshot.update(model)
+        return snapshot
+
+    def restore(self, snapshot: Dict):
+        saved = snapshot['coefficients']
+        if saved is not None and len(saved[0]) == len(FEATURE_NAMES):
+            weights, bias, version, samples = saved
+            self.coefficients = Coefficients(np.asarray(weights), bias, version, samples)
+            coef = snapshot.get('model_coef')
+            if coef is not None and coef.shape == (1, len(FEATURE_NAMES)):
+                self._saved_model = {key: value for key, value in snapshot.items()
+                                     if key.startswith(('model_', 'scaler_'))}
+        if snapshot['features'].shape == self._features.shape:
+            self._features[:] = snapshot['features']
+        (self._last_price, self._last_ts, self._abs_return, self._flow, self._volume,
+         self._trade_rate, self._samples) = snapshot['streams']
+
+    def close(self):
+        if self._owns_executor:
+            self._executor.shutdown(wait=False)
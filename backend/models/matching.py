@@ -0,0 +1,322 @@
+import itertools
+import math
+import os
+from bisect import bisect_left, bisect_right, insort
+from typing import Collection, Dict, Hashable, List, Optional, Tuple
+
+# Resting paper orders allowed per client connection
+MAX_ORDERS_PER_CLIENT = int(os.getenv('PAPER_MAX_ORDERS', '50000'))
+SIDES = ('buy', 'sell')
+EPSILON = 1e-12
+
+_order_ids = itertools.count(1)
+
+
+class PaperOrder:
+    """A simulated resting limit order."""
+    __slots__ = ('id', 'client_id', 'owner', 'symbol', 'side', 'price', 'size', 'filled', 'queue_ahead', 'start')
+
+    def __init__(self, owner: Hashable, symbol: str, side: str, price: float, size: float,
+                 client_id: Optional[str] = None):
+        self.id = next(_order_ids)
+        self.client_id = client_id
+        self.owner = owner
+        self.symbol = symbol
+        self.side = side
+        self.price = price
+        self.size = size
+        self.filled = 0.0
+        # Displayed size ahead of the order when it was placed
+        self.queue_ahead = 0.0
+        # Volume traded at the level after which this order starts to fill
+        self.start = 0.0
+
+    @property
+    def remaining(self) -> float:
+        return self.size - self.filled
+
+    def to_dict(self) -> Dict:
+        return {
+            'orderId': self.id,
+            'clientOrderId': self.client_id,
+            'symbol': self.symbol,
+            'side': self.side,
+            'price': self.price,
+            'size': self.size,
+            'filled': self.filled,
+            'remaining': self.remaining,
+            'queueAhead': self.queue_ahead
+        }
+
+
+# (order, quantity filled by this event)
+Fill = Tuple[PaperOrder, float]
+
+
+class PriceLevel:
+    """
+    Paper orders resting at one price, ordered by when they reach the front of the queue.
+
+    `traded` counts the volume traded at this price since the first order
+    arrived. An order placed behind `queue_ahead` of displayed size starts
+    filling once `traded` passes `start` = traded at placement + queue_ahead,
+    and is filled by min(size, traded - start) at any point. A trade therefore
+    only visits the orders that reached the front, found by bisecting the
+    sorted starts, not every order resting at the level.
+    """
+    __slots__ = ('price', 'traded', 'starts', 'orders')
+
+    def __init__(self, price: float):
+        self.price = price
+        self.traded = 0.0
+        self.starts: List[float] = []
+        self.orders: List[PaperOrder] = []
+
+    def __len__(self) -> int:
+        return len(self.orders)
+
+    def add(self, order: PaperOrder, queue_ahead: float):
+        order.queue_ahead = queue_ahead
+        order.start = self.traded + queue_ahead
+        index = bisect_right(self.starts, order.start)
+        self.starts.insert(index, order.start)
+        self.orders.insert(index, order)
+
+    def remove(self, order: PaperOrder):
+        index = bisect_left(self.starts, order.start)
+        while self.orders[index] is not order:
+            index += 1
+        del self.starts[index]
+        del self.orders[index]
+
+    def trade(self, size: float) -> List[Fill]:
+        """Consume `size` of the queue at this price; returns the fills it causes."""
+        self.traded += size
+        front = bisect_left(self.starts, self.traded)
+        fills = []
+        done = []
+        for index in range(front):
+            order = self.orders[index]
+            quantity = min(order.size, self.traded - order.start) - order.filled
+            if quantity > EPSILON:
+                order.filled += quantity
+                fills.append((order, quantity))
+            if order.remaining <= EPSILON:
+                done.append(index)
+        for index in reversed(done):
+            del self.starts[index]
+            del self.orders[index]
+        return fills
+
+    def shrink(self, size: float):
+        """The displayed size fell to `size`: nobody can have more than that left ahead of them."""
+        cap = self.traded + size
+        index = bisect_right(self.starts, cap)
+        for i in range(index, len(self.starts)):
+            self.starts[i] = cap
+            self.orders[i].start = cap
+
+    def fill_all(self) -> List[Fill]:
+        """The market traded through this price, so every order here is filled."""
+        fills = [(order, order.remaining) for order in self.orders if order.remaining > EPSILON]
+        for order, quantity in fills:
+            order.filled = order.size
+        self.starts.clear()
+        self.orders.clear()
+        return fills
+
+
+class BookSideOrders:
+    """Paper orders of one side, indexed by price with the prices kept sorted."""
+
+    def __init__(self, is_bid: bool):
+        self.is_bid = is_bid
+        self.levels: Dict[float, PriceLevel] = {}
+        self.prices: List[float] = []
+
+    def level(self, price: float) -> PriceLevel:
+        level = self.levels.get(price)
+        if level is None:
+            level = self.levels[price] = PriceLevel(price)
+            insort(self.prices, price)
+        return level
+
+    def discard(self, level: PriceLevel):
+        if not level.orders:
+            del self.levels[level.price]
+            del self.prices[bisect_left(self.prices, level.price)]
+
+    def through(self, price: float, inclusive: bool) -> List[PriceLevel]:
+        """Levels the market has gone through at `price`: bids above it, asks below it."""
+        if self.is_bid:
+            start = bisect_left(self.prices, price) if inclusive else bisect_right(self.prices, price)
+            return [self.levels[p] for p in self.prices[start:]]
+        end = bisect_right(self.prices, price) if inclusive else bisect_left(self.prices, price)
+        return [self.levels[p] for p in self.prices[:end]]
+
+
+class MatchingEngine:
+    """
+    Paper-trading engine for post-only limit orders on one instrument.
+
+    Orders never trade with each other or change the real book; each is a
+    hypothetical order filled from the live feed as if it were the only
+    one. On placement an order
+    joins the back of the displayed queue at its price. It fills as trades
+    at its price consume that queue, and in full once trades or the
+    opposite touch go through its price. A level's queue estimate shrinks
+    with its displayed size, since cancellations may come from ahead of
+    the order; growth is assumed to join behind it.
+    """
+
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+        self.bids = BookSideOrders(is_bid=True)
+        self.asks = BookSideOrders(is_bid=False)
+        self.orders: Dict[int, PaperOrder] = {}
+        self.owners: Dict[Hashable, Dict[int, PaperOrder]] = {}
+        self.placed = 0
+        self.fills = 0
+        self.filled_volume = 0.0
+
+    def __len__(self) -> int:
+        return len(self.orders)
+
+    def _side(self, side: str) -> BookSideOrders:
+        return self.bids if side == 'buy' else self.asks
+
+    def place(self, owner: Hashable, side: str, price: float, size: float, book,
+              client_id: Optional[str] = None) -> PaperOrder:
+        """
+        Rest a new order behind the displayed size at its price.
+
+        Args:
+            owner: Key of the client that receives the order's fills
+            side: 'buy' or 'sell'
+            price: Limit price
+            size: Order size
+            book: Current OrderBook (or SharedBookView) of the instrument
+            client_id: Optional id chosen by the client, echoed in fills
+
+        Returns:
+            The resting order
+
+        Raises:
+            ValueError: For an invalid order, one that would cross the book, or too many orders
+        """
+        if side not in SIDES:
+            raise ValueError("side must be 'buy' or 'sell'")
+        if not (math.isfinite(price) and math.isfinite(size)) or price <= 0 or size <= 0:
+            raise ValueError("price and size must be positive numbers")
+        owned = self.owners.get(owner)
+        if owned is not None and len(owned) >= MAX_ORDERS_PER_CLIENT:
+            raise ValueError(f"At most {MAX_ORDERS_PER_CLIENT} resting orders per client")
+        if not book.synced:
+            raise ValueError(f"No order book for {self.symbol} yet")
+        opposite = book.best_ask() if side == 'buy' else book.best_bid()
+        if opposite is not None and (price >= opposite[0] if side == 'buy' else price <= opposite[0]):
+            raise ValueError("Post-only order would cross the book")
+
+        order = PaperOrder(owner, self.symbol, side, price, size, client_id)
+        # Beyond the depth of the book the queue ahead is unknown and taken as empty
+        displayed = (book.bids if side == 'buy' else book.asks).size_at(price)
+        self._side(side).level(price).add(order, displayed or 0.0)
+        self.orders[order.id] = order
+        self.owners.setdefault(owner, {})[order.id] = order
+        self.placed += 1
+        return order
+
+    def cancel(self, order_id: int, owner: Hashable) -> Optional[PaperOrder]:
+        order = self.orders.get(order_id)
+        if order is None or order.owner != owner:
+            return None
+        side = self._side(order.side)
+        level = side.levels[order.price]
+        level.remove(order)
+        side.discard(level)
+        self._forget(order)
+        return order
+
+    def cancel_owner(self, owner: Hashable) -> List[PaperOrder]:
+        """Cancel every order of a client, e.g. when it disconnects."""
+        orders = list(self.owners.get(owner, {}).values())
+        for order in orders:
+            self.cancel(order.id, owner)
+        return orders
+
+    def _forget(self, order: PaperOrder):
+        del self.orders[order.id]
+        owned = self.owners[order.owner]
+        del owned[order.id]
+        if not owned:
+            del self.owners[order.owner]
+
+    def _settle(self, side: BookSideOrders, level: PriceLevel, fills: List[Fill]) -> List[Fill]:
+        for order, quantity in fills:
+            self.fills += 1
+            self.filled_volume += quantity
+            if order.remaining <= EPSILON:
+                self._forget(order)
+        side.discard(level)
+        return fills
+
+    def on_trade(self, price: float, size: float, side: str) -> List[Fill]:
+        """
+        Apply one trade from the feed; `side` is the taker side.
+
+        A sell trade consumes the bid queue at its price and fills every bid
+        above it; a buy trade does the same to the asks.
+        """
+        resting = self.bids if side == 'sell' else self.asks
+        if not resting.prices:
+            return []
+        fills = []
+        for level in resting.through(price, inclusive=False):
+            fills.extend(self._settle(resting, level, level.fill_all()))
+        level = resting.levels.get(price)
+        if level is not None:
+            fills.extend(self._settle(resting, level, level.trade(size)))
+        return fills
+
+    def on_book(self, book, changed: Optional[Dict[str, Collection[float]]] = None) -> List[Fill]:
+        """
+        Follow a book update: shrink queue estimates to the displayed size at
+        the resting prices it changed, then fill orders the opposite touch went through.
+
+        Args:
+            book: OrderBook (or SharedBookView) after the update
+            changed: 'bids'/'asks' -> prices whose displayed size the update changed;
+                every resting price is checked when None, e.g. after a snapshot
+        """
+        for name, displayed, resting in (('bids', book.bids, self.bids), ('asks', book.asks, self.asks)):
+            if changed is None:
+                levels = list(resting.levels.values())
+            else:
+                levels = [resting.levels[price] for price in changed.get(name, ()) if price in resting.levels]
+            for level in levels:
+                size = displayed.size_at(level.price)
+                if size is not None:
+                    level.shrink(size)
+        best_bid = book.best_bid()
+        best_ask = book.best_ask()
+        return self.on_touch(best_bid[0] if best_bid else None, best_ask[0] if best_ask else None)
+
+    def on_touch(self, best_bid: Optional[float], best_ask: Optional[float]) -> List[Fill]:
+        """Fill orders the opposite touch has moved through without a trade at their price."""
+        fills = []
+        if best_ask is not None and self.bids.prices and self.bids.prices[-1] >= best_ask:
+            for level in self.bids.through(best_ask, inclusive=True):
+                fills.extend(self._settle(self.bids, level, level.fill_all()))
+        if best_bid is not None and self.asks.prices and self.asks.prices[0] <= best_bid:
+            for level in self.asks.through(best_bid, inclusive=True):
+                fills.extend(self._settle(self.asks, level, level.fill_all()))
+        return fills
+
+    def stats(self) -> Dict:
+        return {
+            'resting': len(self.orders),
+            'levels': len(self.bids.levels) + len(self.asks.levels),
+            'placed': self.placed,
+            'fills': self.fills,
+            'filled_volume': self.filled_volume
+        }
@@ -0,0 +1,92 @@
+import numpy as np
+from typing import Dict, Iterator, Optional, Sequence
+
+# Flat fee rate per tier used by /api/simulate
+FEE_RATES: Dict[str, float] = {
+    'VIP1': 0.002,
+    'VIP2': 0.0018,
+    'VIP3': 0.0015,
+    'VIP4': 0.0012,
+    'VIP5': 0.001
+}
+DEFAULT_FEE_RATE = 0.002
+
+
+def fee_rates_for(tiers: Sequence[str]) -> np.ndarray:
+    """Map a column of fee tier names to fee rates without a per-row Python loop."""
+    unique_tiers, inverse = np.unique(np.asarray(tiers, dtype=str), return_inverse=True)
+    unique_rates = np.array([FEE_RATES.get(tier, DEFAULT_FEE_RATE) for tier in unique_tiers])
+    return unique_rates[inverse]
+
+
+def build_grid(quantity: Sequence[float],
+               volatility: Sequence[float],
+               fee_tier: Sequence[str]) -> Dict[str, np.ndarray]:
+    """
+    Expand the cartesian product of the given axes into flat columns.
+
+    Returns:
+        Dict with 'quantity', 'volatility' and 'fee' arrays of equal length
+    """
+    q = np.asarray(quantity, dtype=np.float64)
+    v = np.asarray(volatility, dtype=np.float64)
+    f = fee_rates_for(fee_tier)
+    qq, vv, ff = np.meshgrid(q, v, f, indexing='ij')
+    return {
+        'quantity': qq.ravel(),
+        'volatility': vv.ravel(),
+        'fee': ff.ravel()
+    }
+
+
+def simulate_batch(quantity: np.ndarray,
+                   volatility: np.ndarray,
+                   fee_rate: np.ndarray,
+                   impact: Optional[np.ndarray] = None,
+                   taker_prob: Optional[float] = None) -> Dict[str, np.ndarray]:
+    """
+    Vectorized version of the /api/simulate cost model.
+
+    Args:
+        quantity: Trade sizes
+        volatility: Volatilities (0-1), broadcastable against quantity
+        fee_rate: Fee rates, broadcastable against quantity
+        impact: Calibrated market impact as fractions of notional, broadcastable
+            against quantity; the volatility heuristic when omitted
+        taker_prob: Taker probability from the maker/taker classifier; the
+            volatility heuristic when omitted
+
+    Returns:
+        Dict of result columns: slippage, fee, impact, netCost, maker, taker
+    """
+    quantity, volatility, fee_rate = np.broadcast_arrays(
+        np.asarray(quantity, dtype=np.float64),
+        np.asarray(volatility, dtype=np.float64),
+        np.asarray(fee_rate, dtype=np.float64)
+    )
+    slippage = 0.0005 + volatility * 0.001
+    if impact is None:
+        impact = 0.0005 + (quantity / 10000) * volatility
+    else:
+        impact = np.broadcast_to(np.asarray(impact, dtype=np.float64), quantity.shape)
+    net_cost = quantity * (1 + slippage + fee_rate + impact)
+    if taker_prob is None:
+        taker_prob = 0.3 + volatility * 0.4
+    else:
+        taker_prob = np.full(quantity.shape, taker_prob)
+    maker_prob = 1 - taker_prob
+    return {
+        'slippage': slippage,
+        'fee': fee_rate,
+        'impact': impact,
+        'netCost': np.round(net_cost, 2),
+        'maker': np.round(maker_prob, 3),
+        'taker': np.round(taker_prob, 3)
+    }
+
+
+def iter_chunks(columns: Dict[str, np.ndarray], chunk_size: int) -> Iterator[Dict[str, np.ndarray]]:
+    """Yield consecutive row slices of a set of equal-length columns."""
+    rows = len(next(iter(columns.values()))) if columns else 0
+    for start in range(0, rows, chunk_size):
+        yield {name: col[start:start + chunk_size] for name, col in columns.items()}
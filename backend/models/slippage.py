@@ -1,11 +1,125 @@
 import numpy as np
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
+
+
+class BookSnapshot:
+    """
+    Immutable view of an order book with per-side cumulative size and notional.
+
+    The cumulative arrays are built once per book version, after which the
+    fill of any number of order sizes is resolved with a single
+    `searchsorted` per side.
+    """
+
+    def __init__(self, asks: np.ndarray, bids: np.ndarray, version: int = 0):
+        """
+        Args:
+            asks: (n, 2) array of [price, size] rows, best (lowest) first
+            bids: (n, 2) array of [price, size] rows, best (highest) first
+            version: Version of the book the snapshot was taken from
+        """
+        self.version = version
+        self.sides = {
+            'buy': self._prepare(np.asarray(asks, dtype=np.float64).reshape(-1, 2)),
+            'sell': self._prepare(np.asarray(bids, dtype=np.float64).reshape(-1, 2))
+        }
+
+    @classmethod
+    def from_orderbook(cls, book, depth: Optional[int] = None) -> 'BookSnapshot':
+        """Build a snapshot from a live `OrderBook`."""
+        return cls(book.asks.levels(depth), book.bids.levels(depth), book.version)
+
+    @staticmethod
+    def _prepare(levels: np.ndarray) -> Dict[str, np.ndarray]:
+        prices = levels[:, 0].copy()
+        sizes = levels[:, 1].copy()
+        return {
+            'prices': prices,
+            'cum_size': np.cumsum(sizes),
+            'cum_notional': np.cumsum(prices * sizes)
+        }
+
+    def walk(self, quantities, side: str = 'buy') -> Dict[str, np.ndarray]:
+        """
+        Walk the book for every order size at once.
+
+        Args:
+            quantities: Array of order sizes in base currency
+            side: 'buy' walks the asks, 'sell' walks the bids
+
+        Returns:
+            Dict of arrays: avg_price, slippage, levels (levels consumed),
+            filled (quantity that the visible book can fill)
+        """
+        book = self.sides[side]
+        q = np.asarray(quantities, dtype=np.float64)
+        prices, cum_size, cum_notional = book['prices'], book['cum_size'], book['cum_notional']
+        n = len(prices)
+        if n == 0:
+            nan = np.full(q.shape, np.nan)
+            return {'avg_price': nan, 'slippage': nan.copy(), 'levels': np.zeros(q.shape, dtype=np.int64),
+                    'filled': np.zeros(q.shape)}
+
+        idx = np.searchsorted(cum_size, q, side='left')
+        last = np.minimum(idx, n - 1)
+        prev = last - 1
+        size_before = np.where(prev >= 0, cum_size[np.maximum(prev, 0)], 0.0)
+        notional_before = np.where(prev >= 0, cum_notional[np.maximum(prev, 0)], 0.0)
+        filled = np.minimum(q, cum_size[-1])
+        notional = notional_before + (filled - size_before) * prices[last]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            avg_price = notional / filled
+        best = prices[0]
+        if side == 'buy':
+            slippage = (avg_price - best) / best
+        else:
+            slippage = (best - avg_price) / best
+        return {
+            'avg_price': avg_price,
+            'slippage': slippage,
+            'levels': last + 1,
+            'filled': filled
+        }
+
+    def walk_both(self, quantities) -> Dict[str, Dict[str, np.ndarray]]:
+        """Walk both sides of the book for every order size."""
+        return {side: self.walk(quantities, side) for side in ('buy', 'sell')}
+
 
 class SlippageModel:
     def __init__(self):
         # Initialize model parameters
         self.depth_weight = 0.7
         self.volatility_weight = 0.3
+        self._snapshot: Optional[BookSnapshot] = None
+
+    def snapshot(self, book) -> BookSnapshot:
+        """Return a snapshot of `book`, rebuilt only when the book version changes."""
+        if self._snapshot is None or self._snapshot.version != book.version:
+            self._snapshot = BookSnapshot.from_orderbook(book)
+        return self._snapshot
+
+    def slippage_curve(self,
+                       snapshot: BookSnapshot,
+                       volatility: float,
+                       quantities) -> Dict[str, Dict[str, np.ndarray]]:
+        """
+        Slippage estimates for a ladder of order sizes on both sides of the book.
+
+        Args:
+            snapshot: Book snapshot to walk
+            volatility: Market volatility (0-1)
+            quantities: Array of trade sizes in base currency
+
+        Returns:
+            Per side ('buy'/'sell'), the walk results plus the weighted
+            'estimate' combining depth slippage and volatility
+        """
+        curve = snapshot.walk_both(quantities)
+        for result in curve.values():
+            result['estimate'] = (result['slippage'] * self.depth_weight +
+                                  volatility * self.volatility_weight)
+        return curve
         
     def calculate_slippage(self, 
                           orderbook_depth: List[List[float]], 
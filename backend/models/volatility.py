@@ -0,0 +1,168 @@
+import math
+import os
+import numpy as np
+from typing import Dict, Optional
+
+SECONDS_PER_YEAR = 365 * 86400.0
+
+# Horizon name -> half-life in seconds of the estimates for that horizon
+HORIZONS: Dict[str, float] = {
+    '1m': 60.0,
+    '15m': 900.0,
+    '1h': 3600.0,
+    '1d': 86400.0
+}
+ESTIMATORS = ('ewma', 'parkinson', 'garman_klass', 'realized')
+# Seconds per bar for the close-to-close and range estimators
+VOLATILITY_BAR = float(os.getenv('VOLATILITY_BAR', '5'))
+
+_PARKINSON = 1.0 / (4.0 * math.log(2.0))
+_GARMAN_KLASS = 2.0 * math.log(2.0) - 1.0
+
+
+class VolatilityEstimator:
+    """
+    Streaming annualized volatility of one instrument for every estimator and horizon.
+
+    Trades build OHLC bars of `bar_seconds`, each opening at the previous
+    close. Each closed bar adds one variance sample per estimator: squared
+    close-to-close log return ('ewma'), Parkinson's high-low range and
+    Garman-Klass' range with the open-close move. Every trade-to-trade squared log return is a sample
+    of realized variance. Per horizon the samples and the time they cover
+    are both summed with exponential decay, so each estimate is the ratio
+    of two running sums: O(1) per trade, however many trades it spans.
+    """
+
+    def __init__(self, bar_seconds: float = VOLATILITY_BAR, horizons: Optional[Dict[str, float]] = None):
+        """
+        Args:
+            bar_seconds: Bar length for the candle-based estimators
+            horizons: Horizon name -> half-life in seconds, defaults to HORIZONS
+        """
+        horizons = horizons or HORIZONS
+        self.bar_seconds = bar_seconds
+        self.horizons = list(horizons)
+        self.decay_rates = [math.log(2) / half_life for half_life in horizons.values()]
+        # Decayed variance and covered seconds, per estimator and horizon
+        self._variance = [[0.0] * len(horizons) for _ in ESTIMATORS]
+        self._seconds = [[0.0] * len(horizons) for _ in ESTIMATORS]
+        self._last_ts: Optional[float] = None
+        self._last_price: Optional[float] = None
+        self._bar: Optional[float] = None
+        self._open = self._high = self._low = self._close = 0.0
+        # Start of the last bar folded into the estimates
+        self._last_bar: Optional[float] = None
+        self._loaded: Optional[np.ndarray] = None
+
+    def _fold(self, estimator: int, variance: float, seconds: float, elapsed: float):
+        sums = self._variance[estimator]
+        times = self._seconds[estimator]
+        for i, rate in enumerate(self.decay_rates):
+            weight = math.exp(-rate * elapsed)
+            sums[i] = weight * sums[i] + variance
+            times[i] = weight * times[i] + seconds
+
+    def on_trade(self, price: float, ts_ms: float):
+        """Fold one trade into the realized variance and the current bar."""
+        ts = ts_ms / 1000.0
+        if self._last_ts is not None:
+            if ts < self._last_ts:
+                return
+            log_return = math.log(price / self._last_price)
+            elapsed = ts - self._last_ts
+            self._fold(3, log_return * log_return, elapsed, elapsed)
+        self._last_ts = ts
+        self._last_price = price
+
+        bar = ts - ts % self.bar_seconds
+        if bar != self._bar:
+            if self._bar is None:
+                self._bar = bar
+                self._open = self._high = self._low = self._close = price
+                return
+            self._close_bar()
+            # Bars open at the previous close, so the move between bars is not lost
+            self._bar = bar
+            self._open = self._high = self._low = self._close
+        if price > self._high:
+            self._high = price
+        elif price < self._low:
+            self._low = price
+        self._close = price
+
+    def _close_bar(self):
+        # A bar spans from the previous close, however many empty bars lie in between
+        elapsed = self.bar_seconds if self._last_bar is None else self._bar - self._last_bar
+        high_low = math.log(self._high / self._low)
+        close_open = math.log(self._close / self._open)
+        self._fold(0, close_open * close_open, elapsed, elapsed)
+        self._fold(1, _PARKINSON * high_low * high_low, elapsed, elapsed)
+        self._fold(2, 0.5 * high_low * high_low - _GARMAN_KLASS * close_open * close_open, elapsed, elapsed)
+        self._last_bar = self._bar
+
+    def snapshot(self) -> Dict:
+        """Estimator state, for a warm restart."""
+        return {
+            'variance': np.array(self._variance),
+            'seconds': np.array(self._seconds),
+            'last_ts': self._last_ts,
+            'last_price': self._last_price,
+            'bar': [self._bar, self._open, self._high, self._low, self._close],
+            'last_bar': self._last_bar
+        }
+
+    def restore(self, snapshot: Dict):
+        """Load a saved state; sums saved for other horizons are ignored."""
+        if snapshot['variance'].shape == (len(ESTIMATORS), len(self.horizons)):
+            self._variance = snapshot['variance'].tolist()
+            self._seconds = snapshot['seconds'].tolist()
+        self._last_ts = snapshot['last_ts']
+        self._last_price = snapshot['last_price']
+        self._bar, self._open, self._high, self._low, self._close = snapshot['bar']
+        self._last_bar = snapshot['last_bar']
+
+    def estimates(self) -> np.ndarray:
+        """Annualized volatilities, (len(ESTIMATORS), horizons), NaN where there is no sample yet."""
+        if self._loaded is not None:
+            return self._loaded.copy()
+        variance = np.array(self._variance)
+        seconds = np.array(self._seconds)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rate = np.where(seconds > 0, np.maximum(variance, 0.0) / seconds, np.nan)
+        return np.sqrt(rate * SECONDS_PER_YEAR)
+
+    def estimate(self, estimator: str = 'ewma', horizon: str = '15m') -> Optional[float]:
+        """
+        Annualized volatility from one estimator and horizon.
+
+        Until a bar has closed the candle-based estimators have no sample,
+        and the realized volatility from trades is returned instead.
+
+        Returns:
+            Volatility, or None before the second trade
+
+        Raises:
+            ValueError: For an unknown estimator or horizon
+        """
+        if estimator not in ESTIMATORS:
+            raise ValueError(f"Unknown estimator: {estimator}")
+        if horizon not in self.horizons:
+            raise ValueError(f"Unknown horizon: {horizon}")
+        table = self.estimates()
+        column = self.horizons.index(horizon)
+        value = table[ESTIMATORS.index(estimator), column]
+        if math.isnan(value):
+            value = table[ESTIMATORS.index('realized'), column]
+        return None if math.isnan(value) else float(value)
+
+    def to_dict(self) -> Dict[str, Dict[str, Optional[float]]]:
+        table = self.estimates()
+        return {
+            estimator: {horizon: None if math.isnan(value) else float(value)
+                        for horizon, value in zip(self.horizons, row.tolist())}
+            for estimator, row in zip(ESTIMATORS, table)
+        }
+
+    def load(self, estimates: np.ndarray):
+        """Adopt estimates published by the process that sees the trades."""
+        self._loaded = estimates
@@ -0,0 +1,215 @@
+import argparse
+import asyncio
+import glob
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+import numpy as np
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Segment layout: MAGIC, then compressed blocks of
+#   block header: compressed length, raw length, record count
+#   zlib payload: records of (receive ts as f64, frame length as u32, frame bytes)
+MAGIC = b'OKXREC01'
+BLOCK_HEADER = struct.Struct('<III')
+RECORD_HEADER = struct.Struct('<dI')
+
+REPLAY_MODES = ('fast', 'realtime', 'scaled')
+
+
+class FrameRecorder:
+    """
+    Append-only recorder of raw exchange frames with their receive timestamps.
+
+    Frames are buffered into blocks that are zlib-compressed and appended to
+    the current segment file; a new segment starts when the current one
+    reaches `segment_size` bytes. Nothing is ever rewritten, so a crash loses
+    at most the block still in memory.
+    """
+
+    def __init__(self,
+                 directory: str,
+                 block_size: int = 256 * 1024,
+                 segment_size: int = 64 * 1024 * 1024,
+                 level: int = 1):
+        self.directory = directory
+        self.block_size = block_size
+        self.segment_size = segment_size
+        self.level = level
+        self._block = bytearray()
+        self._block_count = 0
+        self._file = None
+        self._segment_bytes = 0
+        self.frames = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _open_segment(self, ts: float):
+        self._close_segment()
+        path = os.path.join(self.directory, f"segment-{int(ts * 1000):015d}.bin")
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+        self._segment_bytes = len(MAGIC)
+        logger.info(f"Recording frames to {path}")
+
+    def _close_segment(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def record(self, frame, receive_ts: Optional[float] = None):
+        """Buffer one raw frame (str or bytes)."""
+        data = frame.encode() if isinstance(frame, str) else frame
+        ts = time.time() if receive_ts is None else receive_ts
+        self._block += RECORD_HEADER.pack(ts, len(data))
+        self._block += data
+        self._block_count += 1
+        self.frames += 1
+        if len(self._block) >= self.block_size:
+            self.flush(ts)
+
+    def flush(self, ts: Optional[float] = None):
+        """Compress and append the pending block to the current segment."""
+        if not self._block_count:
+            return
+        if self._file is None or self._segment_bytes >= self.segment_size:
+            self._open_segment(time.time() if ts is None else ts)
+        payload = zlib.compress(bytes(self._block), self.level)
+        self._file.write(BLOCK_HEADER.pack(len(payload), len(self._block), self._block_count))
+        self._file.write(payload)
+        self._file.flush()
+        self._segment_bytes += BLOCK_HEADER.size + len(payload)
+        self._block.clear()
+        self._block_count = 0
+
+    def close(self):
+        self.flush()
+        self._close_segment()
+
+
+class FrameReader:
+    """Reads recorded segments through memory maps, yielding (receive_ts, frame) in order."""
+
+    def __init__(self, directory: str):
+        self.paths = sorted(glob.glob(os.path.join(directory, 'segment-*.bin')))
+
+    def __iter__(self) -> Iterator[Tuple[float, bytes]]:
+        for path in self.paths:
+            yield from self._read_segment(path)
+
+    @staticmethod
+    def _read_segment(path: str) -> Iterator[Tuple[float, bytes]]:
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size <= len(MAGIC):
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if mm[:len(MAGIC)] != MAGIC:
+                    logger.error(f"Not a frame segment: {path}")
+                    return
+                pos = len(MAGIC)
+                end = len(mm)
+                while pos + BLOCK_HEADER.size <= end:
+                    compressed_len, raw_len, count = BLOCK_HEADER.unpack_from(mm, pos)
+                    pos += BLOCK_HEADER.size
+                    if pos + compressed_len > end:
+                        logger.warning(f"Truncated block at end of {path}")
+                        return
+                    block = zlib.decompress(mm[pos:pos + compressed_len], bufsize=raw_len)
+                    pos += compressed_len
+                    offset = 0
+                    for _ in range(count):
+                        ts, length = RECORD_HEADER.unpack_from(block, offset)
+                        offset += RECORD_HEADER.size
+                        yield ts, block[offset:offset + length]
+                        offset += length
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    values = np.asarray(samples) * 1000
+    p50, p99, p999 = np.percentile(values, [50, 99, 99.9])
+    return {
+        'p50_ms': round(float(p50), 4),
+        'p99_ms': round(float(p99), 4),
+        'p99.9_ms': round(float(p999), 4),
+        'max_ms': round(float(values.max()), 4)
+    }
+
+
+async def replay(directory: str, market_ws, mode: str = 'fast', speed: float = 1.0) -> Dict:
+    """
+    Feed recorded frames through `market_ws.process_market_data` and broadcast.
+
+    Args:
+        directory: Directory holding recorded segments
+        market_ws: MarketDataWebSocket instance to drive
+        mode: 'fast' (no pacing), 'realtime' (original spacing) or 'scaled' (spacing / speed)
+        speed: Speed multiplier for 'scaled' mode
+
+    Returns:
+        Report with message count, messages/sec and per-stage latency percentiles
+    """
+    if mode not in REPLAY_MODES:
+        raise ValueError(f"Unknown replay mode: {mode}")
+    pace = 0.0 if mode == 'fast' else (1.0 if mode == 'realtime' else 1.0 / speed)
+    stages: Dict[str, List[float]] = {'decode': [], 'process': [], 'broadcast': []}
+    messages = 0
+    first_ts = None
+    start = time.perf_counter()
+
+    for receive_ts, frame in FrameReader(directory):
+        if pace:
+            if first_ts is None:
+                first_ts = receive_ts
+            delay = (receive_ts - first_ts) * pace - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        t0 = time.perf_counter()
+        try:
+            data = json.loads(frame)
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to decode recorded frame: {e}")
+            continue
+        t1 = time.perf_counter()
+        processed = await market_ws.process_market_data(data)
+        t2 = time.perf_counter()
+        for message in processed:
+            await market_ws.send_to_clients(message)
+        t3 = time.perf_counter()
+
+        stages['decode'].append(t1 - t0)
+        stages['process'].append(t2 - t1)
+        stages['broadcast'].append(t3 - t2)
+        messages += 1
+
+    elapsed = time.perf_counter() - start
+    return {
+        'mode': mode,
+        'messages': messages,
+        'elapsed_s': round(elapsed, 3),
+        'messages_per_sec': round(messages / elapsed, 1) if elapsed > 0 else 0.0,
+        'stages': {name: _percentiles(samples) for name, samples in stages.items()}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded OKX frames through the ingest pipeline")
+    parser.add_argument('directory', help="Directory with recorded segment-*.bin files")
+    parser.add_argument('--mode', choices=REPLAY_MODES, default='fast')
+    parser.add_argument('--speed', type=float, default=1.0, help="Speed multiplier for scaled mode")
+    args = parser.parse_args()
+
+    from websocket.market_data import MarketDataWebSocket
+    report = asyncio.run(replay(args.directory, MarketDataWebSocket(), args.mode, args.speed))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
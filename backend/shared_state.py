@@ -0,0 +1,584 @@
+import logging
+import os
+import time
+import numpy as np
+from datetime import datetime
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, Dict, List, Optional, Tuple
+from models.impact import ImpactParams
+from models.maker_taker import FEATURE_NAMES, Coefficients
+from models.volatility import ESTIMATORS, HORIZONS
+from tick_store import CANDLE_DTYPE, CANDLE_INTERVALS, TICK_DTYPE, TRADE_DTYPE, RingBuffer
+from websocket.codec import EncodedLevels, decimal_string
+
+logger = logging.getLogger(__name__)
+
+SHARED_STATE_PREFIX = os.getenv('SHARED_STATE_PREFIX', 'trade_simulator')
+# Book levels per side published to API workers
+SHARED_BOOK_DEPTH = int(os.getenv('SHARED_BOOK_DEPTH', '400'))
+# Seconds an API worker waits for the ingest process to create the segments
+SHARED_STATE_TIMEOUT = float(os.getenv('SHARED_STATE_TIMEOUT', '30'))
+# Attempts before a reader gives up waiting for a consistent copy
+READ_RETRIES = 10000
+
+MAGIC = 0x31534D4953444154   # 'TADSIMS1'
+ALIGN = 64
+
+HEADER_DTYPE = np.dtype([('magic', 'u8'), ('size', 'u8'), ('heartbeat', 'f8'),
+                         ('connected', 'i8'), ('messages', 'i8')])
+BOOK_DTYPE = np.dtype([('version', 'i8'), ('ts', 'i8'), ('synced', 'i8'), ('asks', 'i8'), ('bids', 'i8')])
+TICKER_FIELDS = ('last', 'high24h', 'low24h', 'volume24h', 'change24h', 'latency', 'ts',
+                 'bid_px', 'bid_sz', 'ask_px', 'ask_sz')
+TICKER_DTYPE = np.dtype([(name, 'f8') for name in TICKER_FIELDS])
+IMPACT_FIELDS = ImpactParams._fields[:-1]
+MODEL_DTYPE = np.dtype([('impact', 'f8', (len(IMPACT_FIELDS),)), ('impact_version', 'i8'),
+                        ('weights', 'f8', (len(FEATURE_NAMES),)), ('bias', 'f8'),
+                        ('coefficients_version', 'i8'), ('samples', 'i8'),
+                        ('features', 'f8', (len(FEATURE_NAMES),)),
+                        ('volatility', 'f8', (len(ESTIMATORS), len(HORIZONS)))])
+
+
+class _Segment(shared_memory.SharedMemory):
+    """SharedMemory that tolerates views still referencing it when it is garbage collected."""
+
+    def __del__(self):
+        try:
+            self.close()
+        except (BufferError, OSError):
+            # Ring buffers and book views live as long as the process; the OS unmaps at exit
+            pass
+
+
+def _untrack(shm: shared_memory.SharedMemory):
+    # The resource tracker would unlink the segment when this process exits, but the
+    # segments outlive every single process: API workers and ingest restarts reuse them
+    try:
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    except Exception:
+        pass
+
+
+def segment_name(symbol: str) -> str:
+    return f"{SHARED_STATE_PREFIX}_{symbol}"
+
+
+def unlink_segments(symbols: List[str]):
+    """Remove the shared memory segments of the given symbols."""
+    for symbol in symbols:
+        try:
+            shm = shared_memory.SharedMemory(name=segment_name(symbol))
+        except FileNotFoundError:
+            continue
+        shm.close()
+        shm.unlink()
+
+
+class SeqLock:
+    """
+    Single-writer sequence lock over a counter in shared memory.
+
+    The writer makes the counter odd before changing the data it guards and
+    even again afterwards. Readers copy the data and retry if the counter
+    was odd or moved meanwhile, so they never block the writer and never
+    act on a half-written update.
+    """
+
+    def __init__(self, cells: memoryview, index: int = 0):
+        self._cells = cells
+        self._index = index
+
+    @property
+    def sequence(self) -> int:
+        return self._cells[self._index]
+
+    def begin(self):
+        self._cells[self._index] += 1
+
+    def end(self):
+        self._cells[self._index] += 1
+
+    def read(self, copy: Callable[[], object]) -> Tuple[int, object]:
+        """Return (sequence, copy()) for a copy taken while no write was in progress."""
+        cells, index = self._cells, self._index
+        for attempt in range(READ_RETRIES):
+            before = cells[index]
+            if before & 1:
+                if attempt > 100:
+                    time.sleep(0)
+                continue
+            value = copy()
+            if cells[index] == before:
+                return before, value
+        # The writer stopped mid-update (e.g. the ingest process died); serve what is there
+        logger.warning("Shared state writer stalled, reading without a consistent copy")
+        return cells[index], copy()
+
+
+class SharedRingBuffer(RingBuffer):
+    """`RingBuffer` whose records and count live in shared memory, guarded by a seqlock."""
+
+    def __init__(self, data: np.ndarray, cells: memoryview):
+        self.data = data
+        self.capacity = len(data)
+        # cells[0] is the seqlock counter, cells[1] the record count
+        self._cells = cells
+        self.lock = SeqLock(cells, 0)
+
+    @property
+    def count(self) -> int:
+        return self._cells[1]
+
+    @count.setter
+    def count(self, value: int):
+        self._cells[1] = value
+
+    def append(self, record: tuple):
+        self.lock.begin()
+        try:
+            RingBuffer.append(self, record)
+        finally:
+            self.lock.end()
+
+    def replace_last(self, record: tuple):
+        self.lock.begin()
+        try:
+            RingBuffer.replace_last(self, record)
+        finally:
+            self.lock.end()
+
+    def first_ts(self) -> Optional[float]:
+        return self.lock.read(lambda: RingBuffer.first_ts(self))[1]
+
+    def last(self) -> Optional[np.void]:
+        def copy():
+            count = self.count
+            if count == 0:
+                return None
+            index = (count - 1) % self.capacity
+            return self.data[index:index + 1].copy()[0]
+        return self.lock.read(copy)[1]
+
+    def between(self, start_ts: float, end_ts: float) -> np.ndarray:
+        return self.lock.read(lambda: RingBuffer.between(self, start_ts, end_ts))[1]
+
+    def latest(self, end_ts: float, limit: int, end_id: Optional[int] = None) -> np.ndarray:
+        return self.lock.read(lambda: RingBuffer.latest(self, end_ts, limit, end_id))[1]
+
+    def since(self, start: int) -> Tuple[np.ndarray, int]:
+        """Records appended after the first `start`, oldest first, and the current count."""
+        def copy():
+            end = self.count
+            begin = max(start, end - self.capacity)
+            return self.data[np.arange(begin, end) % self.capacity], end
+        return self.lock.read(copy)[1]
+
+    def records(self) -> np.ndarray:
+        return self.lock.read(lambda: RingBuffer.records(self))[1]
+
+    def load(self, records: np.ndarray):
+        self.lock.begin()
+        try:
+            RingBuffer.load(self, records)
+        finally:
+            self.lock.end()
+
+    def reset(self):
+        self.lock.begin()
+        self.data[:] = 0
+        self.count = 0
+        self.lock.end()
+
+
+class SharedBookSide:
+    """Read-only `BookSide` over levels copied from shared memory, best first."""
+
+    def __init__(self, is_bid: bool):
+        self.is_bid = is_bid
+        self._levels = np.zeros((0, 2))
+
+    def __len__(self) -> int:
+        return len(self._levels)
+
+    def best(self) -> Optional[Tuple[float, float]]:
+        if len(self._levels) == 0:
+            return None
+        return float(self._levels[0, 0]), float(self._levels[0, 1])
+
+    def size_at(self, price: float) -> Optional[float]:
+        if len(self._levels) == 0:
+            return None
+        prices = self._levels[:, 0]
+        hits = np.flatnonzero(prices == price)
+        if hits.size:
+            return float(self._levels[hits[0], 1])
+        worst = prices[-1]
+        return None if (price < worst if self.is_bid else price > worst) else 0.0
+
+    def prices(self, depth: Optional[int] = None) -> np.ndarray:
+        return self._levels[:depth, 0]
+
+    def sizes(self, depth: Optional[int] = None) -> np.ndarray:
+        return self._levels[:depth, 1].copy()
+
+    def levels(self, depth: Optional[int] = None) -> np.ndarray:
+        return self._levels[:depth].copy()
+
+    def raw_levels(self, depth: int) -> List[Tuple[str, str]]:
+        return [(decimal_string(price), decimal_string(size)) for price, size in self._levels[:depth].tolist()]
+
+
+class SharedBookView:
+    """
+    Read-only stand-in for `OrderBook` in API workers, loaded from the ingest process's book.
+
+    Exposes the read API used by the endpoints and the slippage model;
+    `version` follows the ingest book, so per-version caches keep working.
+    """
+
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+        self.bids = SharedBookSide(is_bid=True)
+        self.asks = SharedBookSide(is_bid=False)
+        self.seq_id: Optional[int] = None
+        self.ts = 0
+        self.version = 0
+        self.synced = False
+        self.needs_resync = False
+        self.checksum_failures = 0
+        self._encoded: Optional[Tuple[int, int, Dict[str, EncodedLevels]]] = None
+
+    def load(self, version: int, ts: int, synced: bool, asks: np.ndarray, bids: np.ndarray):
+        self.version = version
+        self.ts = ts
+        self.synced = synced
+        self.asks._levels = asks
+        self.bids._levels = bids
+
+    def best_bid(self) -> Optional[Tuple[float, float]]:
+        return self.bids.best()
+
+    def best_ask(self) -> Optional[Tuple[float, float]]:
+        return self.asks.best()
+
+    def mid_price(self) -> Optional[float]:
+        bid = self.bids.best()
+        ask = self.asks.best()
+        if bid is None or ask is None:
+            return None
+        return (bid[0] + ask[0]) / 2
+
+    def encoded_levels(self, depth: int = 20) -> Dict[str, EncodedLevels]:
+        if self._encoded is None or self._encoded[0] != self.version or self._encoded[1] != depth:
+            levels = {
+                'asks': EncodedLevels(self.asks.raw_levels(depth)),
+                'bids': EncodedLevels(self.bids.raw_levels(depth))
+            }
+            self._encoded = (self.version, depth, levels)
+        return self._encoded[2]
+
+    def to_dict(self, depth: Optional[int] = 20) -> Dict[str, List[List[float]]]:
+        return {
+            'asks': self.asks.levels(depth).tolist(),
+            'bids': self.bids.levels(depth).tolist()
+        }
+
+
+class SharedSymbolState:
+    """
+    Market state of one symbol in a shared memory segment.
+
+    The ingest process (`owner`) writes the book, the latest ticker, the
+    calibrated model parameters and the tick store's ring buffers; API
+    workers attach to the same segment and read them in place. Every
+    section is guarded by its own seqlock, so readers never wait on the
+    writer and never see a torn update.
+    """
+
+    def __init__(self, symbol: str, tick_capacity: int, trade_capacity: int, owner: bool):
+        """
+        Args:
+            symbol: Instrument id
+            tick_capacity: Tick ring buffer size; must match between processes
+            trade_capacity: Trade ring buffer size; must match between processes
+            owner: Create (or take over) the segment as the writer, instead of attaching to it
+
+        Raises:
+            RuntimeError: If a reader cannot find the segment, or finds one with another layout
+        """
+        self.symbol = symbol
+        self.owner = owner
+        self.name = segment_name(symbol)
+        self._sections: Dict[str, Tuple[int, np.dtype, tuple]] = {}
+        self.size = 0
+        self._add('header', HEADER_DTYPE, (1,))
+        self._add('locks', 'u8', (3,))
+        self._add('book', BOOK_DTYPE, (1,))
+        self._add('book_asks', 'f8', (SHARED_BOOK_DEPTH, 2))
+        self._add('book_bids', 'f8', (SHARED_BOOK_DEPTH, 2))
+        self._add('ticker', TICKER_DTYPE, (1,))
+        self._add('models', MODEL_DTYPE, (1,))
+        self._rings = [('ticks', TICK_DTYPE, tick_capacity), ('trades', TRADE_DTYPE, trade_capacity)] + [
+            (f"candles_{name}", CANDLE_DTYPE, capacity) for name, (_, capacity) in CANDLE_INTERVALS.items()
+        ]
+        for name, dtype, capacity in self._rings:
+            self._add(f"{name}_cells", 'u8', (2,))
+            self._add(name, dtype, (capacity,))
+
+        self._shm = self._open()
+        buf = self._shm.buf
+        self.header = self._view('header')[0]
+        offset = self._sections['locks'][0]
+        locks = buf[offset:offset + 24].cast('Q')
+        self.book_lock, self.ticker_lock, self.models_lock = (SeqLock(locks, i) for i in range(3))
+        self.book_meta = self._view('book')
+        self.book_asks = self._view('book_asks')
+        self.book_bids = self._view('book_bids')
+        self.ticker = self._view('ticker')
+        self.models = self._view('models')
+        self.rings: Dict[str, SharedRingBuffer] = {}
+        for name, _, _ in self._rings:
+            offset = self._sections[f"{name}_cells"][0]
+            self.rings[name] = SharedRingBuffer(self._view(name), buf[offset:offset + 16].cast('Q'))
+        if owner:
+            self._initialize()
+
+        # Writer: last published versions; reader: last seen sequences
+        self._published = (None, None)
+        self._seen_book = self._seen_ticker = self._seen_models = None
+        self._seen_trades: Optional[int] = None
+
+    def _add(self, name: str, dtype, shape: tuple):
+        dtype = np.dtype(dtype)
+        self._sections[name] = (self.size, dtype, shape)
+        nbytes = dtype.itemsize * int(np.prod(shape))
+        self.size += -(-nbytes // ALIGN) * ALIGN
+
+    def _view(self, name: str) -> np.ndarray:
+        offset, dtype, shape = self._sections[name]
+        return np.ndarray(shape, dtype=dtype, buffer=self._shm.buf, offset=offset)
+
+    def _valid(self, shm: shared_memory.SharedMemory) -> bool:
+        if shm.size < self.size:
+            return False
+        header = np.ndarray((1,), dtype=HEADER_DTYPE, buffer=shm.buf)[0]
+        valid = int(header['magic']) == MAGIC and int(header['size']) == self.size
+        del header
+        return valid
+
+    def _open(self) -> shared_memory.SharedMemory:
+        if self.owner:
+            try:
+                shm = _Segment(name=self.name, create=True, size=self.size)
+            except FileExistsError:
+                shm = _Segment(name=self.name)
+                if shm.size < self.size:
+                    # Left over with another layout; readers of the old one must be restarted
+                    logger.warning(f"Recreating shared state {self.name} with a new layout")
+                    _untrack(shm)
+                    shm.close()
+                    shm.unlink()
+                    shm = _Segment(name=self.name, create=True, size=self.size)
+            _untrack(shm)
+            return shm
+
+        deadline = time.monotonic() + SHARED_STATE_TIMEOUT
+        while True:
+            try:
+                shm = _Segment(name=self.name)
+                _untrack(shm)
+                if self._valid(shm):
+                    return shm
+                shm.close()
+            except FileNotFoundError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"No shared market state {self.name}; start the ingest process "
+                                   f"(python -m ingest) with the same INSTRUMENTS and buffer sizes")
+            time.sleep(0.5)
+
+    def _initialize(self):
+        # Sections are cleared under their locks, so attached readers see a clean reset
+        for lock, views in ((self.book_lock, (self.book_meta, self.book_asks, self.book_bids)),
+                            (self.ticker_lock, (self.ticker,)),
+                            (self.models_lock, (self.models,))):
+            lock.begin()
+            for view in views:
+                view[...] = 0
+            if lock is self.models_lock:
+                # No volatility estimate until the first trades
+                self.models['volatility'] = np.nan
+            lock.end()
+        for ring in self.rings.values():
+            ring.reset()
+        self.header['size'] = self.size
+        self.header['magic'] = MAGIC
+
+    def ring(self, name: str, dtype: np.dtype, capacity: int) -> SharedRingBuffer:
+        """Ring buffer factory for `TickStore`."""
+        ring = self.rings[name]
+        if ring.data.dtype != dtype or ring.capacity != capacity:
+            raise ValueError(f"Shared ring {name} does not match {dtype} x {capacity}")
+        return ring
+
+    # Writer (ingest process)
+
+    def publish(self, state, message: Optional[dict] = None):
+        """Write whatever changed in `state`, plus the ticker if `message` is one."""
+        book = state.book
+        if (book.version, book.synced) != self._published:
+            asks = book.asks.levels(SHARED_BOOK_DEPTH)
+            bids = book.bids.levels(SHARED_BOOK_DEPTH)
+            self.book_lock.begin()
+            meta = self.book_meta[0]
+            meta['version'] = book.version
+            meta['ts'] = book.ts
+            meta['synced'] = book.synced
+            meta['asks'] = len(asks)
+            meta['bids'] = len(bids)
+            self.book_asks[:len(asks)] = asks
+            self.book_bids[:len(bids)] = bids
+            self.book_lock.end()
+            self._published = (book.version, book.synced)
+
+        impact = state.impact_model.params
+        coefficients = state.maker_taker.coefficients
+        self.models_lock.begin()
+        models = self.models[0]
+        if (impact.version if impact else 0) != models['impact_version']:
+            models['impact'] = impact[:-1]
+            models['impact_version'] = impact.version
+        if coefficients is not None and coefficients.version != models['coefficients_version']:
+            models['weights'] = coefficients.weights
+            models['bias'] = coefficients.bias
+            models['samples'] = coefficients.samples
+            models['coefficients_version'] = coefficients.version
+        models['features'] = state.maker_taker.features()
+        models['volatility'] = state.volatility.estimates()
+        self.models_lock.end()
+
+        if message is not None and message.get('type') == 'ticker':
+            self._publish_ticker(message)
+
+    def _publish_ticker(self, message: dict):
+        asks, bids = message.get('asks') or (), message.get('bids') or ()
+        ask, bid = (asks[0] if asks else ('0', '0')), (bids[0] if bids else ('0', '0'))
+        # Exchange time of the update in epoch seconds
+        ts = message.get('ts', time.time() * 1000) / 1000
+        values = (message.get('price'), message.get('high24h'), message.get('low24h'), message.get('volume24h'),
+                  message.get('change24h'), message.get('latency'), ts, bid[0], bid[1], ask[0], ask[1])
+        self.ticker_lock.begin()
+        self.ticker[0] = tuple(float(value or 0) for value in values)
+        self.ticker_lock.end()
+
+    def heartbeat(self, connected: bool, messages: int):
+        self.header['heartbeat'] = time.time()
+        self.header['connected'] = connected
+        self.header['messages'] = messages
+
+    # Reader (API workers)
+
+    def follow(self, state, depth: int) -> List[dict]:
+        """
+        Load changes published since the last call into `state` and return them as client messages.
+
+        Args:
+            state: This worker's `SymbolState`, whose book is a `SharedBookView`
+            depth: Book levels per side in ticker and order book messages
+
+        Returns:
+            Order book, trade and ticker messages in the format of the ingest handlers
+        """
+        messages = []
+        book = state.book
+        if self.book_lock.sequence != self._seen_book:
+            def copy():
+                meta = self.book_meta.copy()[0]
+                return meta, self.book_asks[:meta['asks']].copy(), self.book_bids[:meta['bids']].copy()
+            self._seen_book, (meta, asks, bids) = self.book_lock.read(copy)
+            version = int(meta['version'])
+            changed = version != book.version
+            book.load(version, int(meta['ts']), bool(meta['synced']), asks, bids)
+            if changed and book.synced:
+                levels = book.encoded_levels(depth)
+                messages.append({
+                    'type': 'orderbook',
+                    'timestamp': datetime.fromtimestamp(book.ts / 1000).isoformat(),
+                    'exchange': 'OKX',
+                    'symbol': self.symbol,
+                    'asks': levels['asks'],
+                    'bids': levels['bids']
+                })
+
+        if self.models_lock.sequence != self._seen_models:
+            self._seen_models, models = self.models_lock.read(lambda: self.models.copy()[0])
+            impact_version = int(models['impact_version'])
+            if impact_version and (state.impact_model.params is None
+                                   or state.impact_model.params.version != impact_version):
+                state.impact_model.params = ImpactParams(*models['impact'].tolist(), impact_version)
+            coefficients_version = int(models['coefficients_version'])
+            coefficients = state.maker_taker.coefficients
+            if coefficients_version and (coefficients is None or coefficients.version != coefficients_version):
+                coefficients = Coefficients(models['weights'].copy(), float(models['bias']),
+                                            coefficients_version, int(models['samples']))
+            state.maker_taker.load(coefficients, models['features'])
+            state.volatility.load(models['volatility'])
+
+        trades = self.rings['trades']
+        if self._seen_trades is None or trades.count < self._seen_trades:
+            # Trades are streamed from the moment of attaching, not replayed
+            self._seen_trades = trades.count
+        elif trades.count != self._seen_trades:
+            records, self._seen_trades = trades.since(self._seen_trades)
+            for ts, price, size, side, _ in records.tolist():
+                messages.append({
+                    'type': 'trade',
+                    'timestamp': datetime.fromtimestamp(ts).isoformat(),
+                    'symbol': self.symbol,
+                    'price': decimal_string(price),
+                    'size': decimal_string(size),
+                    'side': 'buy' if side > 0 else 'sell'
+                })
+
+        if self.ticker_lock.sequence != self._seen_ticker:
+            self._seen_ticker, ticker = self.ticker_lock.read(lambda: self.ticker.copy()[0])
+            if ticker['ts'] > 0:
+                messages.append(self._ticker_message(ticker, book, depth))
+        return messages
+
+    def _ticker_message(self, ticker: np.void, book: SharedBookView, depth: int) -> dict:
+        if book.synced:
+            orderbook = book.encoded_levels(depth)
+        else:
+            orderbook = {
+                'asks': EncodedLevels([(decimal_string(ticker['ask_px']), decimal_string(ticker['ask_sz']))]),
+                'bids': EncodedLevels([(decimal_string(ticker['bid_px']), decimal_string(ticker['bid_sz']))])
+            }
+        return {
+            'type': 'ticker',
+            'timestamp': datetime.fromtimestamp(ticker['ts']).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            'exchange': 'OKX',
+            'symbol': self.symbol,
+            'price': decimal_string(ticker['last']),
+            'high24h': decimal_string(ticker['high24h']),
+            'low24h': decimal_string(ticker['low24h']),
+            'volume24h': decimal_string(ticker['volume24h']),
+            'change24h': str(round(float(ticker['change24h']), 2)),
+            'asks': orderbook['asks'],
+            'bids': orderbook['bids'],
+            'latency': str(round(float(ticker['latency']), 2)),
+            'ts': int(round(ticker['ts'] * 1000))
+        }
+
+    def ingest_status(self) -> Dict[str, float]:
+        return {
+            'heartbeat': float(self.header['heartbeat']),
+            'connected': int(self.header['connected']),
+            'messages': int(self.header['messages'])
+        }
+
+    def close(self):
+        # Views into the segment may still be referenced; the mapping goes away with the process
+        try:
+            self._shm.close()
+        except BufferError:
+            pass
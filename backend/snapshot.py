@@ -0,0 +1,248 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', 'snapshot')
+# Seconds between snapshots of the hot state
+SNAPSHOT_INTERVAL = float(os.getenv('SNAPSHOT_INTERVAL', '30'))
+# Snapshots older than this many seconds are not restored
+SNAPSHOT_MAX_AGE = float(os.getenv('SNAPSHOT_MAX_AGE', '3600'))
+# Order books are restored only from snapshots younger than this many seconds, and are cleared
+# once the snapshot is this old if no exchange update has replaced them by then
+SNAPSHOT_BOOK_MAX_AGE = float(os.getenv('SNAPSHOT_BOOK_MAX_AGE', '10'))
+SNAPSHOT_FORMAT = 1
+
+# Section name -> values; arrays are saved as .npy files, bytes as .bin files, anything else as JSON
+Sections = Dict[str, Dict]
+
+
+def write_sections(directory: str, sections: Sections) -> int:
+    """
+    Write a snapshot into `directory`, replacing the previous one.
+
+    The files are written to a temporary directory that is then renamed
+    into place; until the swap completes the previous snapshot is still
+    found as `directory` or `{directory}.old`.
+
+    Returns:
+        Bytes written
+    """
+    tmp = f'{directory}.tmp'
+    old = f'{directory}.old'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    meta = {'format': SNAPSHOT_FORMAT, 'saved': time.time(), 'sections': {}}
+    size = 0
+    for section, values in sections.items():
+        fields = meta['sections'][section] = {}
+        for key, value in values.items():
+            if isinstance(value, np.ndarray):
+                name = f'{section}.{key}.npy'
+                np.save(os.path.join(tmp, name), value)
+                fields[key] = {'npy': name}
+                size += value.nbytes
+            elif isinstance(value, bytes):
+                name = f'{section}.{key}.bin'
+                with open(os.path.join(tmp, name), 'wb') as f:
+                    f.write(value)
+                fields[key] = {'bin': name}
+                size += len(value)
+            else:
+                fields[key] = {'value': value}
+    with open(os.path.join(tmp, 'state.json'), 'w') as f:
+        json.dump(meta, f)
+
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(directory):
+        os.rename(directory, old)
+    os.rename(tmp, directory)
+    shutil.rmtree(old, ignore_errors=True)
+    return size
+
+
+def read_sections(directory: str) -> Optional[Tuple[float, Sections]]:
+    """
+    Open the snapshot in `directory` (or the one left behind by an interrupted swap).
+
+    Arrays are memory-mapped, so nothing is read until they are copied
+    into the live state.
+
+    Returns:
+        (save time, sections), or None if there is no readable snapshot
+    """
+    for path in (directory, f'{directory}.old'):
+        try:
+            with open(os.path.join(path, 'state.json')) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if meta.get('format') != SNAPSHOT_FORMAT:
+            return None
+        sections = {}
+        for section, fields in meta['sections'].items():
+            values = sections[section] = {}
+            for key, field in fields.items():
+                if 'npy' in field:
+                    values[key] = np.load(os.path.join(path, field['npy']), mmap_mode='r')
+                elif 'bin' in field:
+                    with open(os.path.join(path, field['bin']), 'rb') as f:
+                        values[key] = f.read()
+                else:
+                    values[key] = field['value']
+        return meta['saved'], sections
+    return None
+
+
+class StateSnapshotter:
+    """
+    Periodic snapshots of each symbol's hot state, restored on the next start.
+
+    A snapshot holds the order book, the tick store's ring buffers and the
+    state of the impact, maker/taker and volatility models, so a restarted
+    process serves books, candles and calibrated estimates at once instead
+    of after the feed has refilled its windows. State is copied on the
+    event loop and written on a worker thread.
+    """
+
+    def __init__(self, symbols: Dict, root: str = SNAPSHOT_DIR,
+                 interval: float = SNAPSHOT_INTERVAL, max_age: float = SNAPSHOT_MAX_AGE,
+                 book_max_age: float = SNAPSHOT_BOOK_MAX_AGE):
+        """
+        Args:
+            symbols: Symbol -> SymbolState to snapshot and restore
+            root: Directory holding one snapshot directory per symbol
+            interval: Seconds between snapshots
+            max_age: Seconds after which a snapshot is too stale to restore
+            book_max_age: Seconds after which a snapshot's order book is too stale to serve
+        """
+        self.symbols = symbols
+        self.root = root
+        self.interval = interval
+        self.max_age = max_age
+        self.book_max_age = book_max_age
+        self.saved_at = 0.0
+        self.saved_bytes = 0
+        self.last_save_seconds = 0.0
+        self.restored: Dict[str, float] = {}
+        # Symbol -> (expiry time, version) of books restored from a snapshot
+        self._restored_books: Dict[str, Tuple[float, int]] = {}
+        self._task = None
+        self._expiry_task = None
+
+    def _directory(self, symbol: str) -> str:
+        return os.path.join(self.root, symbol)
+
+    @staticmethod
+    def capture(state) -> Sections:
+        """Copy the hot state of one symbol."""
+        return {
+            'book': state.book.snapshot(),
+            'ticks': state.tick_store.snapshot(),
+            'impact': state.impact_model.snapshot(),
+            'maker_taker': state.maker_taker.snapshot(),
+            'volatility': state.volatility.snapshot()
+        }
+
+    @staticmethod
+    def apply(state, sections: Sections, book: bool = True):
+        """Load saved state into a freshly created SymbolState, leaving out the book unless `book`."""
+        if book:
+            state.book.restore(sections['book'])
+        state.tick_store.restore(sections['ticks'])
+        state.impact_model.restore(sections['impact'])
+        state.maker_taker.restore(sections['maker_taker'])
+        state.volatility.restore(sections['volatility'])
+        if state.shared:
+            state.shared.publish(state)
+
+    def restore(self) -> int:
+        """Restore every symbol with a recent enough snapshot; returns how many were restored."""
+        now = time.time()
+        for symbol, state in self.symbols.items():
+            try:
+                snapshot = read_sections(self._directory(symbol))
+                if snapshot is None:
+                    continue
+                saved, sections = snapshot
+                if now - saved > self.max_age:
+                    logger.info(f"Snapshot of {symbol} is {now - saved:.0f}s old, starting cold")
+                    continue
+                book = now - saved <= self.book_max_age
+                self.apply(state, sections, book)
+                self.restored[symbol] = saved
+                if book and state.book.synced:
+                    self._restored_books[symbol] = (saved + self.book_max_age, state.book.version)
+                logger.info(f"Restored {symbol} from a snapshot taken {now - saved:.1f}s ago"
+                            f"{'' if book else ', without its order book'}")
+            except Exception as e:
+                logger.warning(f"Could not restore {symbol} from its snapshot: {e}")
+        return len(self.restored)
+
+    async def save(self):
+        """Snapshot every symbol."""
+        started = time.perf_counter()
+        captured = {symbol: self.capture(state) for symbol, state in self.symbols.items()}
+        sizes = await asyncio.to_thread(
+            lambda: [write_sections(self._directory(symbol), sections) for symbol, sections in captured.items()])
+        self.saved_bytes = sum(sizes)
+        self.saved_at = time.time()
+        self.last_save_seconds = time.perf_counter() - started
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+        if self._restored_books and self._expiry_task is None:
+            self._expiry_task = asyncio.create_task(self.expire_books())
+
+    async def expire_books(self):
+        """Clear restored books that no exchange update has replaced by the time they are too old."""
+        for symbol, (expires, version) in sorted(self._restored_books.items(), key=lambda item: item[1][0]):
+            await asyncio.sleep(max(0.0, expires - time.time()))
+            state = self.symbols[symbol]
+            if state.book.version == version:
+                state.book.reset()
+                if state.shared:
+                    state.shared.publish(state)
+                logger.info(f"Cleared the restored order book of {symbol}: no exchange update yet")
+        self._restored_books.clear()
+
+    async def stop(self):
+        """Stop the periodic task and take a final snapshot."""
+        if self._expiry_task:
+            self._expiry_task.cancel()
+            self._expiry_task = None
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.save()
+        except Exception as e:
+            logger.error(f"Final state snapshot failed: {e}")
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.save()
+            except Exception as e:
+                logger.error(f"State snapshot failed: {e}")
+
+    def gauges(self) -> List[tuple]:
+        return [
+            ('snapshot_age_seconds', 'gauge', 'Seconds since the last state snapshot',
+             [({}, round(time.time() - self.saved_at, 3) if self.saved_at else -1)]),
+            ('snapshot_bytes', 'gauge', 'Size of the last state snapshot', [({}, self.saved_bytes)]),
+            ('snapshot_last_save_seconds', 'gauge', 'Duration of the last state snapshot',
+             [({}, round(self.last_save_seconds, 3))])
+        ]
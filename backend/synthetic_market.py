@@ -0,0 +1,509 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+import numpy as np
+from operator import itemgetter
+from typing import Callable, Dict, List, Optional, Tuple
+from websocket.orderbook import OrderBook
+
+logger = logging.getLogger(__name__)
+
+# Defaults of the offline fallback; capacity tests pass their own rates
+SIMULATION_SEED = os.getenv('SIMULATION_SEED')
+SIMULATION_TRADE_RATE = float(os.getenv('SIMULATION_TRADE_RATE', '5'))
+SIMULATION_BOOK_RATE = float(os.getenv('SIMULATION_BOOK_RATE', '20'))
+SIMULATION_TICKER_INTERVAL = float(os.getenv('SIMULATION_TICKER_INTERVAL', '0.5'))
+
+RUN_MODES = ('fast', 'realtime', 'scaled')
+
+Event = Tuple[float, dict]
+
+
+class _Pool:
+    """Random draws made in vectorized blocks and handed out a few at a time, as Python scalars."""
+
+    def __init__(self, draw: Callable[[int], np.ndarray], block: int = 4096):
+        self._draw = draw
+        self._block = block
+        self._values = draw(block).tolist()
+        self._pos = 0
+
+    def take(self, n: int) -> list:
+        if self._pos + n > len(self._values):
+            self._values = self._values[self._pos:] + self._draw(max(self._block, n)).tolist()
+            self._pos = 0
+        values = self._values[self._pos:self._pos + n]
+        self._pos += n
+        return values
+
+    def one(self):
+        if self._pos == len(self._values):
+            self._values = self._draw(self._block).tolist()
+            self._pos = 0
+        value = self._values[self._pos]
+        self._pos += 1
+        return value
+
+
+class PriceProcess:
+    """
+    Mid price following geometric Brownian motion with Merton jumps.
+
+    The log price moves by (drift - volatility^2 / 2) dt + volatility dW, plus a
+    normal jump of mean `jump_mean` and deviation `jump_std` at the arrivals of
+    a Poisson process with `jump_rate` jumps per second. Sampling the path at
+    arbitrary event times is exact, so a batch of times costs a few vector ops.
+    """
+
+    def __init__(self, rng: np.random.Generator, price: float, volatility: float, drift: float = 0.0,
+                 jump_rate: float = 0.0, jump_mean: float = 0.0, jump_std: float = 0.0):
+        """
+        Args:
+            rng: Random generator
+            price: Starting price
+            volatility: Log-price volatility per sqrt(second)
+            drift: Log-price drift per second
+            jump_rate: Jumps per second
+            jump_mean: Mean log-price jump
+            jump_std: Standard deviation of the log-price jump
+        """
+        self.rng = rng
+        self.price = price
+        self.volatility = volatility
+        self.drift = drift
+        self.jump_rate = jump_rate
+        self.jump_mean = jump_mean
+        self.jump_std = jump_std
+        self.t = 0.0
+
+    def sample(self, times: np.ndarray) -> np.ndarray:
+        """Prices at increasing `times` (seconds, not before the previous sample)."""
+        if len(times) == 0:
+            return np.empty(0)
+        dt = np.diff(times, prepend=self.t)
+        returns = (self.drift - 0.5 * self.volatility ** 2) * dt \
+            + self.volatility * np.sqrt(dt) * self.rng.standard_normal(len(dt))
+        if self.jump_rate > 0:
+            jumps = self.rng.poisson(self.jump_rate * dt)
+            returns += jumps * self.jump_mean + np.sqrt(jumps) * self.jump_std * self.rng.standard_normal(len(dt))
+        prices = self.price * np.exp(np.cumsum(returns))
+        self.price = float(prices[-1])
+        self.t = float(times[-1])
+        return prices
+
+
+class HawkesProcess:
+    """
+    Self-exciting trade arrivals: a Hawkes process with an exponential kernel.
+
+    Simulated through its branching structure: background arrivals are
+    Poisson at `rate * (1 - branching)`, and every arrival has
+    Poisson(`branching`) children delayed by Exp(`decay`), so the long-run
+    rate is `rate`. Each generation is drawn with a few vector operations.
+    Children falling after the current window are kept for the next one.
+    Children repeat their parent's side with probability `persistence`,
+    which produces runs of same-side trades.
+    """
+
+    def __init__(self, rng: np.random.Generator, rate: float, branching: float = 0.7, decay: float = 20.0,
+                 persistence: float = 0.8):
+        if not 0 <= branching < 1:
+            raise ValueError("branching must be in [0, 1)")
+        self.rng = rng
+        self.baseline = rate * (1 - branching)
+        self.branching = branching
+        self.decay = decay
+        self.persistence = persistence
+        self._pending_times = np.empty(0)
+        self._pending_sides = np.empty(0, dtype=np.int8)
+
+    def _sides(self, n: int) -> np.ndarray:
+        return np.where(self.rng.random(n) < 0.5, 1, -1).astype(np.int8)
+
+    def window(self, start: float, end: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Arrival times in [start, end) and their sides (1 buy, -1 sell), in time order."""
+        count = self.rng.poisson(self.baseline * (end - start))
+        due = self._pending_times < end
+        times = np.concatenate([start + self.rng.random(count) * (end - start), self._pending_times[due]])
+        sides = np.concatenate([self._sides(count), self._pending_sides[due]])
+        pending_times, pending_sides = [self._pending_times[~due]], [self._pending_sides[~due]]
+
+        all_times, all_sides = [], []
+        while len(times):
+            all_times.append(times)
+            all_sides.append(sides)
+            children = self.rng.poisson(self.branching, len(times))
+            times = np.repeat(times, children) + self.rng.exponential(1.0 / self.decay, children.sum())
+            sides = np.repeat(sides, children)
+            switch = self.rng.random(len(sides)) >= self.persistence
+            sides = np.where(switch, self._sides(len(sides)), sides)
+            late = times >= end
+            pending_times.append(times[late])
+            pending_sides.append(sides[late])
+            times, sides = times[~late], sides[~late]
+
+        self._pending_times = np.concatenate(pending_times)
+        self._pending_sides = np.concatenate(pending_sides)
+        if not all_times:
+            return np.empty(0), np.empty(0, dtype=np.int8)
+        times, sides = np.concatenate(all_times), np.concatenate(all_sides)
+        order = np.argsort(times, kind='stable')
+        return times[order], sides[order]
+
+
+class SyntheticInstrument:
+    """
+    Trades, L2 book and tickers of one instrument, produced as OKX-shaped pushes.
+
+    Each side of the book is a dense grid of `levels` ticks from its touch,
+    with sizes in lots (0 for an empty level). The touch follows the price
+    process: the best bid is the price rounded down to a tick, the best ask
+    one or more ticks above it. Moving the touch shifts the grid, so levels
+    that left it are deleted and new ones are filled in. Trades execute at
+    the touch of the side they take, using its size; an exhausted touch is
+    refilled. Book events also change the sizes of a few levels near the
+    touch, cancelling some entirely. Every change is sent as an
+    incremental update carrying seqId/prevSeqId, after a first snapshot.
+    """
+
+    def __init__(self, symbol: str, rng: np.random.Generator, price: float = 45000.0,
+                 tick: float = 0.1, lot: float = 0.001, levels: int = 400,
+                 trade_rate: float = 100.0, book_rate: float = 400.0, ticker_interval: float = 0.1,
+                 volatility: float = 0.0002, jump_rate: float = 0.002, jump_std: float = 0.002,
+                 branching: float = 0.7, decay: float = 20.0, level_size: float = 2.0, trade_size: float = 0.05,
+                 checksum: bool = False):
+        self.symbol = symbol
+        self.rng = rng
+        self.tick = tick
+        self.lot = lot
+        self.levels = levels
+        self.book_rate = book_rate
+        self.ticker_interval = ticker_interval
+        self._px_decimals = max(0, -int(np.floor(np.log10(tick) + 1e-9)))
+        self._sz_decimals = max(0, -int(np.floor(np.log10(lot) + 1e-9)))
+        self.price = PriceProcess(rng, price, volatility, jump_rate=jump_rate, jump_std=jump_std)
+        self.trades = HawkesProcess(rng, trade_rate, branching, decay)
+        self._level_sizes = _Pool(lambda n: np.maximum(1, rng.lognormal(np.log(level_size / lot), 0.8, n))
+                                  .astype(np.int64))
+        self._trade_sizes = _Pool(lambda n: np.maximum(1, rng.lognormal(np.log(trade_size / lot), 1.0, n))
+                                  .astype(np.int64))
+        # Book event changes: level offset from the touch (mostly near it) and whether it is a cancel
+        self._offsets = _Pool(lambda n: np.minimum(rng.geometric(0.15, n) - 1, levels - 1))
+        self._uniform = _Pool(lambda n: rng.random(n))
+        self.mirror = OrderBook(symbol) if checksum else None
+
+        self.bid = int(np.floor(price / tick))
+        self.ask = self.bid + 1
+        self.bids = np.array(self._level_sizes.take(levels), dtype=np.int64)
+        self.asks = np.array(self._level_sizes.take(levels), dtype=np.int64)
+        self.seq_id = 0
+        self.trade_id = 0
+        self.next_ticker = 0.0
+        self.open = price
+        self.high = price
+        self.low = price
+        self.volume = 0.0
+        self.last_trade = (price, self.lot)
+        self.started = False
+
+    def _px(self, ticks: int) -> str:
+        return f"{ticks * self.tick:.{self._px_decimals}f}"
+
+    def _sz(self, lots: int) -> str:
+        return f"{lots * self.lot:.{self._sz_decimals}f}"
+
+    def _levels(self, changes: Dict[int, int]) -> List[List[str]]:
+        return [[self._px(px), self._sz(sz), '0', '1' if sz else '0'] for px, sz in changes.items()]
+
+    def _envelope(self, channel: str, data: List[dict], action: Optional[str] = None) -> dict:
+        message = {'arg': {'channel': channel, 'instId': self.symbol}, 'data': data}
+        if action:
+            message['action'] = action
+        return message
+
+    def _book_message(self, action: str, asks: List[List[str]], bids: List[List[str]], ts: str) -> dict:
+        prev = self.seq_id if action == 'update' else -1
+        self.seq_id += 1
+        entry = {'asks': asks, 'bids': bids, 'ts': ts, 'seqId': self.seq_id, 'prevSeqId': prev}
+        if self.mirror is not None:
+            self.mirror.apply(action, entry)
+            entry['checksum'] = self.mirror.checksum()
+        return self._envelope('books', [entry], action)
+
+    def snapshot(self, ts: str) -> dict:
+        """Full book, e.g. for a consumer that lost sync; the next update chains on from it."""
+        asks = [[self._px(self.ask + k), self._sz(sz), '0', '1'] for k, sz in enumerate(self.asks.tolist()) if sz]
+        bids = [[self._px(self.bid - k), self._sz(sz), '0', '1'] for k, sz in enumerate(self.bids.tolist()) if sz]
+        self.started = True
+        return self._book_message('snapshot', asks, bids, ts)
+
+    def _shift(self, sizes: np.ndarray, touch: int, new_touch: int, sign: int,
+               changes: Dict[int, int]) -> np.ndarray:
+        """Move one side's grid so it starts at `new_touch`, recording deleted and new levels."""
+        # Level k of the new grid was level k + offset of the old one
+        offset = sign * (new_touch - touch)
+        n = self.levels
+        shifted = np.empty(n, dtype=np.int64)
+        if abs(offset) >= n:
+            gone, fresh = range(n), range(n)
+        elif offset > 0:
+            shifted[:n - offset] = sizes[offset:]
+            gone, fresh = range(offset), range(n - offset, n)
+        else:
+            shifted[-offset:] = sizes[:n + offset]
+            gone, fresh = range(n + offset, n), range(-offset)
+        new_sizes = self._level_sizes.take(len(fresh))
+        shifted[fresh.start:fresh.stop] = new_sizes
+        for k, size in zip(gone, sizes[gone.start:gone.stop].tolist()):
+            if size:
+                changes[touch + sign * k] = 0
+        for k, size in zip(fresh, new_sizes):
+            changes[new_touch + sign * k] = size
+        if shifted[0] == 0:
+            shifted[0] = self._level_sizes.one()
+            changes[new_touch] = int(shifted[0])
+        return shifted
+
+    def _move(self, bid: int, ask: int, ask_changes: Dict[int, int], bid_changes: Dict[int, int]):
+        if bid != self.bid:
+            self.bids = self._shift(self.bids, self.bid, bid, -1, bid_changes)
+            self.bid = bid
+        if ask != self.ask:
+            self.asks = self._shift(self.asks, self.ask, ask, 1, ask_changes)
+            self.ask = ask
+
+    def _modify(self, ask_changes: Dict[int, int], bid_changes: Dict[int, int]):
+        """Replace or cancel the size of a level near the touch of a random side."""
+        is_bid = self._uniform.one() < 0.5
+        sizes, touch, sign, changes = (self.bids, self.bid, -1, bid_changes) if is_bid \
+            else (self.asks, self.ask, 1, ask_changes)
+        k = self._offsets.one()
+        size = 0 if k > 0 and self._uniform.one() < 0.2 else self._level_sizes.one()
+        sizes[k] = size
+        changes[touch + sign * k] = size
+
+    def _trade(self, side: int, ts: str, ask_changes: Dict[int, int], bid_changes: Dict[int, int]) -> dict:
+        """Trade against the touch taken by `side` (1 buy at the ask, -1 sell at the bid)."""
+        sizes, touch, changes = (self.asks, self.ask, ask_changes) if side > 0 else (self.bids, self.bid, bid_changes)
+        touch_size = int(sizes[0])
+        lots = min(self._trade_sizes.one(), touch_size)
+        # New orders arrive at the touch once it is taken out
+        sizes[0] = changes[touch] = touch_size - lots if lots < touch_size else self._level_sizes.one()
+        price = touch * self.tick
+        self.trade_id += 1
+        self.last_trade = (price, lots)
+        self.high = max(self.high, price)
+        self.low = min(self.low, price)
+        self.volume += lots * self.lot
+        return self._envelope('trades', [{
+            'instId': self.symbol, 'tradeId': str(self.trade_id), 'px': self._px(touch), 'sz': self._sz(lots),
+            'side': 'buy' if side > 0 else 'sell', 'ts': ts
+        }])
+
+    def ticker(self, ts: str) -> dict:
+        price, lots = self.last_trade
+        return self._envelope('tickers', [{
+            'instType': 'SWAP', 'instId': self.symbol,
+            'last': f"{price:.{self._px_decimals}f}", 'lastSz': self._sz(lots),
+            'askPx': self._px(self.ask), 'askSz': self._sz(int(self.asks[0])),
+            'bidPx': self._px(self.bid), 'bidSz': self._sz(int(self.bids[0])),
+            'open24h': f"{self.open:.{self._px_decimals}f}", 'high24h': f"{self.high:.{self._px_decimals}f}",
+            'low24h': f"{self.low:.{self._px_decimals}f}", 'volCcy24h': f"{self.volume:.{self._sz_decimals}f}",
+            'vol24h': f"{self.volume / self.lot:.0f}", 'ts': ts
+        }])
+
+    def events(self, start: float, end: float, start_ms: int) -> List[Event]:
+        """
+        Every push in the simulated window [start, end), as (seconds, message) in time order.
+
+        Times, prices, spreads and sizes for the whole window are drawn up
+        front; only applying them to the book is done event by event.
+        """
+        trade_times, trade_sides = self.trades.window(start, end)
+        book_times = np.sort(start + self.rng.random(self.rng.poisson(self.book_rate * (end - start))) * (end - start))
+        ticker_times = np.arange(self.next_ticker, end, self.ticker_interval) if self.ticker_interval > 0 \
+            else np.empty(0)
+        if len(ticker_times):
+            self.next_ticker = float(ticker_times[-1]) + self.ticker_interval
+
+        # Kinds: 0 trade, 1 book, 2 ticker
+        times = np.concatenate([trade_times, book_times, ticker_times])
+        kinds = np.concatenate([np.zeros(len(trade_times), np.int8), np.ones(len(book_times), np.int8),
+                                np.full(len(ticker_times), 2, np.int8)])
+        sides = np.concatenate([trade_sides, np.zeros(len(book_times) + len(ticker_times), np.int8)])
+        order = np.argsort(times, kind='stable')
+        times, kinds, sides = times[order], kinds[order], sides[order]
+        prices = self.price.sample(times)
+        bids = np.floor(prices / self.tick).astype(np.int64)
+        asks = bids + self.rng.geometric(0.8, len(times))
+        changes_per_event = 1 + self.rng.poisson(1.0, len(times))
+        stamps = (start_ms + times * 1000).astype(np.int64).astype(str)
+
+        events: List[Event] = []
+        if not self.started:
+            events.append((start, self.snapshot(str(start_ms + int(start * 1000)))))
+        for t, kind, side, bid, ask, count, ts in zip(times.tolist(), kinds.tolist(), sides.tolist(), bids.tolist(),
+                                                      asks.tolist(), changes_per_event.tolist(), stamps.tolist()):
+            ask_changes: Dict[int, int] = {}
+            bid_changes: Dict[int, int] = {}
+            self._move(bid, ask, ask_changes, bid_changes)
+            if kind == 0:
+                if ask_changes or bid_changes:
+                    # The touch moves before the trade happens at it
+                    events.append((t, self._book_message('update', self._levels(ask_changes),
+                                                         self._levels(bid_changes), ts)))
+                    ask_changes, bid_changes = {}, {}
+                events.append((t, self._trade(side, ts, ask_changes, bid_changes)))
+            elif kind == 1:
+                for _ in range(count):
+                    self._modify(ask_changes, bid_changes)
+            if ask_changes or bid_changes:
+                events.append((t, self._book_message('update', self._levels(ask_changes),
+                                                     self._levels(bid_changes), ts)))
+            if kind == 2:
+                events.append((t, self.ticker(ts)))
+        return events
+
+
+class SyntheticMarket:
+    """
+    Seeded synthetic market for a set of instruments, generated in batches of simulated time.
+
+    The same seed, parameters and batch duration always produce the same
+    sequence of pushes; message timestamps are `start_ms` plus the
+    simulated time, so pass `start_ms` too for byte-identical output.
+    """
+
+    def __init__(self, symbols: List[str], seed: Optional[int] = None, start_ms: Optional[int] = None, **params):
+        """
+        Args:
+            symbols: Instruments to generate
+            seed: Seed of every random draw; None for a fresh market each run
+            start_ms: Exchange timestamp of simulated time 0, defaults to now
+            **params: SyntheticInstrument parameters, shared by every instrument
+        """
+        self.seed = seed
+        self.start_ms = start_ms if start_ms is not None else int(time.time() * 1000)
+        seeds = np.random.SeedSequence(seed).spawn(len(symbols))
+        self.instruments = {symbol: SyntheticInstrument(symbol, np.random.default_rng(child), **params)
+                            for symbol, child in zip(symbols, seeds)}
+        self.t = 0.0
+
+    def snapshot(self, symbol: str) -> dict:
+        return self.instruments[symbol].snapshot(str(self.start_ms + int(self.t * 1000)))
+
+    def batch(self, duration: float) -> List[Event]:
+        """Pushes of every instrument over the next `duration` simulated seconds, in time order."""
+        end = self.t + duration
+        events: List[Event] = []
+        for instrument in self.instruments.values():
+            events.extend(instrument.events(self.t, end, self.start_ms))
+        events.sort(key=itemgetter(0))
+        self.t = end
+        return events
+
+
+async def run(market: SyntheticMarket, market_ws, mode: str = 'realtime', speed: float = 1.0,
+              duration: Optional[float] = None, batch: float = 0.05) -> Dict:
+    """
+    Feed synthetic pushes into `market_ws.ingest`, like exchange frames.
+
+    Args:
+        market: Synthetic market to draw from
+        market_ws: MarketDataWebSocket instance to drive
+        mode: 'fast' (no pacing), 'realtime' (simulated time is wall time) or 'scaled' (time / speed)
+        speed: Speed multiplier for 'scaled' mode
+        duration: Simulated seconds to run for; None runs until cancelled
+        batch: Simulated seconds generated per batch
+
+    Returns:
+        Report with message counts per channel, messages/sec and time spent generating and processing
+    """
+    if mode not in RUN_MODES:
+        raise ValueError(f"Unknown run mode: {mode}")
+    pace = 0.0 if mode == 'fast' else (1.0 if mode == 'realtime' else 1.0 / speed)
+    counts: Dict[str, int] = {}
+    generate_s = process_s = 0.0
+    start = time.perf_counter()
+    origin = market.t
+
+    while duration is None or market.t - origin < duration:
+        t0 = time.perf_counter()
+        events = market.batch(batch)
+        generate_s += time.perf_counter() - t0
+
+        for t, message in events:
+            if pace:
+                delay = (t - origin) * pace - (time.perf_counter() - start)
+                if delay > 0.001:
+                    await asyncio.sleep(delay)
+            t1 = time.perf_counter()
+            await market_ws.ingest(message)
+            process_s += time.perf_counter() - t1
+            channel = message['arg']['channel']
+            counts[channel] = counts.get(channel, 0) + 1
+
+        # A book the pipeline dropped gets a fresh snapshot, as a resubscribe would, once it has caught up
+        for symbol in market.instruments:
+            state = market_ws.symbols.get(symbol)
+            if state is not None and not state.book.synced and not market_ws.process_stage.queue:
+                await market_ws.ingest(market.snapshot(symbol))
+        if not pace:
+            # Let client writers and other tasks run between batches
+            await asyncio.sleep(0)
+
+    elapsed = time.perf_counter() - start
+    messages = sum(counts.values())
+    return {
+        'mode': mode,
+        'seed': market.seed,
+        'messages': messages,
+        'channels': counts,
+        'elapsed_s': round(elapsed, 3),
+        'messages_per_sec': round(messages / elapsed, 1) if elapsed > 0 else 0.0,
+        'generate_s': round(generate_s, 3),
+        'process_s': round(process_s, 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive the ingest pipeline with a seeded synthetic market")
+    parser.add_argument('--symbols', default=os.getenv('INSTRUMENTS', 'BTC-USDT-SWAP'),
+                        help="Comma-separated instruments")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--duration', type=float, default=10.0, help="Simulated seconds")
+    parser.add_argument('--trade-rate', type=float, default=2000.0, help="Mean trades per second per instrument")
+    parser.add_argument('--book-rate', type=float, default=8000.0, help="Book events per second per instrument")
+    parser.add_argument('--ticker-interval', type=float, default=0.1)
+    parser.add_argument('--mode', choices=RUN_MODES, default='fast')
+    parser.add_argument('--speed', type=float, default=1.0, help="Speed multiplier for scaled mode")
+    parser.add_argument('--checksum', action='store_true', help="Attach OKX checksums to book messages")
+    parser.add_argument('--generate-only', action='store_true',
+                        help="Only generate and encode the pushes, to measure the generator itself")
+    args = parser.parse_args()
+
+    symbols = [symbol.strip() for symbol in args.symbols.split(',') if symbol.strip()]
+    market = SyntheticMarket(symbols, seed=args.seed, trade_rate=args.trade_rate, book_rate=args.book_rate,
+                             ticker_interval=args.ticker_interval, checksum=args.checksum)
+    if args.generate_only:
+        start = time.perf_counter()
+        messages = 0
+        while market.t < args.duration:
+            events = market.batch(0.05)
+            for _, message in events:
+                json.dumps(message)
+            messages += len(events)
+        elapsed = time.perf_counter() - start
+        report = {'seed': args.seed, 'messages': messages, 'elapsed_s': round(elapsed, 3),
+                  'messages_per_sec': round(messages / elapsed, 1)}
+    else:
+        from websocket.market_data import MarketDataWebSocket
+        report = asyncio.run(run(market, MarketDataWebSocket(), args.mode, args.speed, args.duration))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+from websocket.arbiter import FeedArbiter
+
+
+def ticker(ts, last, bid='99', ask='101'):
+    return {'arg': {'channel': 'tickers', 'instId': 'BTC'},
+            'data': [{'instId': 'BTC', 'ts': str(ts), 'last': last, 'bidPx': bid, 'askPx': ask}]}
+
+
+def test_tickers_sharing_a_millisecond_are_both_delivered_once():
+    arbiter = FeedArbiter()
+    pushes = [ticker(1000, '100'), ticker(1000, '100'), ticker(1000, '100.5', ask='100.6'),
+              ticker(1000, '100.5', ask='100.6'), ticker(999, '99'), ticker(1001, '100')]
+    assert [arbiter.accept(push) for push in pushes] == [True, False, True, False, False, True]
@@ -0,0 +1,42 @@
+import asyncio
+from websocket.broadcast import Broadcaster
+
+
+class StalledSocket:
+    """A client that never finishes receiving."""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, payload):
+        self.sent.append(payload)
+        await asyncio.sleep(3600)
+
+    async def close(self, *args, **kwargs):
+        pass
+
+
+def test_direct_messages_reach_an_idle_client():
+    async def run():
+        broadcaster = Broadcaster(max_queue=4)
+        websocket = StalledSocket()
+        broadcaster.add(websocket)
+        broadcaster.send(websocket, {'type': 'fills', 'symbol': 'TEST'})
+        await asyncio.sleep(0)
+        await broadcaster.close()
+        return websocket.sent
+
+    assert len(asyncio.run(run())) == 1
+
+
+def test_direct_messages_drop_an_overflowing_client():
+    async def run():
+        broadcaster = Broadcaster(max_queue=4)
+        websocket = StalledSocket()
+        broadcaster.add(websocket)
+        for n in range(8):
+            broadcaster.send(websocket, {'type': 'fills', 'symbol': 'TEST', 'n': n})
+        await asyncio.sleep(0)
+        return websocket in broadcaster.clients, broadcaster.disconnected_slow
+
+    assert asyncio.run(run()) == (False, 1)
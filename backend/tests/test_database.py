@@ -0,0 +1,80 @@
+import asyncio
+from collections import deque
+from database import Database
+
+
+def matches(doc, query):
+    for field, condition in query.items():
+        if field == '$or':
+            if not any(matches(doc, option) for option in condition):
+                return False
+        elif not isinstance(condition, dict):
+            if doc.get(field) != condition:
+                return False
+        else:
+            for op, value in condition.items():
+                if op == '$exists':
+                    ok = (field in doc) == value
+                else:
+                    ok = field in doc and (doc[field] < value if op == '$lt' else doc[field] <= value)
+                if not ok:
+                    return False
+    return True
+
+
+class Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, keys):
+        for field, direction in reversed(keys):
+            self.docs.sort(key=lambda doc: doc.get(field, 0), reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        self.docs = self.docs[:count]
+        return self
+
+    async def to_list(self, length):
+        return self.docs[:length]
+
+
+class Collection:
+    """Just enough of a motor collection for the fallback read of stored snapshots."""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection):
+        return Cursor([doc for doc in self.docs if matches(doc, query)])
+
+
+class StoredBooks:
+    def __init__(self, docs):
+        self.orderbook = Collection(docs)
+
+
+def test_cached_snapshots_keep_milliseconds_and_the_fallback_reads_the_same_second():
+    database = Database()
+    base = 1_700_000_000_000
+    # Four snapshots within one second, plus one stored before the `ts` field existed
+    docs = [database.format_orderbook({'asks': [], 'bids': []}, 'BTC', base + offset)
+            for offset in (100, 300, 500, 700)]
+    legacy = database.format_orderbook({'asks': [], 'bids': []}, 'BTC', base - 1000)
+    del legacy['ts']
+    database.db = StoredBooks(docs + [legacy])
+    # The newest two are still cached
+    for doc in docs[2:]:
+        database._cache_book('BTC', database._book_entry(doc))
+
+    books = asyncio.run(database.get_recent_orderbooks(10, 'BTC'))
+    assert [book['ts'] for book in books] == [base + 700, base + 500, base + 300, base + 100, base - 1000]
+    books = asyncio.run(database.get_recent_orderbooks(10, 'BTC', (base + 600) / 1000))
+    assert [book['ts'] for book in books] == [base + 500, base + 300, base + 100, base - 1000]
+
+
+def test_worker_cache_uses_the_exchange_time():
+    database = Database()
+    database.cache_orderbook({'asks': [['100', '1']], 'bids': [['99', '2']]}, 'BTC', 1_700_000_000_123)
+    assert database.recent_books['BTC'] == deque([{'ts': 1_700_000_000_123, 'asks': [[100.0, 1.0]],
+                                                   'bids': [[99.0, 2.0]]}])
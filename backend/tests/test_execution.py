@@ -0,0 +1,41 @@
+import asyncio
+import numpy as np
+from models import execution
+from models.execution import run_simulation, shutdown_pool
+
+# Five levels of size 1 on each side of a 100 mid, one tick apart
+ASKS = np.array([[100.5 + i, 1.0] for i in range(5)])
+BIDS = np.array([[99.5 - i, 1.0] for i in range(5)])
+
+
+def simulate(side: str, **overrides) -> np.ndarray:
+    params = dict(price=100.0, quantity=3.0, side=side, strategy='TWAP', horizon=60.0, steps=1,
+                  paths=8, sigma=0.0, fee_rate=0.0, seed=7)
+    params.update(overrides)
+    try:
+        return asyncio.run(run_simulation((ASKS, BIDS), **params))
+    finally:
+        shutdown_pool()
+
+
+def test_buy_and_sell_cost_the_same_on_a_symmetric_book():
+    buy = simulate('buy')
+    sell = simulate('sell')
+    # Walking three levels averages 1.5 from the mid on either side
+    np.testing.assert_allclose(buy, 4.5)
+    np.testing.assert_allclose(sell, buy)
+
+
+def test_fees_add_to_the_cost_of_both_sides():
+    for side in ('buy', 'sell'):
+        costs = simulate(side, fee_rate=0.001)
+        assert np.all(costs > 4.5)
+
+
+def test_seeded_costs_do_not_depend_on_the_worker_count(monkeypatch):
+    monkeypatch.setattr(execution, 'EXECUTION_CHUNK_PATHS', 16)
+    runs = []
+    for workers in (1, 3):
+        monkeypatch.setattr(execution, 'EXECUTION_WORKERS', workers)
+        runs.append(simulate('buy', paths=50, sigma=1e-4, strategy='POV', volume_rate=0.05))
+    np.testing.assert_array_equal(runs[0], runs[1])
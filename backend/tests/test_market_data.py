@@ -0,0 +1,30 @@
+import asyncio
+import logging
+from websocket.market_data import MarketDataWebSocket
+
+
+def trade_push(symbol, count):
+    return {'arg': {'channel': 'trades', 'instId': symbol}, 'data': [
+        {'instId': symbol, 'tradeId': str(n), 'px': str(100 + n), 'sz': '1', 'side': 'buy',
+         'ts': str(1_700_000_000_000 + n)} for n in range(count)]}
+
+
+def test_every_trade_of_a_push_is_processed_and_published():
+    async def run():
+        feed = MarketDataWebSocket()
+        messages = await feed.process_market_data(trade_push(feed.default_symbol, 3))
+        return messages, feed.state().tick_store.trades.records()
+
+    messages, stored = asyncio.run(run())
+    assert [message['price'] for message in messages] == ['100', '101', '102']
+    assert stored['id'].tolist() == [0, 1, 2]
+
+
+def test_empty_trade_push_is_ignored_without_an_error(caplog):
+    async def run():
+        feed = MarketDataWebSocket()
+        return await feed.process_market_data(trade_push(feed.default_symbol, 0))
+
+    with caplog.at_level(logging.ERROR):
+        assert asyncio.run(run()) == []
+    assert not caplog.records
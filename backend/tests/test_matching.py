@@ -0,0 +1,93 @@
+import pytest
+from models.matching import MatchingEngine
+from websocket.orderbook import OrderBook
+
+
+def make_book(bids, asks) -> OrderBook:
+    book = OrderBook('TEST')
+    book.apply('snapshot', {
+        'bids': [[str(price), str(size)] for price, size in bids],
+        'asks': [[str(price), str(size)] for price, size in asks]
+    })
+    return book
+
+
+def update(book: OrderBook, bids=(), asks=()):
+    data = {'bids': [[str(price), str(size)] for price, size in bids],
+            'asks': [[str(price), str(size)] for price, size in asks]}
+    book.apply('update', data)
+    return {'bids': {price for price, _ in bids}, 'asks': {price for price, _ in asks}}
+
+
+@pytest.fixture
+def book() -> OrderBook:
+    return make_book(bids=[(99.0, 5.0), (98.0, 5.0)], asks=[(101.0, 5.0), (102.0, 5.0)])
+
+
+def test_order_joins_the_back_of_the_displayed_queue(book):
+    engine = MatchingEngine('TEST')
+    order = engine.place('a', 'buy', 99.0, 2.0, book)
+    assert order.queue_ahead == 5.0
+
+    # Trades at the price consume the queue ahead before the order fills
+    assert engine.on_trade(99.0, 4.0, 'sell') == []
+    fills = engine.on_trade(99.0, 2.0, 'sell')
+    assert [(fill.id, quantity) for fill, quantity in fills] == [(order.id, 1.0)]
+    assert order.remaining == 1.0
+
+
+def test_orders_placed_after_trades_queue_behind_them(book):
+    engine = MatchingEngine('TEST')
+    first = engine.place('a', 'buy', 99.0, 1.0, book)
+    engine.on_trade(99.0, 3.0, 'sell')
+    second = engine.place('b', 'buy', 99.0, 1.0, book)
+    fills = engine.on_trade(99.0, 3.0, 'sell')
+    assert [fill.id for fill, _ in fills] == [first.id]
+    assert second.remaining == 1.0
+
+
+def test_displayed_size_shrinking_moves_the_order_forward(book):
+    engine = MatchingEngine('TEST')
+    order = engine.place('a', 'buy', 99.0, 2.0, book)
+    engine.on_book(book, update(book, bids=[(99.0, 1.0)]))
+    assert engine.on_trade(99.0, 2.0, 'sell')[0][1] == 1.0
+    assert order.remaining == 1.0
+
+
+def test_only_changed_levels_are_shrunk(book):
+    engine = MatchingEngine('TEST')
+    order = engine.place('a', 'buy', 98.0, 1.0, book)
+    update(book, bids=[(98.0, 1.0)])
+    # The update is reported as touching another level, so 98 keeps its queue estimate
+    engine.on_book(book, {'bids': {99.0}, 'asks': set()})
+    assert engine.on_trade(98.0, 1.0, 'sell') == []
+    # Without the changed prices every resting level is checked: 1 traded + 1 displayed ahead
+    engine.on_book(book)
+    assert engine.on_trade(98.0, 1.5, 'sell') == [(order, 0.5)]
+
+
+def test_trading_or_quoting_through_the_price_fills_in_full(book):
+    engine = MatchingEngine('TEST')
+    bid = engine.place('a', 'buy', 98.0, 3.0, book)
+    ask = engine.place('a', 'sell', 102.0, 3.0, book)
+
+    fills = engine.on_trade(97.0, 0.1, 'sell')
+    assert [(fill.id, quantity) for fill, quantity in fills] == [(bid.id, 3.0)]
+
+    fills = engine.on_book(book, update(book, bids=[(102.0, 1.0)]))
+    assert [(fill.id, quantity) for fill, quantity in fills] == [(ask.id, 3.0)]
+    assert len(engine) == 0
+
+
+def test_cancel_removes_only_the_owners_order(book):
+    engine = MatchingEngine('TEST')
+    order = engine.place('a', 'buy', 99.0, 1.0, book)
+    assert engine.cancel(order.id, 'b') is None
+    assert engine.cancel(order.id, 'a') is order
+    assert len(engine) == 0
+    assert engine.on_trade(98.0, 100.0, 'sell') == []
+
+
+def test_crossing_order_is_rejected(book):
+    with pytest.raises(ValueError):
+        MatchingEngine('TEST').place('a', 'buy', 101.0, 1.0, book)
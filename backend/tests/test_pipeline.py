@@ -0,0 +1,35 @@
+import asyncio
+from websocket.pipeline import StageQueue
+
+
+def test_kinds_without_a_policy_wait_for_room():
+    async def run():
+        queue = StageQueue('test', 2, {'ticker': 'conflate', 'debug': 'keep'})
+        for n in range(2):
+            await queue.put('trade', n, n)
+        producer = asyncio.create_task(queue.put('trade', 2, 2))
+        await asyncio.sleep(0)
+        assert not producer.done() and len(queue) == 2
+        # Conflating onto a waiting entry and explicit 'keep' never wait
+        await queue.put('debug', 0, 'x')
+        assert len(queue) == 3 and queue.overflow == 1
+        while len(queue) >= 2:
+            queue.pop()
+        await producer
+        return [entry[2] for entry in queue.entries]
+
+    assert asyncio.run(run()) == ['x', 2]
+
+
+def test_blocked_conflation_lands_on_an_entry_queued_meanwhile():
+    async def run():
+        queue = StageQueue('test', 1, {'ticker': 'conflate'})
+        await queue.put('trade', 0, 0)
+        first = asyncio.create_task(queue.put('ticker', 'BTC', 1))
+        second = asyncio.create_task(queue.put('ticker', 'BTC', 2))
+        await asyncio.sleep(0)
+        queue.pop()
+        await asyncio.gather(first, second)
+        return [entry[2] for entry in queue.entries], queue.conflated
+
+    assert asyncio.run(run()) == ([2], 1)
@@ -0,0 +1,30 @@
+import asyncio
+import pytest
+import numpy as np
+import app
+from models.impact import ImpactParams
+from models.maker_taker import FEATURE_NAMES, Coefficients
+
+
+@pytest.fixture
+def state():
+    state = app.market_ws.state(None)
+    previous = state.impact_model.params, state.maker_taker.coefficients
+    state.impact_model.params = ImpactParams(50000.0, 5.0, 0.05, 2e-4, 1e-5, 3.0, 1)
+    # A trained classifier predicting sigmoid(0.8) for any market
+    state.maker_taker.coefficients = Coefficients(np.zeros(len(FEATURE_NAMES)), 0.8, 1, 100)
+    yield state
+    state.impact_model.params, state.maker_taker.coefficients = previous
+
+
+def test_batch_rows_match_single_simulations(state):
+    quantity, volatility = [100.0, 25000.0], [0.1, 0.6]
+    batch = asyncio.run(app.simulate_batch_trades(app.BatchSimulationParams(
+        asset=state.symbol, quantity=quantity, volatility=volatility, feeTier=['VIP3'])))
+    columns = batch['columns']
+    for row in range(len(quantity)):
+        single = app._simulate(state, quantity[row], volatility[row], 'VIP3')
+        for name in ('slippage', 'fee', 'impact', 'netCost'):
+            assert columns[name][row] == pytest.approx(single[name], rel=1e-12)
+        assert columns['taker'][row] == single['makerTakerProbability']['taker'] == round(1 / (1 + np.exp(-0.8)), 3)
+        assert columns['maker'][row] == single['makerTakerProbability']['maker']
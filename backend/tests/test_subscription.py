@@ -0,0 +1,40 @@
+import json
+from websocket.subscription import Subscription, SymbolFeed
+
+
+def publish_book(feed: SymbolFeed, asks, bids):
+    feed.update({'type': 'orderbook', 'symbol': feed.symbol, 'timestamp': '2024-01-01T00:00:00',
+                 'asks': [[px, sz] for px, sz in asks], 'bids': [[px, sz] for px, sz in bids]})
+
+
+def book_frames(subscription: Subscription, feeds):
+    return [message for message in map(json.loads, subscription.frames(feeds)) if message['type'] == 'book']
+
+
+def test_book_starts_over_with_a_snapshot_after_resubscribing():
+    feed = SymbolFeed('TEST')
+    feeds = {'TEST': feed}
+    subscription = Subscription(max_depth=5)
+    subscription.configure({'symbols': ['TEST'], 'channels': ['book']})
+    publish_book(feed, [('101', '1')], [('99', '1')])
+    assert [frame['action'] for frame in book_frames(subscription, feeds)] == ['snapshot']
+
+    subscription.remove(channels=['book'])
+    publish_book(feed, [('101', '2')], [('99', '1')])
+    assert book_frames(subscription, feeds) == []
+
+    subscription.configure({'channels': ['book']})
+    frames = book_frames(subscription, feeds)
+    assert [(frame['action'], frame['seq'], frame['asks']) for frame in frames] == [('snapshot', 1, [['101', '2']])]
+
+
+def test_book_starts_over_when_a_request_drops_and_restores_the_channel():
+    feed = SymbolFeed('TEST')
+    feeds = {'TEST': feed}
+    subscription = Subscription(max_depth=5)
+    publish_book(feed, [('101', '1')], [('99', '1')])
+    book_frames(subscription, feeds)
+
+    subscription.configure({'channels': ['ticker']})
+    subscription.configure({'channels': ['ticker', 'book']})
+    assert [frame['action'] for frame in book_frames(subscription, feeds)] == ['snapshot']
@@ -0,0 +1,43 @@
+import asyncio
+import numpy as np
+from tick_store import TRADE_DTYPE, TickStore
+
+
+class StoredTrades:
+    """Stands in for Database.find_trades over trades already persisted."""
+
+    def __init__(self, trades):
+        self.trades = np.array(trades, dtype=TRADE_DTYPE)
+
+    async def find_trades(self, before_ts, limit, symbol, before_id=None):
+        key = (self.trades['ts'] < before_ts)
+        if before_id is not None:
+            key |= (self.trades['ts'] == before_ts) & (self.trades['id'] < before_id)
+        return self.trades[key][-limit:] if limit > 0 else self.trades[:0]
+
+
+def page_through(store: TickStore, db, limit: int):
+    ids, end_ts, end_id = [], 1e12, None
+    while True:
+        page = asyncio.run(store.get_trades(end_ts, limit, db, end_id))
+        ids = page['id'].tolist() + ids
+        if len(page) < limit:
+            return ids
+        end_ts, end_id = float(page['ts'][0]), int(page['id'][0])
+
+
+def test_pages_split_trades_sharing_a_millisecond():
+    store = TickStore('TEST', trade_capacity=100)
+    for trade_id in range(1, 13):
+        store.on_trade(100.0, 1.0, 'buy', 1_700_000_000_000 + trade_id // 5, trade_id)
+    assert page_through(store, None, 3) == list(range(1, 13))
+
+
+def test_pages_continue_into_stored_trades_within_a_millisecond():
+    # Every trade shares one millisecond; the ring keeps the newest four
+    ts = 1_700_000_000.5
+    db = StoredTrades([(ts, 100.0, 1.0, 1, trade_id) for trade_id in range(1, 11)])
+    store = TickStore('TEST', trade_capacity=4)
+    for trade_id in range(1, 11):
+        store.on_trade(100.0, 1.0, 'buy', ts * 1000, trade_id)
+    assert page_through(store, db, 3) == list(range(1, 11))
@@ -0,0 +1,77 @@
+import asyncio
+import os
+from datetime import datetime
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from write_behind import WriteBehindBuffer
+
+
+class FlakyDatabase:
+    """Unordered insert_many that rejects chosen documents once, or everything while down."""
+
+    def __init__(self, reject=()):
+        self.stored = {}
+        self.reject = set(reject)
+        self.down = False
+
+    async def insert_many(self, collection, docs):
+        # Like the driver, every document gets its _id before the write
+        for doc in docs:
+            doc.setdefault('_id', ObjectId())
+        if self.down:
+            raise ConnectionError('server unavailable')
+        errors = []
+        for index, doc in enumerate(docs):
+            if doc['_id'] in self.stored:
+                errors.append({'index': index, 'code': 11000, 'errmsg': 'duplicate key'})
+            elif doc['n'] in self.reject:
+                self.reject.discard(doc['n'])
+                errors.append({'index': index, 'code': 2, 'errmsg': 'rejected'})
+            else:
+                self.stored[doc['_id']] = doc
+        if errors:
+            raise BulkWriteError({'writeErrors': errors, 'nInserted': len(docs) - len(errors)})
+
+
+def docs(count):
+    return [{'n': n, 'timestamp': datetime(2024, 1, 1, 0, 0, n)} for n in range(count)]
+
+
+def stored(db):
+    return sorted((doc['n'], doc['timestamp']) for doc in db.stored.values())
+
+
+def test_partial_bulk_failure_spills_only_the_rejected_documents(tmp_path):
+    db = FlakyDatabase(reject={1, 3})
+    writer = WriteBehindBuffer(db, policy='spill', spill_dir=str(tmp_path))
+
+    async def run():
+        for doc in docs(5):
+            await writer.put('trades', doc)
+        await writer.flush()
+
+    asyncio.run(run())
+    assert writer.queues['trades'].spilled == 2
+    # The drain in the same flush stored the rejected two with their types intact
+    assert stored(db) == [(doc['n'], doc['timestamp']) for doc in docs(5)]
+    assert all(isinstance(_id, ObjectId) for _id in db.stored)
+
+
+def test_failed_drain_keeps_documents_on_disk_whatever_the_policy(tmp_path):
+    db = FlakyDatabase()
+    writer = WriteBehindBuffer(db, batch_size=2, policy='drop_oldest', spill_dir=str(tmp_path))
+    queue = writer._queue('trades')
+    batch = docs(5)
+    asyncio.run(db.insert_many('trades', batch[:2]))
+    # A spill left by a crash after the first two were already written
+    writer._spill(queue, batch)
+    db.down = True
+    asyncio.run(writer.flush())
+    assert db.stored.keys() == {doc['_id'] for doc in batch[:2]}
+    assert not os.path.exists(writer._spill_path(queue) + '.draining')
+
+    db.down = False
+    asyncio.run(writer.flush())
+    assert stored(db) == [(doc['n'], doc['timestamp']) for doc in batch]
+    assert queue.failed == 0
+    assert not os.path.exists(writer._spill_path(queue))
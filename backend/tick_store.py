@@ -0,0 +1,315 @@
+import numpy as np
+from typing import Callable, Dict, Optional, Tuple
+
+TICK_DTYPE = np.dtype([('ts', 'f8'), ('price', 'f8')])
+# 'id' is the exchange tradeId, which rises within a symbol and orders trades sharing a millisecond
+TRADE_DTYPE = np.dtype([('ts', 'f8'), ('price', 'f8'), ('size', 'f8'), ('side', 'i1'), ('id', 'i8')])
+CANDLE_DTYPE = np.dtype([('ts', 'f8'), ('open', 'f8'), ('high', 'f8'), ('low', 'f8'),
+                         ('close', 'f8'), ('volume', 'f8')])
+
+# Candle interval name -> (seconds, ring buffer capacity)
+CANDLE_INTERVALS: Dict[str, Tuple[int, int]] = {
+    '1s': (1, 86400),        # one day
+    '1m': (60, 10080),       # one week
+    '1h': (3600, 2160),      # ninety days
+    '1d': (86400, 3650)      # ten years
+}
+
+
+class RingBuffer:
+    """
+    Fixed-size ring buffer of records in a preallocated structured NumPy array.
+
+    Records must be appended in non-decreasing `ts` order, which keeps both
+    contiguous segments of the ring sorted and lets range queries use binary
+    search instead of scanning.
+    """
+
+    def __init__(self, dtype: np.dtype, capacity: int):
+        self.data = np.zeros(capacity, dtype=dtype)
+        self.capacity = capacity
+        self.count = 0
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def append(self, record: tuple):
+        self.data[self.count % self.capacity] = record
+        self.count += 1
+
+    def replace_last(self, record: tuple):
+        self.data[(self.count - 1) % self.capacity] = record
+
+    def _segments(self):
+        """Return the stored records as (older, newer) contiguous views in time order."""
+        if self.count <= self.capacity:
+            return self.data[:0], self.data[:self.count]
+        head = self.count % self.capacity
+        return self.data[head:], self.data[:head]
+
+    def first_ts(self) -> Optional[float]:
+        if self.count == 0:
+            return None
+        older, newer = self._segments()
+        return float(older['ts'][0]) if len(older) else float(newer['ts'][0])
+
+    def last(self) -> Optional[np.void]:
+        if self.count == 0:
+            return None
+        return self.data[(self.count - 1) % self.capacity]
+
+    def records(self) -> np.ndarray:
+        """Copy of every stored record, in time order."""
+        return np.concatenate(self._segments())
+
+    def load(self, records: np.ndarray):
+        """Replace the contents with time-ordered `records`, keeping the newest that fit."""
+        records = records[-self.capacity:]
+        self.data[:len(records)] = records
+        self.count = len(records)
+
+    def between(self, start_ts: float, end_ts: float) -> np.ndarray:
+        """Return a copy of the records with start_ts <= ts < end_ts, in time order."""
+        parts = []
+        for segment in self._segments():
+            if len(segment):
+                ts = segment['ts']
+                lo = np.searchsorted(ts, start_ts, side='left')
+                hi = np.searchsorted(ts, end_ts, side='left')
+                if hi > lo:
+                    parts.append(segment[lo:hi])
+        if not parts:
+            return self.data[:0].copy()
+        return np.concatenate(parts) if len(parts) > 1 else parts[0].copy()
+
+    def latest(self, end_ts: float, limit: int, end_id: Optional[int] = None) -> np.ndarray:
+        """
+        Return a copy of the newest `limit` records before a cutoff, in time order.
+
+        The cutoff is ts < end_ts, or with `end_id` (ts, id) < (end_ts, end_id)
+        for records with an 'id' field that rises among records sharing a ts.
+        """
+        parts = []
+        for segment in reversed(self._segments()):
+            if limit <= 0:
+                break
+            if len(segment):
+                hi = np.searchsorted(segment['ts'], end_ts, side='left')
+                if end_id is not None:
+                    top = np.searchsorted(segment['ts'], end_ts, side='right')
+                    hi += np.searchsorted(segment['id'][hi:top], end_id, side='left')
+                lo = max(0, hi - limit)
+                if hi > lo:
+                    parts.append(segment[lo:hi])
+                    limit -= hi - lo
+        if not parts:
+            return self.data[:0].copy()
+        return np.concatenate(parts[::-1]) if len(parts) > 1 else parts[0].copy()
+
+
+class CandleSeries:
+    """OHLCV candles for one interval, updated in place as trades arrive."""
+
+    def __init__(self, interval: int, capacity: int, buffer: Optional[RingBuffer] = None):
+        self.interval = interval
+        self.buffer = buffer if buffer is not None else RingBuffer(CANDLE_DTYPE, capacity)
+        self._bucket: Optional[float] = None
+        self._open = self._high = self._low = self._close = self._volume = 0.0
+
+    def update(self, ts: float, price: float, size: float):
+        bucket = ts - ts % self.interval
+        if bucket != self._bucket:
+            if self._bucket is not None and bucket < self._bucket:
+                # Late trade for an already closed candle; not worth a rewrite
+                return
+            self._bucket = bucket
+            self._open = self._high = self._low = self._close = price
+            self._volume = size
+            self.buffer.append((bucket, price, price, price, price, size))
+            return
+        if price > self._high:
+            self._high = price
+        if price < self._low:
+            self._low = price
+        self._close = price
+        self._volume += size
+        self.buffer.replace_last((bucket, self._open, self._high, self._low, self._close, self._volume))
+
+    def between(self, start_ts: float, end_ts: float) -> np.ndarray:
+        return self.buffer.between(start_ts - start_ts % self.interval, end_ts)
+
+    def restore(self):
+        """Continue the last candle of a buffer loaded from a snapshot."""
+        last = self.buffer.last()
+        if last is None:
+            return
+        self._bucket = float(last['ts'])
+        self._open, self._high, self._low, self._close, self._volume = (
+            float(last[name]) for name in ('open', 'high', 'low', 'close', 'volume'))
+
+    def covers(self, start_ts: float) -> bool:
+        first = self.buffer.first_ts()
+        return first is not None and first <= start_ts
+
+
+class TickStore:
+    """
+    In-memory store of recent ticks, trades and 1s/1m/1h/1d candles.
+
+    Every trade updates all candle intervals incrementally, so range queries
+    are answered with slices of preallocated arrays. Ranges older than the
+    ring buffers are backfilled from MongoDB with a server-side aggregation.
+    """
+
+    def __init__(self, symbol: str = 'BTC-USDT-SWAP', tick_capacity: int = 200000, trade_capacity: int = 500000,
+                 ring: Optional[Callable[[str, np.dtype, int], RingBuffer]] = None):
+        """
+        Args:
+            symbol: Instrument id
+            tick_capacity: Ticks kept in memory
+            trade_capacity: Trades kept in memory
+            ring: Factory (name, dtype, capacity) for the ring buffers, e.g. to place them in
+                shared memory; plain in-process buffers when omitted
+        """
+        ring = ring or (lambda name, dtype, capacity: RingBuffer(dtype, capacity))
+        self.symbol = symbol
+        self.ticks = ring('ticks', TICK_DTYPE, tick_capacity)
+        self.trades = ring('trades', TRADE_DTYPE, trade_capacity)
+        self.candles: Dict[str, CandleSeries] = {
+            name: CandleSeries(seconds, capacity, ring(f"candles_{name}", CANDLE_DTYPE, capacity))
+            for name, (seconds, capacity) in CANDLE_INTERVALS.items()
+        }
+        # Interval -> (start, end, candles) of closed candles already aggregated from MongoDB
+        self._history: Dict[str, Tuple[float, float, np.ndarray]] = {}
+
+    def rings(self) -> Dict[str, RingBuffer]:
+        rings = {'ticks': self.ticks, 'trades': self.trades}
+        rings.update((f"candles_{name}", series.buffer) for name, series in self.candles.items())
+        return rings
+
+    def snapshot(self) -> Dict[str, np.ndarray]:
+        """Copies of every ring buffer, for a warm restart."""
+        return {name: ring.records() for name, ring in self.rings().items()}
+
+    def restore(self, snapshot: Dict[str, np.ndarray]):
+        """Load ring buffers saved by `snapshot`; rings missing or saved with another layout stay empty."""
+        for name, ring in self.rings().items():
+            records = snapshot.get(name)
+            if records is not None and records.dtype == ring.data.dtype:
+                ring.load(records)
+        for series in self.candles.values():
+            series.restore()
+
+    def on_tick(self, price: float, ts_ms: float):
+        """Record a ticker last price."""
+        ts = ts_ms / 1000.0
+        last = self.ticks.last()
+        if last is None or ts >= last['ts']:
+            self.ticks.append((ts, price))
+
+    def on_trade(self, price: float, size: float, side: str, ts_ms: float, trade_id: int = 0):
+        """Record a trade and fold it into every candle interval."""
+        ts = ts_ms / 1000.0
+        last = self.trades.last()
+        if last is None or ts >= last['ts']:
+            self.trades.append((ts, price, size, 1 if side == 'buy' else -1, trade_id))
+        for series in self.candles.values():
+            series.update(ts, price, size)
+
+    async def _backfill(self, interval: str, start_ts: float, end_ts: float, db) -> np.ndarray:
+        """
+        Stored candles in [start_ts, end_ts), aggregating only what is not cached yet.
+
+        Candles that close before end_ts never change, so they are cached
+        as one contiguous range per interval that grows at either end; only
+        the still open last bucket is aggregated on every call. Empty
+        results are not cached, so a failed read is retried.
+        """
+        seconds = CANDLE_INTERVALS[interval][0]
+        start_ts -= start_ts % seconds
+        closed = max(start_ts, end_ts - end_ts % seconds)
+        cached = self._history.get(interval)
+        if cached is None:
+            candles = await db.aggregate_candles(start_ts, closed, seconds, self.symbol) \
+                if closed > start_ts else None
+            if candles is not None and len(candles):
+                cached = self._history[interval] = (start_ts, closed, candles)
+        else:
+            cached_start, cached_end, candles = cached
+            if start_ts < cached_start:
+                head = await db.aggregate_candles(start_ts, cached_start, seconds, self.symbol)
+                if len(head):
+                    cached_start, candles = start_ts, np.concatenate([head, candles])
+            if closed > cached_end:
+                tail = await db.aggregate_candles(cached_end, closed, seconds, self.symbol)
+                if len(tail):
+                    cached_end, candles = closed, np.concatenate([candles, tail])
+            cached = self._history[interval] = (cached_start, cached_end, candles)
+
+        if cached is None:
+            return await db.aggregate_candles(start_ts, end_ts, seconds, self.symbol)
+        cached_end, candles = cached[1], cached[2]
+        ts = candles['ts']
+        history = candles[np.searchsorted(ts, start_ts):np.searchsorted(ts, closed)]
+        rest = min(closed, cached_end)
+        if end_ts <= rest:
+            return history.copy()
+        return np.concatenate([history, await db.aggregate_candles(rest, end_ts, seconds, self.symbol)])
+
+    async def get_trades(self, end_ts: float, limit: int, db=None, end_id: Optional[int] = None) -> np.ndarray:
+        """
+        The newest `limit` trades before a cutoff, in time order.
+
+        Served from the trade ring buffer; only when it holds fewer trades
+        than asked for are the older ones read from MongoDB, before the
+        oldest trade the ring returned.
+
+        Args:
+            end_ts: Exclusive cutoff, epoch seconds
+            limit: Maximum number of trades
+            db: Database read for the trades older than the ring buffer
+            end_id: With end_id, the cutoff is the trade (end_ts, end_id) so
+                trades sharing end_ts with a lower tradeId are included
+
+        Returns:
+            Structured array with TRADE_DTYPE fields
+        """
+        recent = self.trades.latest(end_ts, limit, end_id)
+        if db is None or len(recent) == limit:
+            return recent
+        if len(recent):
+            end_ts, end_id = float(recent['ts'][0]), int(recent['id'][0])
+        history = await db.find_trades(end_ts, limit - len(recent), self.symbol, end_id)
+        if len(history) == 0:
+            return recent
+        return np.concatenate([history, recent])
+
+    async def get_candles(self, interval: str, start_ts: float, end_ts: float, db=None) -> np.ndarray:
+        """
+        Candles with bucket start in [start_ts, end_ts), in time order.
+
+        Args:
+            interval: One of CANDLE_INTERVALS
+            start_ts: Range start, epoch seconds
+            end_ts: Range end, epoch seconds
+            db: Database used to backfill the part of the range the ring buffer does not cover
+
+        Returns:
+            Structured array with CANDLE_DTYPE fields
+        """
+        series = self.candles[interval]
+        if db is None or series.covers(start_ts):
+            return series.between(start_ts, end_ts)
+
+        first = series.buffer.first_ts()
+        backfill_end = end_ts if first is None else min(first, end_ts)
+        history = await self._backfill(interval, start_ts, backfill_end, db)
+        recent = series.between(start_ts, end_ts) if first is not None else series.buffer.data[:0]
+        if len(history) == 0:
+            return recent
+        return np.concatenate([history, recent])
+
+
+def iso_timestamps(ts: np.ndarray) -> np.ndarray:
+    """Vectorized conversion of epoch seconds to ISO 8601 strings."""
+    return np.datetime_as_string(ts.astype(np.int64).astype('datetime64[s]'), unit='s')
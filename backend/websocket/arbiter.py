@@ -0,0 +1,78 @@
+from typing import Dict, Set, Tuple
+from websocket.codec import channel_kind
+
+
+class FeedArbiter:
+    """
+    Lets through the first copy of every push received over redundant exchange connections.
+
+    Each (channel, instrument) stream remembers the highest position it has
+    delivered: the seqId of book messages (their ts on book channels without
+    one), the tradeId of each trade and the ts of anything else. A copy at or
+    below it was already delivered by another connection and is dropped, so
+    whichever connection is fastest at the moment wins, and losing one of
+    them leaves no gap as long as another is up. A book stream waiting for
+    a snapshot (at start and after a resync) drops deltas until a snapshot
+    arrives, from whichever connection. Since distinct updates of other
+    channels, such as two tickers, can share a millisecond, those are only
+    dropped at their latest ts when the payload matches one already delivered
+    at that ts.
+    """
+
+    def __init__(self):
+        self._last: Dict[Tuple[str, str], int] = {}
+        # (channel, instrument) -> payloads delivered at the latest ts of a channel positioned by ts
+        self._payloads: Dict[Tuple[str, str], Set[str]] = {}
+
+    def expect_snapshot(self, channel: str, symbol: str):
+        """Forget a book stream's position, so the next snapshot from any connection is taken."""
+        self._last.pop((channel, symbol), None)
+        self._payloads.pop((channel, symbol), None)
+
+    def accept(self, message: dict) -> bool:
+        """
+        Whether `message` is the first copy of its push.
+
+        A trades push that partly overlaps what was already delivered has its
+        `data` cut down to the new trades. Events and messages without a
+        recognizable position are always let through.
+        """
+        arg = message.get('arg')
+        data = message.get('data')
+        if arg is None or not data:
+            return True
+        key = (arg.get('channel'), arg.get('instId'))
+        last = self._last.get(key)
+        try:
+            kind = channel_kind(key[0])
+            if kind == 'trades':
+                if last is not None:
+                    fresh = [entry for entry in data if int(entry['tradeId']) > last]
+                    if not fresh:
+                        return False
+                    if len(fresh) != len(data):
+                        message['data'] = data = fresh
+                position = max(int(entry['tradeId']) for entry in data)
+            elif kind == 'books':
+                entry = data[0]
+                seq_id = entry.get('seqId')
+                position = int(seq_id) if seq_id is not None else int(entry['ts'])
+                if last is None:
+                    if message.get('action', 'snapshot') != 'snapshot':
+                        return False
+                elif position <= last:
+                    return False
+            else:
+                position = int(data[0]['ts'])
+                payload = repr(data)
+                if last is not None and position <= last:
+                    seen = self._payloads.get(key)
+                    if position < last or seen is None or payload in seen:
+                        return False
+                    seen.add(payload)
+                    return True
+                self._payloads[key] = {payload}
+        except (KeyError, TypeError, ValueError):
+            return True
+        self._last[key] = position
+        return True
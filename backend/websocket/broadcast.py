@@ -0,0 +1,321 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, Optional, Set, Union
+from websocket import codec
+from websocket.subscription import Subscription, SymbolFeed
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+SEND_LATENCY = metrics.histogram('client_send')
+
+# Message types where only the latest value matters to a lagging client
+CONFLATED_TYPES = ('ticker', 'orderbook')
+
+
+class ClientConnection:
+    """
+    Outbound queue and writer task for a single browser client.
+
+    Trades are queued in order. Ticker and book updates are conflated:
+    while one is still waiting to be sent, a newer one replaces its payload
+    in place instead of taking another slot. A client whose queue stays
+    above the high-water mark for longer than `slow_timeout` seconds, or
+    whose queue overflows, is disconnected.
+    """
+
+    def __init__(self, websocket, max_queue: int, slow_timeout: float, send_timeout: float):
+        self.websocket = websocket
+        self.max_queue = max_queue
+        self.high_water = max(1, max_queue // 2)
+        self.slow_timeout = slow_timeout
+        self.send_timeout = send_timeout
+        self._entries: Deque = deque()
+        self._latest: Dict[str, Union[str, bytes]] = {}
+        self._ready = asyncio.Event()
+        self._slow_since: Optional[float] = None
+        # Symbols this client follows; empty means every symbol
+        self.symbols: Set[str] = set()
+        # Set once the client opts into the subscription protocol, with the task building its frames
+        self.subscription: Optional[Subscription] = None
+        self.pump: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.conflated = 0
+        self.closed = False
+        self.task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def enqueue(self, payload: Union[str, bytes], conflation_key: Optional[str] = None) -> bool:
+        """Queue an encoded message. Returns False if the client should be dropped."""
+        if self.closed:
+            return False
+        if conflation_key is not None:
+            if conflation_key in self._latest:
+                self._latest[conflation_key] = payload
+                self.conflated += 1
+                return True
+            self._latest[conflation_key] = payload
+            self._entries.append((conflation_key, None))
+        else:
+            self._entries.append((None, payload))
+        self._ready.set()
+        return self._check_backlog()
+
+    def _check_backlog(self) -> bool:
+        depth = len(self._entries)
+        if depth >= self.max_queue:
+            logger.warning(f"Client queue overflow ({depth} messages), disconnecting")
+            return False
+        if depth >= self.high_water:
+            now = time.monotonic()
+            if self._slow_since is None:
+                self._slow_since = now
+            elif now - self._slow_since > self.slow_timeout:
+                logger.warning(f"Client slow for {now - self._slow_since:.1f}s, disconnecting")
+                return False
+        else:
+            self._slow_since = None
+        return True
+
+    async def run(self):
+        """Drain the queue to the websocket until the client is closed."""
+        try:
+            while not self.closed:
+                if not self._entries:
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+                key, payload = self._entries.popleft()
+                if key is not None:
+                    payload = self._latest.pop(key)
+                start = time.perf_counter()
+                send = self.websocket.send_bytes if type(payload) is bytes else self.websocket.send_text
+                await asyncio.wait_for(send(payload), self.send_timeout)
+                SEND_LATENCY.record(time.perf_counter() - start)
+                self.sent += 1
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Error sending to client: {e}")
+        finally:
+            self.closed = True
+
+    async def close(self):
+        self.closed = True
+        self._ready.set()
+        for task in (self.pump, self.task):
+            if task and task is not asyncio.current_task():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        try:
+            await self.websocket.close()
+        except Exception:
+            pass
+
+
+class Broadcaster:
+    """
+    Fan-out of outbound messages to all connected clients.
+
+    Each message is serialized once and handed to every client's own queue;
+    the writer tasks send concurrently, so a slow client never delays the
+    ingest loop or the other clients.
+
+    Clients that opt into the subscription protocol are not pushed every
+    message. Publishing only updates the shared per-symbol feeds, and each
+    such client's frame task picks up what changed at its own rate.
+    """
+
+    def __init__(self,
+                 max_queue: Optional[int] = None,
+                 slow_timeout: Optional[float] = None,
+                 send_timeout: Optional[float] = None):
+        self.max_queue = max_queue or int(os.getenv('CLIENT_QUEUE_SIZE', '1000'))
+        self.slow_timeout = slow_timeout or float(os.getenv('CLIENT_SLOW_TIMEOUT', '10'))
+        self.send_timeout = send_timeout or float(os.getenv('CLIENT_SEND_TIMEOUT', '5'))
+        self.clients: Dict[object, ClientConnection] = {}
+        # Clients following every symbol, and clients following specific symbols
+        self._all: Set[ClientConnection] = set()
+        self._by_symbol: Dict[str, Set[ClientConnection]] = {}
+        self._subscribed: Set[ClientConnection] = set()
+        self.feeds: Dict[str, SymbolFeed] = {}
+        self.disconnected_slow = 0
+
+    def __len__(self) -> int:
+        return len(self.clients)
+
+    def add(self, websocket) -> ClientConnection:
+        client = ClientConnection(websocket, self.max_queue, self.slow_timeout, self.send_timeout)
+        client.task = asyncio.create_task(client.run())
+        self.clients[websocket] = client
+        self._all.add(client)
+        return client
+
+    def _detach(self, client: ClientConnection):
+        self._all.discard(client)
+        self._subscribed.discard(client)
+        for symbol in client.symbols:
+            followers = self._by_symbol.get(symbol)
+            if followers is not None:
+                followers.discard(client)
+                if not followers:
+                    del self._by_symbol[symbol]
+
+    async def remove(self, websocket):
+        client = self.clients.pop(websocket, None)
+        if client is not None:
+            self._detach(client)
+            await client.close()
+
+    def configure(self, websocket, request: Dict, max_depth: int):
+        """
+        Apply subscription options from a client request, switching the client
+        from the full stream to per-client frames on first use.
+
+        Raises:
+            ValueError: If the request has invalid options
+        """
+        client = self.clients.get(websocket)
+        if client is None:
+            return
+        if client.subscription is not None:
+            client.subscription.configure(request)
+            return
+        subscription = Subscription(max_depth)
+        subscription.configure(request)
+        subscription.symbols.update(client.symbols)
+        self._detach(client)
+        client.symbols = set()
+        client.subscription = subscription
+        self._subscribed.add(client)
+        client.pump = asyncio.create_task(self._pump(client))
+
+    def acknowledge(self, websocket):
+        """Confirm the current subscription to a client using the subscription protocol."""
+        client = self.clients.get(websocket)
+        if client is not None and client.subscription is not None:
+            self._deliver(client, codec.encode(client.subscription.describe()))
+
+    def subscribe(self, websocket, symbols: Iterable[str]):
+        """Restrict a client to the given symbols, in addition to any it already follows."""
+        client = self.clients.get(websocket)
+        if client is None:
+            return
+        if client.subscription is not None:
+            client.subscription.symbols.update(symbols)
+            return
+        self._all.discard(client)
+        for symbol in symbols:
+            client.symbols.add(symbol)
+            self._by_symbol.setdefault(symbol, set()).add(client)
+        if not client.symbols:
+            self._all.add(client)
+
+    def unsubscribe(self, websocket, symbols: Iterable[str], channels: Iterable[str] = ()):
+        """Stop sending the given symbols to a client; with none left it follows every symbol again."""
+        client = self.clients.get(websocket)
+        if client is None:
+            return
+        if client.subscription is not None:
+            client.subscription.remove(symbols, channels)
+            return
+        for symbol in symbols:
+            client.symbols.discard(symbol)
+            followers = self._by_symbol.get(symbol)
+            if followers is not None:
+                followers.discard(client)
+                if not followers:
+                    del self._by_symbol[symbol]
+        if not client.symbols:
+            self._all.add(client)
+
+    @staticmethod
+    def encode(message: Dict) -> str:
+        return codec.encode(message)
+
+    @staticmethod
+    def conflation_key(message: Dict) -> Optional[str]:
+        msg_type = message.get('type')
+        if msg_type in CONFLATED_TYPES:
+            return f"{msg_type}:{message.get('symbol', '')}"
+        return None
+
+    def send(self, websocket, message: Dict):
+        """Queue a message for a single client."""
+        client = self.clients.get(websocket)
+        # Not `if client`: a client with an empty queue has length zero
+        if client is not None:
+            self._deliver(client, self.encode(message), self.conflation_key(message))
+
+    def _deliver(self, client: ClientConnection, payload: str, key: Optional[str] = None):
+        """Queue a payload for one client, dropping it if it is closed, overflowing or too slow."""
+        if client.closed:
+            # Writer task already failed on this client
+            self._drop(client)
+        elif not client.enqueue(payload, key):
+            self.disconnected_slow += 1
+            self._drop(client)
+
+    def publish(self, message: Dict):
+        """Encode a message once and queue it for every client following its symbol."""
+        symbol = message.get('symbol')
+        feed = self.feeds.get(symbol)
+        if feed is None:
+            feed = self.feeds[symbol] = SymbolFeed(symbol)
+        feed.update(message)
+
+        followers = self._by_symbol.get(symbol)
+        if not self._all and not followers:
+            return
+        payload = self.encode(message)
+        key = self.conflation_key(message)
+        targets = self._all | followers if followers else self._all
+        for client in list(targets):
+            self._deliver(client, payload, key)
+
+    async def _pump(self, client: ClientConnection):
+        """Queue a subscribed client's frames at its subscription's rate."""
+        subscription = client.subscription
+        try:
+            while not client.closed:
+                # A frame still waiting for the writer means the client is behind; keep coalescing
+                if not len(client):
+                    for payload in subscription.frames(self.feeds):
+                        if not client.enqueue(payload):
+                            self.disconnected_slow += 1
+                            self._drop(client)
+                            return
+                await asyncio.sleep(subscription.interval)
+            if client.websocket in self.clients:
+                # Writer task failed on this client
+                self._drop(client)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Error building client frames: {e}")
+            self._drop(client)
+
+    def _drop(self, client: ClientConnection):
+        self.clients.pop(client.websocket, None)
+        self._detach(client)
+        asyncio.create_task(client.close())
+
+    async def close(self):
+        for websocket in list(self.clients):
+            await self.remove(websocket)
+
+    def stats(self) -> Dict:
+        return {
+            'clients': len(self.clients),
+            'subscribed': len(self._subscribed),
+            'queued': sum(len(client) for client in self.clients.values()),
+            'disconnected_slow': self.disconnected_slow
+        }
@@ -0,0 +1,163 @@
+import json
+import struct
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+# Book channels that share the `books` handling (snapshot/update envelopes of price levels)
+BOOK_CHANNELS = ('books', 'books5', 'bbo-tbt', 'books-l2-tbt', 'books50-l2-tbt')
+
+
+def channel_kind(channel: Optional[str]) -> Optional[str]:
+    """Collapse the book channel variants into 'books' for dispatch."""
+    if channel in BOOK_CHANNELS:
+        return 'books'
+    return channel
+
+
+class Frame:
+    """Envelope of one OKX push: channel, instrument, action and the raw `data` entries."""
+    __slots__ = ('channel', 'kind', 'symbol', 'action', 'data', 'message')
+
+    def __init__(self, channel: str, symbol: Optional[str], action: str, data: List[dict], message: dict):
+        self.channel = channel
+        self.kind = channel_kind(channel)
+        self.symbol = symbol
+        self.action = action
+        self.data = data
+        self.message = message
+
+    @classmethod
+    def from_message(cls, message: dict) -> Optional['Frame']:
+        """Return the frame of a data push, or None for events and malformed messages."""
+        arg = message.get('arg')
+        data = message.get('data')
+        if arg is None or data is None or 'event' in message:
+            return None
+        return cls(arg.get('channel'), arg.get('instId'), message.get('action', 'snapshot'), data, message)
+
+
+class TradeRecord:
+    """One trade. Numbers are parsed once; the exchange strings are kept for re-encoding."""
+    __slots__ = ('price', 'size', 'side', 'ts', 'id', 'px', 'sz')
+
+    def __init__(self, entry: dict):
+        self.px = entry['px']
+        self.sz = entry['sz']
+        self.price = float(self.px)
+        self.size = float(self.sz)
+        self.side = entry['side'].lower()
+        self.ts = int(entry['ts'])
+        self.id = int(entry.get('tradeId') or 0)
+
+
+class TickerRecord:
+    """
+    One ticker. Only the last price, 24h open and timestamp are parsed eagerly;
+    the remaining fields are forwarded to clients as the exchange sent them.
+    """
+    __slots__ = ('last', 'open24h', 'ts', 'entry')
+
+    def __init__(self, entry: dict, now_ms: int):
+        self.entry = entry
+        self.last = float(entry.get('last') or 0)
+        self.open24h = float(entry.get('open24h') or 0)
+        self.ts = int(entry.get('ts') or now_ms)
+
+    def field(self, name: str, default: str = '0') -> str:
+        return self.entry.get(name) or default
+
+    def top_of_book(self):
+        """Return (bid_px, bid_sz, ask_px, ask_sz) as floats."""
+        entry = self.entry
+        return (float(entry.get('bidPx') or 0), float(entry.get('bidSz') or 0),
+                float(entry.get('askPx') or 0), float(entry.get('askSz') or 0))
+
+
+def decode_trades(frame: Frame) -> List[TradeRecord]:
+    return [TradeRecord(entry) for entry in frame.data]
+
+
+def decode_ticker(frame: Frame, now_ms: int) -> TickerRecord:
+    return TickerRecord(frame.data[0], now_ms)
+
+
+def book_changes(frame: Frame) -> Optional[Dict[str, set]]:
+    """Prices per side ('asks', 'bids') an incremental book push changed; None for a snapshot."""
+    if frame.action == 'snapshot':
+        return None
+    changed = {'asks': set(), 'bids': set()}
+    for entry in frame.data:
+        for side, prices in changed.items():
+            prices.update(float(level[0]) for level in entry.get(side, ()))
+    return changed
+
+
+# Outbound encoding: compact separators, and book levels that were already
+# encoded once per book version are spliced in instead of being re-serialized
+SEPARATORS = (',', ':')
+
+
+def decimal_string(value: float) -> str:
+    """Plain decimal string for a price or size held as a float."""
+    return f"{value:.10f}".rstrip('0').rstrip('.') or '0'
+
+
+class EncodedLevels(list):
+    """[price, size] levels as exchange strings, carrying their own JSON encoding."""
+    __slots__ = ('json',)
+
+    def __init__(self, levels: List[Tuple[str, str]]):
+        super().__init__([px, sz] for px, sz in levels)
+        self.json = '[' + ','.join(['["' + px + '","' + sz + '"]' for px, sz in levels]) + ']'
+
+
+def encode(message: Dict) -> str:
+    """Encode an outbound client message as JSON."""
+    encoded = [(key, value.json) for key, value in message.items() if type(value) is EncodedLevels]
+    if not encoded:
+        return json.dumps(message, separators=SEPARATORS)
+    rest = {key: value for key, value in message.items() if type(value) is not EncodedLevels}
+    parts = [json.dumps(rest, separators=SEPARATORS)[1:-1]] if rest else []
+    parts.extend(['"' + key + '":' + value for key, value in encoded])
+    return '{' + ','.join(parts) + '}'
+
+
+# Binary client frames (little-endian): kind u8, symbol length u8, symbol (UTF-8), then
+#   book:   action u8 (0 snapshot, 1 update), seq u32, ts ms i64, ask count u16, bid count u16,
+#           (price f64, size f64) per ask, then per bid; size 0 removes the level
+#   trades: missed u32, count u16, (price f64, size f64, side i8 (+1 buy, -1 sell), ts ms i64) per trade
+BINARY_BOOK = 1
+BINARY_TRADES = 2
+BOOK_ACTIONS = {'snapshot': 0, 'update': 1}
+_BOOK_HEADER = struct.Struct('<BIqHH')
+_TRADES_HEADER = struct.Struct('<IH')
+_TRADE = struct.Struct('<ddbq')
+
+
+def timestamp_ms(timestamp: str) -> int:
+    """Milliseconds since the epoch of an outbound message's ISO `timestamp`."""
+    return int(datetime.fromisoformat(timestamp).timestamp() * 1000)
+
+
+def _binary_prefix(kind: int, symbol: str) -> bytes:
+    name = symbol.encode()
+    return bytes((kind, len(name))) + name
+
+
+def encode_book_binary(symbol: str, action: str, seq: int, ts_ms: int,
+                       asks: List[Tuple[str, str]], bids: List[Tuple[str, str]]) -> bytes:
+    values = [float(value) for level in asks for value in level] + \
+        [float(value) for level in bids for value in level]
+    return (_binary_prefix(BINARY_BOOK, symbol) +
+            _BOOK_HEADER.pack(BOOK_ACTIONS[action], seq, ts_ms, len(asks), len(bids)) +
+            struct.pack(f'<{len(values)}d', *values))
+
+
+def pack_trade(message: Dict) -> bytes:
+    """Binary record of one outbound trade message."""
+    return _TRADE.pack(float(message['price']), float(message['size']),
+                       1 if message['side'] == 'buy' else -1, timestamp_ms(message['timestamp']))
+
+
+def encode_trades_binary(symbol: str, missed: int, records: List[bytes]) -> bytes:
+    return _binary_prefix(BINARY_TRADES, symbol) + _TRADES_HEADER.pack(missed, len(records)) + b''.join(records)
@@ -0,0 +1,165 @@
+import asyncio
+import json
+import aiohttp
+import logging
+import os
+import time
+from typing import List
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Messages handled back to back before yielding to the other connections
+YIELD_EVERY = 64
+# Seconds before the first reconnect attempt; doubles per failed attempt up to the feed's maximum
+RECONNECT_DELAY = float(os.getenv('RECONNECT_DELAY', '1'))
+# Backoff at which, with no connection up at all, the feed falls back to simulated data
+SIMULATION_AFTER_DELAY = 20
+
+DECODE_LATENCY = metrics.histogram('decode')
+
+
+class ExchangeConnection:
+    """
+    One OKX WebSocket connection serving a shard of the configured instruments.
+
+    Each shard is served by several replicas subscribed to the same
+    channels. Frames are decoded here and passed through the feed's
+    `FeedArbiter`, so only the first copy of each push reaches the
+    pipeline (`ingest`), which only enqueues it; the socket is read at
+    exchange speed whatever happens downstream. Each connection runs as
+    its own task, reconnects on its own, and yields to the event loop
+    regularly, so a busy shard cannot starve the others.
+    """
+
+    def __init__(self, feed, index: int, symbols: List[str], channels: List[str], replica: int = 0):
+        self.feed = feed
+        self.index = index
+        self.replica = replica
+        self.symbols = symbols
+        self.channels = channels
+        self.ws = None
+        self.reconnect_delay = RECONNECT_DELAY
+        self.messages = 0
+        self.delivered = 0
+        self.duplicates = 0
+        self.reconnects = 0
+
+    @property
+    def name(self) -> str:
+        return f"conn-{self.index}-{self.replica}"
+
+    def subscription_args(self, symbols: List[str]) -> List[dict]:
+        return [{"channel": channel, "instId": symbol} for symbol in symbols for channel in self.channels]
+
+    async def subscribe(self) -> bool:
+        """Subscribe to every channel of every symbol in this shard."""
+        if not self.ws:
+            return False
+        try:
+            await self.ws.send_str(json.dumps({"op": "subscribe", "args": self.subscription_args(self.symbols)}))
+            logger.info(f"{self.name}: subscribed to {len(self.symbols)} instruments")
+            return True
+        except Exception as e:
+            logger.error(f"{self.name}: failed to subscribe to market data: {e}")
+            return False
+
+    async def resync(self, symbol: str, channel: str):
+        """Resubscribe one channel of one symbol to receive a fresh snapshot."""
+        if not self.ws:
+            return
+        arg = {"channel": channel, "instId": symbol}
+        try:
+            await self.ws.send_str(json.dumps({"op": "unsubscribe", "args": [arg]}))
+            await self.ws.send_str(json.dumps({"op": "subscribe", "args": [arg]}))
+            logger.info(f"{self.name}: requested order book resync for {symbol}")
+        except Exception as e:
+            logger.error(f"{self.name}: failed to resync order book: {e}")
+
+    async def reconnect(self):
+        """Close the socket and back off exponentially before the next attempt."""
+        if self.ws:
+            try:
+                await self.ws.close()
+            except Exception:
+                pass
+        self.ws = None
+        self.reconnects += 1
+
+        await asyncio.sleep(self.reconnect_delay)
+        self.reconnect_delay = min(self.reconnect_delay * 2, self.feed.max_reconnect_delay)
+
+        # Replicas cover for each other; only an outage of every connection means simulated data
+        if self.reconnect_delay >= SIMULATION_AFTER_DELAY and not self.feed.connected:
+            self.feed.enable_simulation()
+
+    async def run(self):
+        feed = self.feed
+        arbiter = feed.arbiter
+        self.reconnect_delay = RECONNECT_DELAY
+        ws_kwargs = {
+            'heartbeat': 30,
+            'headers': {
+                'User-Agent': 'Mozilla/5.0',
+                'Accept': 'application/json',
+                'Content-Type': 'application/json'
+            }
+        }
+        while feed.running and not feed.use_simulation:
+            try:
+                # The feed's session (and its connection pool) is shared by every connection and reconnect
+                async with feed.session().ws_connect(feed.okx_ws_url, **ws_kwargs) as ws:
+                    self.ws = ws
+                    logger.info(f"{self.name}: connected to OKX WebSocket")
+
+                    if not await self.subscribe():
+                        await self.reconnect()
+                        continue
+
+                    self.reconnect_delay = RECONNECT_DELAY
+
+                    async for msg in ws:
+                        if msg.type == aiohttp.WSMsgType.TEXT:
+                            self.messages += 1
+                            try:
+                                t0 = time.perf_counter()
+                                data = json.loads(msg.data)
+                                DECODE_LATENCY.record(time.perf_counter() - t0)
+                                entries = data.get('data')
+                                if arbiter.accept(data):
+                                    self.delivered += 1
+                                    if feed.recorder:
+                                        # A trades push the arbiter trimmed is recorded as delivered
+                                        feed.recorder.record(msg.data if data.get('data') is entries
+                                                             else json.dumps(data))
+                                    await feed.ingest(data)
+                                else:
+                                    self.duplicates += 1
+                            except json.JSONDecodeError as e:
+                                logger.error(f"Failed to decode message: {e}")
+                            except Exception as e:
+                                logger.error(f"Error processing message: {e}")
+
+                            if self.messages % YIELD_EVERY == 0:
+                                await asyncio.sleep(0)
+
+                        elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                            logger.error(f"{self.name}: WebSocket connection closed: {msg.type}")
+                            break
+                    self.ws = None
+                await self.reconnect()
+
+            except asyncio.CancelledError:
+                raise
+            except aiohttp.ClientError as e:
+                logger.error(f"{self.name}: WebSocket connection error: {e}")
+                await self.reconnect()
+            except Exception as e:
+                logger.error(f"{self.name}: unexpected error in WebSocket connection: {e}")
+                self.ws = None
+                await self.reconnect()
+
+    async def close(self):
+        if self.ws:
+            await self.ws.close()
+        self.ws = None
@@ -2,30 +2,105 @@ import asyncio
 import json
 import aiohttp
 import logging
-import random
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import Dict, List, Optional
 from urllib.parse import urlparse
+from archive import ArchiveCompactor, archive
 from database import db
+from websocket.arbiter import FeedArbiter
+from websocket.broadcast import Broadcaster
+from websocket.codec import EncodedLevels, Frame, book_changes, channel_kind, decode_ticker, decode_trades
+from websocket.connection import ExchangeConnection
+from websocket.pipeline import Stage, stage_gauges
+from websocket.subscription import Subscription
+from websocket.symbol_state import SymbolState
+from models.matching import EPSILON, Fill
+from recorder import FrameRecorder
+from snapshot import StateSnapshotter
+from synthetic_market import (SIMULATION_BOOK_RATE, SIMULATION_SEED, SIMULATION_TICKER_INTERVAL,
+                              SIMULATION_TRADE_RATE, SyntheticMarket, run as run_synthetic_market)
+from metrics import SampledLog, metrics
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+EXCHANGE_LATENCY = metrics.histogram('exchange')
+BOOK_LATENCY = metrics.histogram('book_update')
+DB_ENQUEUE_LATENCY = metrics.histogram('db_enqueue')
+
 class MarketDataWebSocket:
-    def __init__(self):
-        self.clients = set()
+    def __init__(self, shared: Optional[str] = None):
+        """
+        Args:
+            shared: 'publish' to mirror every symbol's state into shared memory for API
+                workers (ingest process), 'attach' to read it from there (see SymbolState)
+        """
+        self.shared = shared
+        self.clients = Broadcaster()
         self.okx_ws_url = os.getenv('OKX_WS_URL', 'wss://ws.okx.com:8443/ws/v5/public')
-        self.ws = None
         self.running = False
-        self.reconnect_delay = 5
         self.max_reconnect_delay = 60
         self._connection_task = None
         self._simulation_task = None
         self.use_simulation = False
-        self.last_price = 45000.0
-        self.volatility = 0.002
         self.last_process_time = None
+        self.book_channel = os.getenv('OKX_BOOK_CHANNEL', 'books')
+        self.book_depth = int(os.getenv('BOOK_DEPTH', '20'))
+
+        # Instruments are sharded across connections, each with its own per-symbol state
+        self.instruments: List[str] = [
+            symbol.strip() for symbol in os.getenv('INSTRUMENTS', 'BTC-USDT-SWAP').split(',') if symbol.strip()
+        ]
+        self.default_symbol = self.instruments[0]
+        self.symbols_per_connection = int(os.getenv('SYMBOLS_PER_CONNECTION', '50'))
+        # Redundant connections per shard; the first copy of each push wins, so losing one leaves no gap
+        self.redundancy = max(1, int(os.getenv('EXCHANGE_REDUNDANCY', '2')))
+        self._model_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='model-fit')
+        self.symbols: Dict[str, SymbolState] = {
+            symbol: SymbolState(symbol, self._model_executor, shared) for symbol in self.instruments
+        }
+        self.connections: List[ExchangeConnection] = []
+        self._symbol_connections: Dict[str, List[ExchangeConnection]] = {}
+        self.arbiter = FeedArbiter()
+        self._session: Optional[aiohttp.ClientSession] = None
+        channels = ['tickers', 'trades', self.book_channel]
+        shard_count = max(1, -(-len(self.instruments) // self.symbols_per_connection))
+        for index in range(shard_count):
+            shard = self.instruments[index::shard_count]
+            replicas = [ExchangeConnection(self, index, shard, channels, replica)
+                        for replica in range(self.redundancy)]
+            self.connections.extend(replicas)
+            for symbol in shard:
+                self._symbol_connections[symbol] = replicas
+
+        # Channel kind -> handler; book channel variants all dispatch to 'books'
+        self._latency_log = SampledLog(float(os.getenv('LATENCY_LOG_INTERVAL', '10')))
+        self._handlers = {
+            'books': self._on_books,
+            'trades': self._on_trades,
+            'tickers': self._on_ticker
+        }
+
+        # Staged ingest: exchange readers only decode and enqueue frames; book and model updates,
+        # persistence and broadcast each run on their own task behind a bounded queue. Under
+        # pressure tickers and book snapshots are conflated per symbol; trades and book deltas
+        # are never dropped, so a full queue makes their producer wait
+        self.process_stage = Stage('process', self._process_frame, {'tickers': 'conflate'})
+        self.persist_stage = Stage('persist', self._persist, {'ticker': 'conflate', 'orderbook': 'conflate'})
+        self.broadcast_stage = Stage('broadcast', self.send_to_clients,
+                                     {'ticker': 'conflate', 'orderbook': 'conflate'})
+        self.stages = [self.process_stage, self.persist_stage, self.broadcast_stage]
+
+        record_dir = os.getenv('RECORD_DIR')
+        self.recorder = FrameRecorder(record_dir) if record_dir else None
+        # Move aged documents from MongoDB to the columnar archive; only one process should do this
+        self.compactor = ArchiveCompactor(db, archive) if os.getenv('ARCHIVE_ENABLED') == '1' else None
+        # Hot state is snapshotted by the process that owns it, for a warm restart
+        self.snapshotter = StateSnapshotter(self.symbols) \
+            if shared != 'attach' and os.getenv('SNAPSHOT_ENABLED', '1') == '1' else None
         
         # Enhanced proxy configuration
         self.proxy = None
@@ -46,256 +121,401 @@ class MarketDataWebSocket:
                 except Exception as e:
                     logger.error(f"Invalid proxy URL: {e}")
 
+    @property
+    def ws(self):
+        """First connected exchange socket, or None when no connection is up."""
+        for connection in self.connections:
+            if connection.ws is not None:
+                return connection.ws
+        return None
+
+    @property
+    def connected(self) -> bool:
+        return self.ws is not None
+
+    def session(self) -> aiohttp.ClientSession:
+        """HTTP session shared by every exchange connection, created on first use."""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=30),
+                connector=aiohttp.TCPConnector(
+                    ssl=False,  # Disable SSL verification for VPN
+                    enable_cleanup_closed=True  # Cleanup closed connections
+                ),
+                trust_env=True  # Trust environment for proxy settings
+            )
+        return self._session
+
+    def state(self, symbol: Optional[str] = None) -> SymbolState:
+        """Per-symbol state, falling back to the default instrument for unknown symbols."""
+        return self.symbols.get(symbol) or self.symbols[self.default_symbol]
+
+    async def handle_client_message(self, websocket, text):
+        """
+        Apply a client request: {"op": "subscribe" | "unsubscribe", "symbols": [...]}.
+
+        A subscribe request may also carry subscription options, which switch
+        the client from the full message stream to coalesced frames:
+        "channels" (any of "ticker", "book", "trades"), "depth" (book levels),
+        "maxRate" (frames per second) and "format" ("json" or "binary").
+        An unsubscribe request may list "channels" to drop.
+
+        "order" and "cancel" requests manage paper orders (see handle_orders).
+        """
+        try:
+            request = json.loads(text)
+        except json.JSONDecodeError:
+            return
+        if not isinstance(request, dict):
+            return
+        if request.get('op') in ('order', 'cancel'):
+            self.handle_orders(websocket, request)
+            return
+        symbols = [symbol for symbol in request.get('symbols', []) if symbol in self.symbols]
+        if request.get('op') == 'subscribe':
+            if Subscription.requested(request):
+                try:
+                    self.clients.configure(websocket, request, self.book_depth)
+                except ValueError as e:
+                    self.clients.send(websocket, {'type': 'error', 'error': str(e)})
+                    return
+            self.clients.subscribe(websocket, symbols)
+        elif request.get('op') == 'unsubscribe':
+            channels = request.get('channels')
+            self.clients.unsubscribe(websocket, symbols, channels if isinstance(channels, list) else ())
+        else:
+            return
+        self.clients.acknowledge(websocket)
+
+    def handle_orders(self, websocket, request: Dict):
+        """
+        Place or cancel post-only paper orders on one symbol.
+
+        {"op": "order", "symbol", "side", "price", "size", "clientOrderId"} places
+        one order, or every order listed under "orders"; {"op": "cancel",
+        "symbol", "orderIds": [...]} cancels the listed orders, or all of the
+        client's orders on the symbol without "orderIds". The outcome of each
+        is acknowledged in a single "orders" message, and fills arrive as
+        "fills" messages as the live trades consume the order's queue.
+        """
+        state = self.symbols.get(request.get('symbol'))
+        if state is None:
+            self.clients.send(websocket, {'type': 'error', 'error': f"Unknown symbol: {request.get('symbol')}"})
+            return
+        matching = state.matching
+        results = []
+        if request['op'] == 'order':
+            orders = request.get('orders')
+            for spec in orders if isinstance(orders, list) else [request]:
+                client_id = spec.get('clientOrderId') if isinstance(spec, dict) else None
+                try:
+                    if not isinstance(spec, dict):
+                        raise ValueError("Orders must be objects")
+                    order = matching.place(websocket, spec.get('side'), float(spec.get('price')),
+                                           float(spec.get('size')), state.book, client_id)
+                    results.append({'status': 'open', **order.to_dict()})
+                except (TypeError, ValueError) as e:
+                    results.append({'status': 'rejected', 'clientOrderId': client_id, 'error': str(e)})
+        else:
+            order_ids = request.get('orderIds')
+            if not isinstance(order_ids, list):
+                cancelled = matching.cancel_owner(websocket)
+                results = [{'status': 'cancelled', **order.to_dict()} for order in cancelled]
+            for order_id in order_ids if isinstance(order_ids, list) else ():
+                order = matching.cancel(order_id, websocket) if isinstance(order_id, int) else None
+                if order is None:
+                    results.append({'status': 'rejected', 'orderId': order_id, 'error': 'Unknown order'})
+                else:
+                    results.append({'status': 'cancelled', **order.to_dict()})
+        self.clients.send(websocket, {'type': 'orders', 'symbol': state.symbol, 'orders': results})
+
+    def send_fills(self, state: SymbolState, fills: List[Fill], timestamp: str):
+        """Send each client the fills of its paper orders, one message per client and event."""
+        by_owner = {}
+        for order, quantity in fills:
+            by_owner.setdefault(order.owner, []).append({
+                'orderId': order.id,
+                'clientOrderId': order.client_id,
+                'side': order.side,
+                'price': order.price,
+                'size': quantity,
+                'filled': order.filled,
+                'remaining': max(order.remaining, 0.0),
+                'status': 'filled' if order.remaining <= EPSILON else 'partial',
+                'liquidity': 'maker'
+            })
+        for owner, entries in by_owner.items():
+            self.clients.send(owner, {'type': 'fills', 'timestamp': timestamp, 'symbol': state.symbol,
+                                      'fills': entries})
+
     async def register(self, websocket):
         self.clients.add(websocket)
         logger.info(f"New client connected. Total clients: {len(self.clients)}")
-        if self.use_simulation:
-            await self.send_simulated_data_to_client(websocket)
 
     async def unregister(self, websocket):
-        self.clients.remove(websocket)
+        for state in self.symbols.values():
+            state.matching.cancel_owner(websocket)
+        await self.clients.remove(websocket)
         logger.info(f"Client disconnected. Total clients: {len(self.clients)}")
 
     async def send_to_clients(self, message):
-        if not self.clients:
-            return
-        dead_clients = set()
-        for client in self.clients:
-            try:
-                await client.send_text(json.dumps(message))
-            except Exception as e:
-                logger.error(f"Error sending to client: {e}")
-                dead_clients.add(client)
-        for dead_client in dead_clients:
-            await self.unregister(dead_client)
-
-    async def send_simulated_data_to_client(self, websocket):
-        try:
-            ticker_data = self.generate_simulated_ticker()
-            await websocket.send_text(json.dumps(ticker_data))
-        except Exception as e:
-            logger.error(f"Error sending initial simulated data: {e}")
-
-    def generate_simulated_ticker(self):
-        price_change = self.last_price * self.volatility * (random.random() * 2 - 1)
-        self.last_price += price_change
-        high_24h = self.last_price * (1 + random.random() * 0.05)
-        low_24h = self.last_price * (1 - random.random() * 0.05)
-        volume_24h = random.uniform(1000, 5000)
-        return {
-            'type': 'ticker',
-            'timestamp': datetime.now().isoformat(),
-            'price': round(self.last_price, 2),
-            'high24h': round(high_24h, 2),
-            'low24h': round(low_24h, 2),
-            'volume24h': round(volume_24h, 2),
-            'change24h': round((price_change / self.last_price) * 100, 2)
-        }
+        if self.shared == 'publish':
+            state = self.symbols.get(message.get('symbol'))
+            if state is not None:
+                state.shared.publish(state, message)
+        # Encoded once and queued per client; slow clients are conflated or dropped
+        self.clients.publish(message)
+
+    async def ingest(self, data: dict):
+        """Hand a decoded exchange message to the pipeline."""
+        arg = data.get('arg') or {}
+        await self.process_stage.submit(channel_kind(arg.get('channel')), arg.get('instId'), data)
+
+    async def _process_frame(self, data: dict):
+        for message in await self.process_market_data(data):
+            await self.broadcast_stage.submit(message['type'], message.get('symbol'), message)
+
+    async def _persist(self, item):
+        queue, args = item
+        start = time.perf_counter()
+        await queue(*args)
+        DB_ENQUEUE_LATENCY.record(time.perf_counter() - start)
 
     async def simulate_market_data(self):
-        while self.running and self.use_simulation:
-            try:
-                ticker_data = self.generate_simulated_ticker()
-                await self.send_to_clients(ticker_data)
-                if random.random() < 0.3:
-                    trade_data = {
-                        'type': 'trade',
-                        'timestamp': datetime.now().isoformat(),
-                        'price': round(self.last_price + random.uniform(-10, 10), 2),
-                        'size': round(random.uniform(0.1, 2.0), 4),
-                        'side': random.choice(['buy', 'sell'])
-                    }
-                    await self.send_to_clients(trade_data)
-                await asyncio.sleep(1)
-            except Exception as e:
-                logger.error(f"Error in simulation: {e}")
-                await asyncio.sleep(1)
-
-    async def reconnect(self):
-        """Handle reconnection with exponential backoff."""
-        if self.ws:
-            try:
-                await self.ws.close()
-            except:
-                pass
-        self.ws = None
-        
-        await asyncio.sleep(self.reconnect_delay)
-        self.reconnect_delay = min(self.reconnect_delay * 2, self.max_reconnect_delay)
-        
-        if self.reconnect_delay >= 20 and not self.use_simulation:
-            logger.info("Switching to simulated market data after multiple failed connection attempts")
-            self.use_simulation = True
-            self._simulation_task = asyncio.create_task(self.simulate_market_data())
+        """Drive the pipeline from a synthetic market, the same way exchange frames do."""
+        seed = int(SIMULATION_SEED) if SIMULATION_SEED else None
+        market = SyntheticMarket(self.instruments, seed=seed, trade_rate=SIMULATION_TRADE_RATE,
+                                 book_rate=SIMULATION_BOOK_RATE, ticker_interval=SIMULATION_TICKER_INTERVAL)
+        logger.info(f"Simulating {len(self.instruments)} instruments (seed {seed})")
+        await run_synthetic_market(market, self, mode='realtime')
+
+    def enable_simulation(self):
+        """Fall back to simulated market data after repeated connection failures."""
+        if self.use_simulation:
+            return
+        logger.info("Switching to simulated market data after multiple failed connection attempts")
+        self.use_simulation = True
+        self._simulation_task = asyncio.create_task(self.simulate_market_data())
 
     async def connect_to_exchange(self):
-        self.reconnect_delay = 5
-        while self.running and not self.use_simulation:
-            try:
-                timeout = aiohttp.ClientTimeout(total=30)
-                # Configure for VPN usage
-                connector = aiohttp.TCPConnector(
-                    ssl=False,  # Disable SSL verification for VPN
-                    force_close=True,  # Force close connections
-                    enable_cleanup_closed=True  # Cleanup closed connections
-                )
-                
-                async with aiohttp.ClientSession(
-                    timeout=timeout,
-                    connector=connector,
-                    trust_env=True  # Trust environment for proxy settings
-                ) as session:
-                    ws_kwargs = {
-                        'heartbeat': 30,
-                        'headers': {
-                            'User-Agent': 'Mozilla/5.0',
-                            'Accept': 'application/json',
-                            'Content-Type': 'application/json'
-                        }
-                    }
-                    
-                    try:
-                        async with session.ws_connect(self.okx_ws_url, **ws_kwargs) as ws:
-                            self.ws = ws
-                            logger.info("Connected to OKX WebSocket")
-                            
-                            if not await self.subscribe_market_data():
-                                continue
-                            
-                            self.reconnect_delay = 5
-                            
-                            async for msg in ws:
-                                if msg.type == aiohttp.WSMsgType.TEXT:
-                                    try:
-                                        data = json.loads(msg.data)
-                                        processed_data = await self.process_market_data(data)
-                                        if processed_data:
-                                            await self.send_to_clients(processed_data)
-                                    except json.JSONDecodeError as e:
-                                        logger.error(f"Failed to decode message: {e}")
-                                    except Exception as e:
-                                        logger.error(f"Error processing message: {e}")
-                                
-                                elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
-                                    logger.error(f"WebSocket connection closed: {msg.type}")
-                                    break
-                    except aiohttp.ClientError as e:
-                        logger.error(f"WebSocket connection error: {e}")
-                        await self.reconnect()
-
-            except Exception as e:
-                logger.error(f"Unexpected error in WebSocket connection: {e}")
-                self.ws = None
-                await self.reconnect()
-            finally:
-                if connector and not connector.closed:
-                    await connector.close()
-
-    async def subscribe_market_data(self):
-        """Subscribe to OKX market data."""
-        subscribe_message = {
-            "op": "subscribe",
-            "args": [
-                {
-                    "channel": "tickers",
-                    "instId": "BTC-USDT-SWAP"
-                },
-                {
-                    "channel": "trades",
-                    "instId": "BTC-USDT-SWAP"
-                }
-            ]
-        }
-        if self.ws:
-            try:
-                await self.ws.send_str(json.dumps(subscribe_message))
-                logger.info("Subscribed to market data and trades")
-                return True
-            except Exception as e:
-                logger.error(f"Failed to subscribe to market data: {e}")
-                await self.reconnect()
-                return False
-        return False
-
-    async def process_market_data(self, data):
-        """Process OKX WebSocket data format."""
+        """Run every sharded exchange connection as its own task."""
+        logger.info(f"Streaming {len(self.instruments)} instruments over {len(self.connections)} connections "
+                    f"({self.redundancy} per shard)")
+        await asyncio.gather(*(connection.run() for connection in self.connections))
+
+    async def resync_book(self, state: SymbolState):
+        """Resubscribe to the book channel on one live replica to receive a fresh snapshot."""
+        state.book.needs_resync = False
+        # Deltas from the other replicas are dropped until a snapshot arrives
+        self.arbiter.expect_snapshot(self.book_channel, state.symbol)
+        for connection in self._symbol_connections.get(state.symbol, []):
+            if connection.ws is not None:
+                await connection.resync(state.symbol, self.book_channel)
+                break
+
+    async def process_market_data(self, data) -> List[Dict]:
+        """
+        Process OKX WebSocket data format.
+
+        Returns:
+            Messages for clients: one per trade of a trade push, at most one otherwise
+        """
         try:
-            start_time = time.time()
-            
             if 'event' in data:
                 logger.info(f"Received event: {data['event']}")
-                return None
-                
-            if 'arg' not in data or 'data' not in data:
-                return None
-
-            channel = data['arg'].get('channel')
-            
-            # Store raw data in database
-            await db.store_market_data(data)
-            
-            # Handle trades data
-            if channel == 'trades':
-                trade_data = data['data'][0]
-                await db.store_trade(trade_data)
-                return {
-                    'type': 'trade',
-                    'timestamp': datetime.fromtimestamp(int(trade_data['ts']) / 1000).isoformat(),
-                    'price': str(float(trade_data['px'])),
-                    'size': str(float(trade_data['sz'])),
-                    'side': trade_data['side'].lower()
-                }
-            
-            # Handle ticker data
-            elif channel == 'tickers':
-                ticker_data = data['data'][0]
-                
-                # Calculate 24h price change percentage
-                open_24h = float(ticker_data.get('open24h', 0))
-                last_price = float(ticker_data.get('last', 0))
-                change_24h = ((last_price - open_24h) / open_24h * 100) if open_24h > 0 else 0
-
-                # Calculate processing latency
-                process_time = (time.time() - start_time) * 1000
-                logger.info(f"Processing latency: {process_time:.2f}ms")
-
-                # Format orderbook data
-                orderbook = {
-                    'asks': [[str(ticker_data.get('askPx', '0')), str(ticker_data.get('askSz', '0'))]],
-                    'bids': [[str(ticker_data.get('bidPx', '0')), str(ticker_data.get('bidSz', '0'))]]
-                }
-                await db.store_orderbook(orderbook)
-
-                return {
-                    'type': 'ticker',
-                    'timestamp': datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ"),
-                    'exchange': 'OKX',
-                    'symbol': 'BTC-USDT-SWAP',
-                    'price': str(last_price),
-                    'high24h': str(float(ticker_data.get('high24h', 0))),
-                    'low24h': str(float(ticker_data.get('low24h', 0))),
-                    'volume24h': str(float(ticker_data.get('volCcy24h', 0))),
-                    'change24h': str(round(change_24h, 2)),
-                    'asks': orderbook['asks'],
-                    'bids': orderbook['bids'],
-                    'latency': str(round(process_time, 2))
-                }
+                return []
+
+            frame = Frame.from_message(data)
+            if frame is None:
+                return []
+            state = self.symbols.get(frame.symbol or self.default_symbol)
+            handler = self._handlers.get(frame.kind)
+            if state is None or handler is None:
+                return []
+            state.messages += 1
+            if frame.data:
+                exchange_ts = frame.data[0].get('ts')
+                if exchange_ts:
+                    EXCHANGE_LATENCY.record(time.time() - int(exchange_ts) / 1000)
+            result = await handler(frame, state)
+            if result is None:
+                return []
+            return result if isinstance(result, list) else [result]
 
         except Exception as e:
             logger.error(f"Error processing OKX data: {str(e)}")
             logger.error(f"Raw data: {json.dumps(data)}")
+            return []
+
+    async def _on_books(self, frame: Frame, state: SymbolState):
+        # Book updates are applied to the local book, not stored raw
+        book = state.book
+        start = time.perf_counter()
+        for book_data in frame.data:
+            if not book.apply(frame.action, book_data):
+                break
+        BOOK_LATENCY.record(time.perf_counter() - start)
+        if book.needs_resync:
+            await self.resync_book(state)
+            return None
+        if not book.synced:
             return None
+        best_bid = book.best_bid()
+        best_ask = book.best_ask()
+        if best_bid and best_ask:
+            state.impact_model.on_book(best_bid[0], best_ask[0])
+            state.maker_taker.on_book(best_bid[0], best_bid[1], best_ask[0], best_ask[1], book.ts)
+        timestamp = datetime.fromtimestamp(book.ts / 1000).isoformat()
+        if state.matching:
+            self.send_fills(state, state.matching.on_book(book, book_changes(frame)), timestamp)
+        levels = book.encoded_levels(self.book_depth)
+        return {
+            'type': 'orderbook',
+            'timestamp': timestamp,
+            'exchange': 'OKX',
+            'symbol': state.symbol,
+            'asks': levels['asks'],
+            'bids': levels['bids']
+        }
+
+    async def _on_trades(self, frame: Frame, state: SymbolState):
+        if not frame.data:
+            return None
+        await self.persist_stage.submit('trade', state.symbol, (db.queue_market_data, (frame.message, state.symbol)))
+        await self.persist_stage.submit('trade', state.symbol, (db.queue_trades, (frame.data, state.symbol)))
+        messages = []
+        for trade in decode_trades(frame):
+            state.impact_model.on_trade(trade.price, trade.size, trade.ts)
+            state.maker_taker.on_trade(trade.price, trade.size, trade.side, trade.ts)
+            state.tick_store.on_trade(trade.price, trade.size, trade.side, trade.ts, trade.id)
+            state.volatility.on_trade(trade.price, trade.ts)
+            timestamp = datetime.fromtimestamp(trade.ts / 1000).isoformat()
+            if state.matching:
+                fills = state.matching.on_trade(trade.price, trade.size, trade.side)
+                if fills:
+                    self.send_fills(state, fills, timestamp)
+            messages.append({
+                'type': 'trade',
+                'timestamp': timestamp,
+                'symbol': state.symbol,
+                'price': trade.px,
+                'size': trade.sz,
+                'side': trade.side
+            })
+        return messages
+
+    async def _on_ticker(self, frame: Frame, state: SymbolState):
+        start_time = time.time()
+        ticker = decode_ticker(frame, int(start_time * 1000))
+        state.tick_store.on_tick(ticker.last, ticker.ts)
+
+        # Calculate 24h price change percentage
+        change_24h = ((ticker.last - ticker.open24h) / ticker.open24h * 100) if ticker.open24h > 0 else 0
+
+        # Calculate processing latency; the log line is sampled to keep it off the hot path
+        process_time = (time.time() - start_time) * 1000
+        if self._latency_log.due():
+            logger.info(f"Processing latency: {process_time:.2f}ms, stages: {metrics.summary()}")
+
+        # Format orderbook data, preferring the local book over the ticker's top of book
+        book = state.book
+        if book.synced:
+            orderbook = book.encoded_levels(self.book_depth)
+        else:
+            bid_px, bid_sz, ask_px, ask_sz = ticker.top_of_book()
+            if bid_px > 0 and ask_px > 0:
+                state.maker_taker.on_book(bid_px, bid_sz, ask_px, ask_sz, ticker.ts)
+            orderbook = {
+                'asks': EncodedLevels([(ticker.field('askPx'), ticker.field('askSz'))]),
+                'bids': EncodedLevels([(ticker.field('bidPx'), ticker.field('bidSz'))])
+            }
+        await self.persist_stage.submit('ticker', state.symbol, (db.queue_market_data, (frame.message, state.symbol)))
+        await self.persist_stage.submit('orderbook', state.symbol, (db.queue_orderbook, (orderbook, state.symbol, ticker.ts)))
+
+        return {
+            'type': 'ticker',
+            'timestamp': datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ"),
+            'exchange': 'OKX',
+            'symbol': state.symbol,
+            'price': ticker.field('last'),
+            'high24h': ticker.field('high24h'),
+            'low24h': ticker.field('low24h'),
+            'volume24h': ticker.field('volCcy24h'),
+            'change24h': str(round(change_24h, 2)),
+            'asks': orderbook['asks'],
+            'bids': orderbook['bids'],
+            'latency': str(round(process_time, 2)),
+            # Exchange time of the update, epoch milliseconds
+            'ts': ticker.ts
+        }
+
+    def gauges(self) -> List[tuple]:
+        """Connection, client and per-symbol gauges/counters for the metrics endpoint."""
+        client_stats = self.clients.stats()
+        compactor_gauges = self.compactor.gauges() if self.compactor else []
+        snapshot_gauges = self.snapshotter.gauges() if self.snapshotter else []
+        return stage_gauges(self.stages) + compactor_gauges + snapshot_gauges + [
+            ('clients', 'gauge', 'Connected client websockets', [({}, client_stats['clients'])]),
+            ('clients_subscribed', 'gauge', 'Client websockets receiving coalesced frames',
+             [({}, client_stats['subscribed'])]),
+            ('client_queue_depth', 'gauge', 'Messages queued across client writers',
+             [({}, client_stats['queued'])]),
+            ('clients_disconnected_slow_total', 'counter', 'Clients dropped for falling behind',
+             [({}, client_stats['disconnected_slow'])]),
+            ('exchange_connected', 'gauge', 'Whether each exchange connection is up',
+             [({'connection': c.name}, int(c.ws is not None)) for c in self.connections]),
+            ('exchange_reconnects_total', 'counter', 'Exchange reconnect attempts',
+             [({'connection': c.name}, c.reconnects) for c in self.connections]),
+            ('exchange_messages_total', 'counter', 'Frames received per exchange connection',
+             [({'connection': c.name}, c.messages) for c in self.connections]),
+            ('exchange_messages_delivered_total', 'counter',
+             'Frames per exchange connection that were the first copy of their push',
+             [({'connection': c.name}, c.delivered) for c in self.connections]),
+            ('exchange_duplicates_total', 'counter',
+             'Frames per exchange connection dropped as already delivered by another replica',
+             [({'connection': c.name}, c.duplicates) for c in self.connections]),
+            ('symbol_messages_total', 'counter', 'Frames processed per instrument',
+             [({'symbol': symbol}, state.messages) for symbol, state in self.symbols.items()]),
+            ('book_synced', 'gauge', 'Whether the local order book is in sync',
+             [({'symbol': symbol}, int(state.book.synced)) for symbol, state in self.symbols.items()]),
+            ('book_checksum_failures_total', 'counter', 'Order book checksum mismatches',
+             [({'symbol': symbol}, state.book.checksum_failures) for symbol, state in self.symbols.items()])
+        ] + self.paper_gauges() + self.volatility_gauges()
+
+    def paper_gauges(self) -> List[tuple]:
+        return [
+            ('paper_orders_resting', 'gauge', 'Resting paper orders per instrument',
+             [({'symbol': symbol}, len(state.matching)) for symbol, state in self.symbols.items()]),
+            ('paper_fills_total', 'counter', 'Paper order fills per instrument',
+             [({'symbol': symbol}, state.matching.fills) for symbol, state in self.symbols.items()])
+        ]
+
+    def volatility_gauges(self) -> List[tuple]:
+        samples = []
+        for symbol, state in self.symbols.items():
+            for estimator, horizons in state.volatility.to_dict().items():
+                samples.extend(({'symbol': symbol, 'estimator': estimator, 'horizon': horizon}, value)
+                               for horizon, value in horizons.items() if value is not None)
+        return [('volatility_annualized', 'gauge', 'Live annualized volatility estimates', samples)]
 
     async def start(self):
         """Start the WebSocket connection and database."""
         if self._connection_task is not None:
             return
+        if self.snapshotter:
+            self.snapshotter.restore()
         
         # Connect to database
         await db.connect()
         
         self.running = True
+        for stage in self.stages:
+            stage.start()
         self._connection_task = asyncio.create_task(self.connect_to_exchange())
+        if self.compactor:
+            self.compactor.start()
+        if self.snapshotter:
+            self.snapshotter.start()
 
     async def stop(self):
         """Stop the WebSocket connection and close database."""
@@ -316,9 +536,29 @@ class MarketDataWebSocket:
                 pass
             self._simulation_task = None
         
-        if self.ws:
-            await self.ws.close()
-        self.ws = None
+        for connection in self.connections:
+            await connection.close()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+        if self.compactor:
+            await self.compactor.stop()
+
+        # Downstream stages are still running while each stage drains
+        for stage in self.stages:
+            await stage.stop()
+        # Taken after the drain, so the snapshot includes everything received
+        if self.snapshotter:
+            await self.snapshotter.stop()
+
+        await self.clients.close()
+        for state in self.symbols.values():
+            state.close()
+        self._model_executor.shutdown(wait=False)
+        if self.recorder:
+            self.recorder.close()
         
-        # Close database connection
+        # Flush queued writes, then close database connection
+        await db.flush()
         await db.close()
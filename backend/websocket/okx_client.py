@@ -4,6 +4,7 @@ import websockets
 import logging
 from datetime import datetime
 from typing import Dict, List
+from websocket.orderbook import OrderBook
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -11,10 +12,7 @@ logger = logging.getLogger(__name__)
 class OKXWebSocketClient:
     def __init__(self, uri: str):
         self.uri = uri
-        self.orderbook: Dict[str, List[List[float]]] = {
-            'asks': [],
-            'bids': []
-        }
+        self.book = OrderBook()
         self.last_update: float = 0
 
     async def connect(self):
@@ -40,10 +38,13 @@ class OKXWebSocketClient:
             processing_latency = receive_time - self.last_update if self.last_update else 0
             
             # Update orderbook
-            if 'asks' in data:
-                self.orderbook['asks'] = data['asks']
-            if 'bids' in data:
-                self.orderbook['bids'] = data['bids']
+            if 'arg' in data and 'data' in data:
+                action = data.get('action', 'snapshot')
+                for book_data in data['data']:
+                    self.book.apply(action, book_data)
+            elif 'asks' in data or 'bids' in data:
+                # Full-depth L2 feeds send a complete book on every message
+                self.book.apply('snapshot', data)
             
             self.last_update = receive_time
             
@@ -55,7 +56,7 @@ class OKXWebSocketClient:
 
     def get_current_orderbook(self) -> Dict[str, List[List[float]]]:
         """Return the current state of the orderbook."""
-        return self.orderbook
+        return self.book.to_dict(depth=None)
 
     def get_last_update_time(self) -> float:
         """Return the timestamp of the last update."""
@@ -0,0 +1,256 @@
+import zlib
+import logging
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from websocket.codec import EncodedLevels, decimal_string
+
+logger = logging.getLogger(__name__)
+
+# OKX checksums cover the top 25 levels of each side
+CHECKSUM_DEPTH = 25
+
+
+class BookSide:
+    """
+    One side of an L2 order book kept in sorted, preallocated NumPy arrays.
+
+    Prices are stored as sort keys (price for bids, -price for asks) in
+    ascending order so the best level is always the last element. Most
+    updates land near the top of the book, which keeps the array shifts
+    for inserts and deletes short; the level itself is located with a
+    binary search.
+    """
+
+    def __init__(self, is_bid: bool, capacity: int = 1024):
+        self.is_bid = is_bid
+        self._sign = 1.0 if is_bid else -1.0
+        self._keys = np.empty(capacity, dtype=np.float64)
+        self._sizes = np.empty(capacity, dtype=np.float64)
+        self._count = 0
+        # Original exchange strings per price, needed for checksums
+        self._raw: Dict[float, Tuple[str, str]] = {}
+
+    def __len__(self) -> int:
+        return self._count
+
+    def clear(self):
+        self._count = 0
+        self._raw.clear()
+
+    def _grow(self):
+        capacity = len(self._keys) * 2
+        keys = np.empty(capacity, dtype=np.float64)
+        sizes = np.empty(capacity, dtype=np.float64)
+        keys[:self._count] = self._keys[:self._count]
+        sizes[:self._count] = self._sizes[:self._count]
+        self._keys = keys
+        self._sizes = sizes
+
+    def update(self, price_str: str, size_str: str):
+        """Insert, replace or (with a zero size) delete a single price level."""
+        price = float(price_str)
+        size = float(size_str)
+        key = price * self._sign
+        n = self._count
+        idx = int(np.searchsorted(self._keys[:n], key))
+        exists = idx < n and self._keys[idx] == key
+
+        if size == 0.0:
+            if exists:
+                self._keys[idx:n - 1] = self._keys[idx + 1:n]
+                self._sizes[idx:n - 1] = self._sizes[idx + 1:n]
+                self._count = n - 1
+                self._raw.pop(price, None)
+            return
+
+        if exists:
+            self._sizes[idx] = size
+        else:
+            if n == len(self._keys):
+                self._grow()
+            self._keys[idx + 1:n + 1] = self._keys[idx:n]
+            self._sizes[idx + 1:n + 1] = self._sizes[idx:n]
+            self._keys[idx] = key
+            self._sizes[idx] = size
+            self._count = n + 1
+        self._raw[price] = (price_str, size_str)
+
+    def best(self) -> Optional[Tuple[float, float]]:
+        """Return the best (price, size), or None for an empty side."""
+        if self._count == 0:
+            return None
+        i = self._count - 1
+        return float(self._keys[i] * self._sign), float(self._sizes[i])
+
+    def size_at(self, price: float) -> Optional[float]:
+        """Size at `price`: 0.0 for an empty level inside the book, None beyond its worst level."""
+        n = self._count
+        key = price * self._sign
+        idx = int(np.searchsorted(self._keys[:n], key))
+        if idx < n and self._keys[idx] == key:
+            return float(self._sizes[idx])
+        return 0.0 if idx > 0 else None
+
+    def prices(self, depth: Optional[int] = None) -> np.ndarray:
+        """Prices ordered best first."""
+        n = self._count
+        start = 0 if depth is None else max(n - depth, 0)
+        return self._keys[start:n][::-1] * self._sign
+
+    def sizes(self, depth: Optional[int] = None) -> np.ndarray:
+        """Sizes ordered best first."""
+        n = self._count
+        start = 0 if depth is None else max(n - depth, 0)
+        return self._sizes[start:n][::-1].copy()
+
+    def levels(self, depth: Optional[int] = None) -> np.ndarray:
+        """Return an (n, 2) array of [price, size] rows ordered best first."""
+        return np.column_stack((self.prices(depth), self.sizes(depth)))
+
+    def raw_levels(self, depth: int) -> List[Tuple[str, str]]:
+        """Original exchange strings for the top `depth` levels, best first."""
+        return [self._raw[price] for price in self.prices(depth).tolist()]
+
+
+class OrderBook:
+    """
+    Incrementally maintained L2 order book for the OKX `books` family of channels.
+
+    Snapshots reset both sides, updates are applied level by level, and
+    every message is validated against the exchange sequence ids and
+    CRC32 checksum. When validation fails the book is cleared and flagged
+    with `needs_resync` so the caller can resubscribe for a new snapshot.
+    """
+
+    def __init__(self, symbol: str = 'BTC-USDT-SWAP', capacity: int = 1024):
+        self.symbol = symbol
+        self.bids = BookSide(is_bid=True, capacity=capacity)
+        self.asks = BookSide(is_bid=False, capacity=capacity)
+        self.seq_id: Optional[int] = None
+        self.ts: int = 0
+        self.version: int = 0
+        self.synced = False
+        self.needs_resync = False
+        self.checksum_failures = 0
+        self._encoded: Optional[Tuple[int, Optional[int], Dict[str, EncodedLevels]]] = None
+
+    def reset(self):
+        self.bids.clear()
+        self.asks.clear()
+        self.seq_id = None
+        self.synced = False
+
+    def apply(self, action: str, book_data: Dict) -> bool:
+        """
+        Apply one OKX book message entry.
+
+        Args:
+            action: 'snapshot' or 'update', as sent in the message envelope
+            book_data: One element of the message `data` list
+
+        Returns:
+            True if the book is valid after the update, False if a resync is needed
+        """
+        if action == 'snapshot':
+            self.reset()
+        elif not self.synced:
+            # Deltas are meaningless until a snapshot has been received
+            return False
+        else:
+            prev_seq = book_data.get('prevSeqId')
+            if prev_seq is not None and self.seq_id is not None and int(prev_seq) != self.seq_id:
+                logger.warning(f"{self.symbol} book sequence gap: expected {self.seq_id}, got {prev_seq}")
+                return self._invalidate()
+
+        for level in book_data.get('bids', ()):
+            self.bids.update(level[0], level[1])
+        for level in book_data.get('asks', ()):
+            self.asks.update(level[0], level[1])
+
+        seq_id = book_data.get('seqId')
+        if seq_id is not None:
+            self.seq_id = int(seq_id)
+        self.ts = int(book_data.get('ts', 0) or 0)
+
+        expected = book_data.get('checksum')
+        if expected is not None and self.checksum() != int(expected):
+            self.checksum_failures += 1
+            logger.warning(f"{self.symbol} book checksum mismatch, resyncing")
+            return self._invalidate()
+
+        self.synced = True
+        self.needs_resync = False
+        self.version += 1
+        return True
+
+    def snapshot(self) -> Dict:
+        """Levels and timestamp of the book, for a warm restart."""
+        return {'asks': self.asks.levels(), 'bids': self.bids.levels(), 'ts': self.ts, 'synced': self.synced}
+
+    def restore(self, snapshot: Dict):
+        """
+        Load a book saved by `snapshot`.
+
+        Sequence ids are not kept: the restored book is served until the
+        exchange (re)subscription delivers its first snapshot, which
+        replaces it. Callers only restore recent books (see
+        StateSnapshotter). Checksums over restored levels use reformatted strings.
+        """
+        self.reset()
+        if not snapshot['synced']:
+            return
+        for price, size in snapshot['bids'].tolist():
+            self.bids.update(decimal_string(price), decimal_string(size))
+        for price, size in snapshot['asks'].tolist():
+            self.asks.update(decimal_string(price), decimal_string(size))
+        self.ts = int(snapshot['ts'])
+        self.synced = True
+        self.version += 1
+
+    def _invalidate(self) -> bool:
+        self.reset()
+        self.needs_resync = True
+        return False
+
+    def checksum(self) -> int:
+        """Compute the OKX signed CRC32 checksum over the top 25 levels."""
+        bids = self.bids.raw_levels(CHECKSUM_DEPTH)
+        asks = self.asks.raw_levels(CHECKSUM_DEPTH)
+        parts = []
+        for i in range(max(len(bids), len(asks))):
+            if i < len(bids):
+                parts.extend(bids[i])
+            if i < len(asks):
+                parts.extend(asks[i])
+        crc = zlib.crc32(':'.join(parts).encode())
+        return crc - (1 << 32) if crc >= (1 << 31) else crc
+
+    def best_bid(self) -> Optional[Tuple[float, float]]:
+        return self.bids.best()
+
+    def best_ask(self) -> Optional[Tuple[float, float]]:
+        return self.asks.best()
+
+    def mid_price(self) -> Optional[float]:
+        bid = self.bids.best()
+        ask = self.asks.best()
+        if bid is None or ask is None:
+            return None
+        return (bid[0] + ask[0]) / 2
+
+    def encoded_levels(self, depth: int = 20) -> Dict[str, EncodedLevels]:
+        """Top `depth` levels as exchange strings, encoded once per book version."""
+        if self._encoded is None or self._encoded[0] != self.version or self._encoded[1] != depth:
+            levels = {
+                'asks': EncodedLevels(self.asks.raw_levels(depth)),
+                'bids': EncodedLevels(self.bids.raw_levels(depth))
+            }
+            self._encoded = (self.version, depth, levels)
+        return self._encoded[2]
+
+    def to_dict(self, depth: Optional[int] = 20) -> Dict[str, List[List[float]]]:
+        """Return the top `depth` levels per side as [price, size] lists."""
+        return {
+            'asks': self.asks.levels(depth).tolist(),
+            'bids': self.bids.levels(depth).tolist()
+        }
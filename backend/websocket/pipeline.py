@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# What a full queue does with a new item of a given kind:
+#   block     wait until the consumer makes room (the default)
+#   conflate  replace the item of the same kind and key still waiting, if any, else block
+#   drop      discard the new item
+#   keep      queue it anyway; the capacity is exceeded and counted as overflow. Unbounded,
+#             so only for kinds that opt in explicitly
+POLICIES = ('keep', 'conflate', 'drop', 'block')
+
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', '10000'))
+# Items handled back to back before a stage yields to the event loop
+YIELD_EVERY = 64
+
+
+class StageQueue:
+    """
+    Bounded FIFO between two pipeline stages, with an overload policy per item kind.
+
+    Kinds without a policy block the producer while the queue is full, so a
+    slow consumer pushes back on its producers instead of growing the queue.
+
+    Conflated items keep their place and enqueue time, so lag reflects how
+    long the oldest unseen update of that key has been waiting.
+    """
+
+    def __init__(self, name: str, capacity: int, policies: Dict[str, str], default: str = 'block'):
+        for policy in list(policies.values()) + [default]:
+            if policy not in POLICIES:
+                raise ValueError(f"Unknown overload policy: {policy}")
+        self.name = name
+        self.capacity = capacity
+        self.policies = policies
+        self.default = default
+        # Entries are [kind, key, item, enqueue time]
+        self.entries: Deque[list] = deque()
+        self._waiting: Dict[tuple, list] = {}
+        self.not_empty = asyncio.Event()
+        self.not_full = asyncio.Event()
+        self.not_full.set()
+        self.enqueued = 0
+        self.processed = 0
+        self.conflated = 0
+        self.dropped = 0
+        self.overflow = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    async def put(self, kind: str, key: Hashable, item: Any):
+        policy = self.policies.get(kind, self.default)
+        while True:
+            if policy == 'conflate':
+                entry = self._waiting.get((kind, key))
+                if entry is not None:
+                    entry[2] = item
+                    self.conflated += 1
+                    return
+            if len(self.entries) < self.capacity:
+                break
+            if policy == 'drop':
+                self.dropped += 1
+                return
+            if policy == 'keep':
+                self.overflow += 1
+                break
+            # Another producer may have queued the same key while this one waited
+            self.not_full.clear()
+            await self.not_full.wait()
+        entry = [kind, key, item, time.perf_counter()]
+        self.entries.append(entry)
+        if policy == 'conflate':
+            self._waiting[(kind, key)] = entry
+        self.enqueued += 1
+        self.not_empty.set()
+
+    def pop(self) -> Optional[list]:
+        if not self.entries:
+            return None
+        entry = self.entries.popleft()
+        if self._waiting.get((entry[0], entry[1])) is entry:
+            del self._waiting[(entry[0], entry[1])]
+        if len(self.entries) < self.capacity:
+            self.not_full.set()
+        return entry
+
+    async def get(self) -> list:
+        while not self.entries:
+            self.not_empty.clear()
+            await self.not_empty.wait()
+        return self.pop()
+
+    def lag(self) -> float:
+        """Seconds the oldest waiting item has been queued."""
+        return time.perf_counter() - self.entries[0][3] if self.entries else 0.0
+
+    def stats(self) -> Dict:
+        return {
+            'depth': len(self.entries),
+            'lag_s': round(self.lag(), 6),
+            'enqueued': self.enqueued,
+            'processed': self.processed,
+            'conflated': self.conflated,
+            'dropped': self.dropped,
+            'overflow': self.overflow
+        }
+
+
+class Stage:
+    """
+    One step of the ingest pipeline, running `handler` on its own task fed by a StageQueue.
+
+    Until the stage is started, `submit` runs the handler inline, so
+    replays and tools that drive the feed without starting it keep the
+    serial behaviour. Handler time is recorded as the stage's latency and
+    queue wait as `queue_wait` for the stage.
+    """
+
+    def __init__(self, name: str, handler: Callable[[Any], Awaitable[None]],
+                 policies: Dict[str, str], default: str = 'block', capacity: int = PIPELINE_QUEUE_SIZE):
+        self.name = name
+        self.handler = handler
+        self.queue = StageQueue(name, capacity, policies, default)
+        self.latency = metrics.histogram(name)
+        self.wait = metrics.histogram('queue_wait', queue=name)
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def submit(self, kind: str, key: Hashable, item: Any):
+        if self._task is None:
+            await self._handle(item)
+        else:
+            await self.queue.put(kind, key, item)
+
+    async def _handle(self, item: Any):
+        start = time.perf_counter()
+        try:
+            await self.handler(item)
+        except Exception as e:
+            logger.error(f"Error in {self.name} stage: {e}")
+        self.latency.record(time.perf_counter() - start)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the task, then handle whatever is still queued."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        entry = self.queue.pop()
+        while entry is not None:
+            await self._handle(entry[2])
+            self.queue.processed += 1
+            entry = self.queue.pop()
+
+    async def _run(self):
+        handled = 0
+        while True:
+            entry = await self.queue.get()
+            self.wait.record(time.perf_counter() - entry[3])
+            await self._handle(entry[2])
+            self.queue.processed += 1
+            handled += 1
+            if handled % YIELD_EVERY == 0:
+                # get() only suspends on an empty queue, so a busy stage must yield itself
+                await asyncio.sleep(0)
+
+
+def stage_gauges(stages: List[Stage]) -> List[tuple]:
+    """Depth, lag and item counters of pipeline stages for the metrics endpoint."""
+    stats = {stage.name: stage.queue.stats() for stage in stages}
+    return [
+        ('pipeline_queue_depth', 'gauge', 'Items waiting in front of each pipeline stage',
+         [({'stage': name}, s['depth']) for name, s in stats.items()]),
+        ('pipeline_lag_seconds', 'gauge', 'Age of the oldest item waiting for each pipeline stage',
+         [({'stage': name}, s['lag_s']) for name, s in stats.items()]),
+        ('pipeline_items_total', 'counter', 'Items per pipeline stage by outcome',
+         [({'stage': name, 'outcome': outcome}, s[outcome]) for name, s in stats.items()
+          for outcome in ('enqueued', 'processed', 'conflated', 'dropped', 'overflow')])
+    ]
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List, Set, Tuple
+import numpy as np
+from database import db
+from websocket.market_data import MarketDataWebSocket
+
+logger = logging.getLogger(__name__)
+
+# Seconds between polls of the shared state for new tickers, books and trades
+SHARED_POLL_INTERVAL = float(os.getenv('SHARED_POLL_INTERVAL', '0.005'))
+# Seconds without an ingest heartbeat before the feed counts as disconnected
+INGEST_STALE_AFTER = float(os.getenv('INGEST_STALE_AFTER', '5'))
+
+
+def _changed_prices(old: np.ndarray, new: np.ndarray) -> Set[float]:
+    """Prices whose level was added, removed or resized between two [price, size] arrays."""
+    return {price for price, _ in set(map(tuple, old.tolist())) ^ set(map(tuple, new.tolist()))}
+
+
+class SharedMarketDataWebSocket(MarketDataWebSocket):
+    """
+    Market data for an API worker, read from the state the ingest process publishes.
+
+    The exchange connections, order books and model calibration run once,
+    in `python -m ingest`. Each worker attaches to the shared memory
+    segments: endpoints read books, ticks, candles and model parameters
+    in place, and a poll loop turns what changed into messages for this
+    worker's own WebSocket clients and fills for their paper orders.
+    """
+
+    def __init__(self):
+        super().__init__(shared='attach')
+        self._follow_task = None
+        # Symbol -> (asks, bids) levels of the book paper orders were last matched against
+        self._matched_books: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    @property
+    def connected(self) -> bool:
+        status = self.state().shared.ingest_status()
+        return bool(status['connected']) and time.time() - status['heartbeat'] < INGEST_STALE_AFTER
+
+    async def follow(self):
+        """Publish changes from the shared state to this worker's clients."""
+        while self.running:
+            try:
+                for state in self.symbols.values():
+                    for message in state.shared.follow(state, self.book_depth):
+                        if message['type'] == 'ticker':
+                            # The ingest process stores each ticker's book as a snapshot; cache the same here
+                            db.cache_orderbook(message, state.symbol, message['ts'])
+                        if state.matching:
+                            self.match(state, message)
+                        self.clients.publish(message)
+            except Exception as e:
+                logger.error(f"Error reading shared market state: {e}")
+            await asyncio.sleep(SHARED_POLL_INTERVAL)
+
+    def match(self, state, message: dict):
+        """Fill this worker's paper orders from a trade or book change read from the shared state."""
+        if message['type'] == 'trade':
+            fills = state.matching.on_trade(float(message['price']), float(message['size']), message['side'])
+        elif message['type'] == 'orderbook':
+            book = state.book
+            levels = (book.asks.levels(), book.bids.levels())
+            previous = self._matched_books.get(state.symbol)
+            self._matched_books[state.symbol] = levels
+            changed = None if previous is None else {
+                'asks': _changed_prices(previous[0], levels[0]),
+                'bids': _changed_prices(previous[1], levels[1])
+            }
+            fills = state.matching.on_book(book, changed)
+        else:
+            return
+        if fills:
+            self.send_fills(state, fills, message['timestamp'])
+
+    def gauges(self) -> List[tuple]:
+        client_stats = self.clients.stats()
+        status = {symbol: state.shared.ingest_status() for symbol, state in self.symbols.items()}
+        now = time.time()
+        return [
+            ('clients', 'gauge', 'Connected client websockets', [({}, client_stats['clients'])]),
+            ('clients_subscribed', 'gauge', 'Client websockets receiving coalesced frames',
+             [({}, client_stats['subscribed'])]),
+            ('client_queue_depth', 'gauge', 'Messages queued across client writers',
+             [({}, client_stats['queued'])]),
+            ('clients_disconnected_slow_total', 'counter', 'Clients dropped for falling behind',
+             [({}, client_stats['disconnected_slow'])]),
+            ('exchange_connected', 'gauge', 'Whether the ingest process is connected to the exchange',
+             [({'connection': 'ingest'}, int(self.connected))]),
+            ('ingest_heartbeat_age_seconds', 'gauge', 'Seconds since the ingest process last reported',
+             [({'symbol': symbol}, round(now - s['heartbeat'], 3)) for symbol, s in status.items()]),
+            ('symbol_messages_total', 'counter', 'Frames processed per instrument by the ingest process',
+             [({'symbol': symbol}, s['messages']) for symbol, s in status.items()]),
+            ('book_synced', 'gauge', 'Whether the shared order book is in sync',
+             [({'symbol': symbol}, int(state.book.synced)) for symbol, state in self.symbols.items()])
+        ] + self.paper_gauges() + self.volatility_gauges()
+
+    async def start(self):
+        """Start following the shared state; the database is only read here."""
+        if self._follow_task is not None:
+            return
+        await db.connect()
+        self.running = True
+        self._follow_task = asyncio.create_task(self.follow())
+
+    async def stop(self):
+        self.running = False
+        if self._follow_task:
+            self._follow_task.cancel()
+            try:
+                await self._follow_task
+            except asyncio.CancelledError:
+                pass
+            self._follow_task = None
+
+        await self.clients.close()
+        for state in self.symbols.values():
+            state.close()
+        self._model_executor.shutdown(wait=False)
+        await db.flush()
+        await db.close()
@@ -0,0 +1,282 @@
+import os
+from collections import deque
+from itertools import islice
+from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple, Union
+from websocket import codec
+from websocket.codec import EncodedLevels
+
+CHANNELS = ('ticker', 'book', 'trades')
+FORMATS = ('json', 'binary')
+# Keys that opt a client into the subscription protocol; a bare symbols list keeps the full stream
+OPTION_KEYS = ('channels', 'depth', 'maxRate', 'format')
+DEFAULT_RATE = float(os.getenv('CLIENT_DEFAULT_RATE', '10'))
+MAX_RATE = float(os.getenv('CLIENT_MAX_RATE', '50'))
+# Trades kept per symbol for clients to pick up on their next frame
+TRADE_BUFFER = int(os.getenv('CLIENT_TRADE_BUFFER', '1000'))
+
+Payload = Union[str, bytes]
+Levels = List[Tuple[str, str]]
+
+
+class TradeEntry:
+    __slots__ = ('seq', 'message', 'packed')
+
+    def __init__(self, seq: int, message: Dict):
+        self.seq = seq
+        self.message = message
+        self.packed: Optional[bytes] = None
+
+
+class SymbolFeed:
+    """
+    Latest published state of one symbol, shared by every subscribed client.
+
+    Publishing only replaces the latest ticker or book and appends trades;
+    each client's frame loop later reads what changed since its previous
+    frame, so the publish cost does not grow with the number of
+    subscribers. Trimmed views of the latest ticker and book are cached per
+    depth and shared by clients asking for the same depth.
+    """
+
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+        self.ticker: Optional[Dict] = None
+        self.ticker_version = 0
+        self.book: Optional[Dict] = None
+        self.book_version = 0
+        self.trades: Deque[TradeEntry] = deque(maxlen=TRADE_BUFFER)
+        self.trade_seq = 0
+        self._tickers: Dict[int, str] = {}
+        self._books: Dict[int, Tuple[Levels, Levels]] = {}
+        self._book_ts: Optional[int] = None
+
+    def update(self, message: Dict):
+        msg_type = message.get('type')
+        if msg_type == 'ticker':
+            self.ticker = message
+            self.ticker_version += 1
+            self._tickers.clear()
+        elif msg_type == 'orderbook':
+            self.book = message
+            self.book_version += 1
+            self._books.clear()
+            self._book_ts = None
+        elif msg_type == 'trade':
+            self.trade_seq += 1
+            self.trades.append(TradeEntry(self.trade_seq, message))
+
+    def ticker_payload(self, depth: int) -> str:
+        """Latest ticker encoded as JSON, with its book levels trimmed to `depth`."""
+        payload = self._tickers.get(depth)
+        if payload is None:
+            message = dict(self.ticker)
+            for side in ('asks', 'bids'):
+                if side in message:
+                    message[side] = EncodedLevels([(px, sz) for px, sz in message[side][:depth]])
+            payload = self._tickers[depth] = codec.encode(message)
+        return payload
+
+    def book_levels(self, depth: int) -> Tuple[Levels, Levels]:
+        levels = self._books.get(depth)
+        if levels is None:
+            levels = self._books[depth] = (
+                [(px, sz) for px, sz in self.book['asks'][:depth]],
+                [(px, sz) for px, sz in self.book['bids'][:depth]]
+            )
+        return levels
+
+    def book_ts(self) -> int:
+        if self._book_ts is None:
+            self._book_ts = codec.timestamp_ms(self.book['timestamp'])
+        return self._book_ts
+
+    def trades_since(self, seq: int) -> Tuple[List[TradeEntry], int]:
+        """Trades published after `seq`, and how many of those already fell out of the buffer."""
+        count = self.trade_seq - seq
+        if count <= 0:
+            return [], 0
+        available = min(count, len(self.trades))
+        entries = list(islice(reversed(self.trades), available))
+        entries.reverse()
+        return entries, count - available
+
+
+def _diff(previous: Dict[str, str], current: Dict[str, str]) -> Levels:
+    """Levels that changed between two books; levels that left the window get size '0'."""
+    changes = [(px, sz) for px, sz in current.items() if previous.get(px) != sz]
+    changes.extend((px, '0') for px in previous if px not in current)
+    return changes
+
+
+class Subscription:
+    """
+    Symbols, channels, book depth, frame rate and encoding chosen by one client.
+
+    Frames are built at most `max_rate` times per second, coalescing
+    everything published in between: the latest ticker, the book as a
+    delta against what this client last received (a full snapshot first,
+    and again after the depth or format changes or the book channel is
+    subscribed again), and every trade since
+    the previous frame in a single message.
+    """
+
+    def __init__(self, max_depth: int):
+        self.max_depth = max_depth
+        self.symbols: Set[str] = set()
+        self.channels: Set[str] = set(CHANNELS)
+        self.depth = max_depth
+        self.max_rate = min(DEFAULT_RATE, MAX_RATE)
+        self.binary = False
+        self._tickers: Dict[str, int] = {}
+        self._book_versions: Dict[str, int] = {}
+        self._books: Dict[str, Tuple[Dict[str, str], Dict[str, str]]] = {}
+        self._book_seq: Dict[str, int] = {}
+        self._trades: Dict[str, int] = {}
+
+    @staticmethod
+    def requested(request: Dict) -> bool:
+        """Whether a subscribe request uses the subscription protocol."""
+        return any(key in request for key in OPTION_KEYS)
+
+    @property
+    def interval(self) -> float:
+        return 1.0 / self.max_rate
+
+    def configure(self, request: Dict):
+        """
+        Apply the options of a subscribe request; options it leaves out are kept.
+
+        Raises:
+            ValueError: If any option is invalid, before anything is changed
+        """
+        channels = request.get('channels', list(self.channels))
+        if not isinstance(channels, list) or any(channel not in CHANNELS for channel in channels):
+            raise ValueError(f"channels must be a list of {', '.join(CHANNELS)}")
+        depth = request.get('depth', self.depth)
+        if type(depth) is not int or not 1 <= depth <= self.max_depth:
+            raise ValueError(f"depth must be between 1 and {self.max_depth}")
+        max_rate = request.get('maxRate', self.max_rate)
+        if type(max_rate) not in (int, float) or not 0 < max_rate <= MAX_RATE:
+            raise ValueError(f"maxRate must be above 0 and at most {MAX_RATE:g} updates per second")
+        fmt = request.get('format', FORMATS[self.binary])
+        if fmt not in FORMATS:
+            raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+
+        if depth != self.depth or (fmt == 'binary') != self.binary:
+            # Deltas only apply on top of the client's copy, so start it over with snapshots
+            self._forget(('book',))
+        self._forget(self.channels.difference(channels))
+        self.channels = set(channels)
+        self.depth = depth
+        self.max_rate = float(max_rate)
+        self.binary = fmt == 'binary'
+
+    def remove(self, symbols: Iterable[str] = (), channels: Iterable[str] = ()):
+        for symbol in symbols:
+            self.symbols.discard(symbol)
+            for state in (self._tickers, self._book_versions, self._books, self._book_seq, self._trades):
+                state.pop(symbol, None)
+        channels = set(channels)
+        self._forget(channels & self.channels)
+        self.channels.difference_update(channels)
+
+    def _forget(self, channels: Iterable[str]):
+        """
+        Drop what was sent on the given channels, for every symbol.
+
+        A channel subscribed again then starts over: the book with a fresh
+        snapshot instead of deltas against a copy the client discarded,
+        trades from that moment and the ticker with its latest value.
+        """
+        for channel in channels:
+            if channel == 'book':
+                self._books.clear()
+                self._book_versions.clear()
+                self._book_seq.clear()
+            elif channel == 'trades':
+                self._trades.clear()
+            elif channel == 'ticker':
+                self._tickers.clear()
+
+    def describe(self) -> Dict:
+        return {
+            'type': 'subscribed',
+            'symbols': sorted(self.symbols),
+            'channels': [channel for channel in CHANNELS if channel in self.channels],
+            'depth': self.depth,
+            'maxRate': self.max_rate,
+            'format': FORMATS[self.binary]
+        }
+
+    def frames(self, feeds: Dict[str, SymbolFeed]) -> List[Payload]:
+        """Payloads for everything published since the previous frame."""
+        payloads = []
+        for symbol in (self.symbols or list(feeds)):
+            feed = feeds.get(symbol)
+            if feed is None:
+                continue
+            if 'ticker' in self.channels and feed.ticker is not None \
+                    and self._tickers.get(symbol) != feed.ticker_version:
+                self._tickers[symbol] = feed.ticker_version
+                payloads.append(feed.ticker_payload(self.depth))
+            if 'book' in self.channels and feed.book is not None \
+                    and self._book_versions.get(symbol) != feed.book_version:
+                self._book_versions[symbol] = feed.book_version
+                payload = self._book_frame(feed)
+                if payload is not None:
+                    payloads.append(payload)
+            if 'trades' in self.channels:
+                payload = self._trades_frame(feed)
+                if payload is not None:
+                    payloads.append(payload)
+        return payloads
+
+    def _book_frame(self, feed: SymbolFeed) -> Optional[Payload]:
+        symbol = feed.symbol
+        asks, bids = feed.book_levels(self.depth)
+        previous = self._books.get(symbol)
+        current = (dict(asks), dict(bids))
+        self._books[symbol] = current
+        if previous is None:
+            action, seq = 'snapshot', 1
+        else:
+            asks, bids = _diff(previous[0], current[0]), _diff(previous[1], current[1])
+            if not asks and not bids:
+                # The book changed, but not within this client's depth
+                return None
+            action, seq = 'update', self._book_seq[symbol] + 1
+        self._book_seq[symbol] = seq
+        if self.binary:
+            return codec.encode_book_binary(symbol, action, seq, feed.book_ts(), asks, bids)
+        return codec.encode({
+            'type': 'book',
+            'action': action,
+            'symbol': symbol,
+            'seq': seq,
+            'timestamp': feed.book['timestamp'],
+            'asks': EncodedLevels(asks),
+            'bids': EncodedLevels(bids)
+        })
+
+    def _trades_frame(self, feed: SymbolFeed) -> Optional[Payload]:
+        symbol = feed.symbol
+        last = self._trades.get(symbol)
+        self._trades[symbol] = feed.trade_seq
+        if last is None:
+            # Trades are streamed from the moment of subscribing, not replayed
+            return None
+        entries, missed = feed.trades_since(last)
+        if not entries and not missed:
+            return None
+        if self.binary:
+            for entry in entries:
+                if entry.packed is None:
+                    entry.packed = codec.pack_trade(entry.message)
+            return codec.encode_trades_binary(symbol, missed, [entry.packed for entry in entries])
+        return codec.encode({
+            'type': 'trades',
+            'symbol': symbol,
+            'missed': missed,
+            # [price, size, side, timestamp] per trade, oldest first
+            'trades': [[m['price'], m['size'], m['side'], m['timestamp']] for m in (e.message for e in entries)]
+        })
@@ -0,0 +1,60 @@
+import os
+from typing import Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from websocket.orderbook import OrderBook
+from shared_state import SharedBookView, SharedSymbolState
+from models.impact import MarketImpactModel
+from models.maker_taker import MakerTakerClassifier
+from models.matching import MatchingEngine
+from models.volatility import VolatilityEstimator
+from tick_store import TickStore
+
+
+class SymbolState:
+    """Per-instrument market state: local book, tick store, calibrated models and paper orders."""
+
+    def __init__(self, symbol: str, executor: ThreadPoolExecutor, shared: Optional[str] = None):
+        """
+        Args:
+            symbol: Instrument id
+            executor: Worker pool for model training
+            shared: 'publish' to mirror the state into shared memory (ingest process),
+                'attach' to read it from there (API workers), None for process-local state
+        """
+        self.symbol = symbol
+        tick_capacity = int(os.getenv('TICK_BUFFER_SIZE', '200000'))
+        trade_capacity = int(os.getenv('TRADE_BUFFER_SIZE', '500000'))
+        self.shared = SharedSymbolState(symbol, tick_capacity, trade_capacity, owner=shared == 'publish') \
+            if shared else None
+        self.book = SharedBookView(symbol) if shared == 'attach' else OrderBook(symbol)
+        self.impact_model = MarketImpactModel()
+        self.maker_taker = MakerTakerClassifier(executor=executor)
+        self.volatility = VolatilityEstimator()
+        self.tick_store = TickStore(
+            symbol,
+            tick_capacity=tick_capacity,
+            trade_capacity=trade_capacity,
+            ring=self.shared.ring if self.shared else None
+        )
+        # Clients' paper orders, filled against this process's view of the feed
+        self.matching = MatchingEngine(symbol)
+        self.messages = 0
+
+    @property
+    def version(self) -> Tuple[int, int, int]:
+        """
+        Version of the state that derived results depend on: the book version
+        (the ticker count while there is no synced book) and the versions of
+        the impact and maker/taker calibrations.
+        """
+        market = self.book.version if self.book.synced else -self.tick_store.ticks.count
+        impact = self.impact_model.params
+        coefficients = self.maker_taker.coefficients
+        return (market,
+                impact.version if impact is not None else 0,
+                coefficients.version if coefficients is not None else 0)
+
+    def close(self):
+        self.maker_taker.close()
+        if self.shared:
+            self.shared.close()
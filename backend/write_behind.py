@@ -0,0 +1,258 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from itertools import islice
+from typing import Deque, Dict, List, Optional
+from bson import json_util
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+BACKPRESSURE_POLICIES = ('block', 'drop_oldest', 'spill')
+# Write error code of a document whose _id is already stored
+DUPLICATE_KEY = 11000
+
+
+class CollectionQueue:
+    """Bounded queue and counters for a single MongoDB collection."""
+
+    def __init__(self, name: str, max_size: int):
+        self.name = name
+        self.max_size = max_size
+        self.docs: Deque[Dict] = deque()
+        self.batch_ready = asyncio.Event()
+        self.not_full = asyncio.Event()
+        self.not_full.set()
+        self.queued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.failed = 0
+        self.last_flush_ms = 0.0
+
+    def stats(self) -> Dict:
+        return {
+            'depth': len(self.docs),
+            'queued': self.queued,
+            'flushed': self.flushed,
+            'dropped': self.dropped,
+            'spilled': self.spilled,
+            'failed': self.failed,
+            'last_flush_ms': round(self.last_flush_ms, 3)
+        }
+
+
+class WriteBehindBuffer:
+    """
+    Write-behind stage that batches documents per collection and persists them with `insert_many`.
+
+    A collection is flushed as soon as `batch_size` documents are waiting or
+    `flush_interval` seconds after its first pending document, whichever
+    comes first. When a queue is full the configured backpressure policy
+    decides what happens to new documents:
+
+        block        wait for the flusher to make room
+        drop_oldest  discard the oldest pending document
+        spill        append the document to an NDJSON file under `spill_dir`,
+                     re-inserted once the collection has drained
+
+    Spill files are MongoDB extended JSON, so a document keeps its types
+    and the _id the driver gave it; re-inserting one an earlier attempt
+    already stored fails as a duplicate instead of storing it twice.
+    """
+
+    def __init__(self,
+                 db,
+                 batch_size: Optional[int] = None,
+                 flush_interval: Optional[float] = None,
+                 max_queue_size: Optional[int] = None,
+                 policy: Optional[str] = None,
+                 spill_dir: Optional[str] = None):
+        self.db = db
+        self.batch_size = batch_size or int(os.getenv('DB_BATCH_SIZE', '500'))
+        self.flush_interval = flush_interval or float(os.getenv('DB_FLUSH_INTERVAL', '0.05'))
+        self.max_queue_size = max_queue_size or int(os.getenv('DB_QUEUE_SIZE', '10000'))
+        self.policy = policy or os.getenv('DB_BACKPRESSURE', 'drop_oldest')
+        if self.policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {self.policy}")
+        self.spill_dir = spill_dir or os.getenv('DB_SPILL_DIR', 'spill')
+        self.queues: Dict[str, CollectionQueue] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.running = False
+
+    def _queue(self, collection: str) -> CollectionQueue:
+        queue = self.queues.get(collection)
+        if queue is None:
+            queue = CollectionQueue(collection, self.max_queue_size)
+            self.queues[collection] = queue
+            if self.running:
+                self._tasks[collection] = asyncio.create_task(self._flush_loop(queue))
+        return queue
+
+    async def start(self):
+        """Start one flusher task per known collection."""
+        if self.running:
+            return
+        self.running = True
+        for queue in self.queues.values():
+            self._tasks[queue.name] = asyncio.create_task(self._flush_loop(queue))
+
+    async def stop(self):
+        """Stop the flusher tasks and persist everything still queued."""
+        if not self.running:
+            return
+        self.running = False
+        for queue in self.queues.values():
+            queue.batch_ready.set()
+            queue.not_full.set()
+        # Let the flushers finish their current batch rather than cancelling mid-insert
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+        await self.flush()
+
+    async def put(self, collection: str, doc: Dict):
+        """Queue a document for `collection`, applying backpressure when the queue is full."""
+        queue = self._queue(collection)
+
+        while len(queue.docs) >= queue.max_size:
+            if self.policy == 'drop_oldest':
+                queue.docs.popleft()
+                queue.dropped += 1
+            elif self.policy == 'spill':
+                self._spill(queue, [doc])
+                return
+            else:
+                if not self.running:
+                    break
+                queue.not_full.clear()
+                queue.batch_ready.set()
+                await queue.not_full.wait()
+
+        queue.docs.append(doc)
+        queue.queued += 1
+        if len(queue.docs) >= self.batch_size:
+            queue.batch_ready.set()
+
+    async def flush(self):
+        """Persist all pending documents of every collection."""
+        for queue in list(self.queues.values()):
+            while queue.docs:
+                await self._flush_batch(queue)
+            await self._drain_spill(queue)
+
+    async def _flush_loop(self, queue: CollectionQueue):
+        while self.running:
+            try:
+                if not queue.docs:
+                    await queue.batch_ready.wait()
+                    queue.batch_ready.clear()
+                    continue
+                if len(queue.docs) < self.batch_size:
+                    # Give the batch until the end of the window to fill up
+                    try:
+                        await asyncio.wait_for(queue.batch_ready.wait(), self.flush_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                queue.batch_ready.clear()
+                await self._flush_batch(queue)
+                if not queue.docs:
+                    await self._drain_spill(queue)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error flushing {queue.name}: {e}")
+                await asyncio.sleep(self.flush_interval)
+
+    async def _flush_batch(self, queue: CollectionQueue):
+        count = min(len(queue.docs), self.batch_size)
+        batch = [queue.docs.popleft() for _ in range(count)]
+        queue.not_full.set()
+        if batch:
+            failed = await self._insert(queue, batch)
+            if failed and self.policy == 'spill':
+                self._spill(queue, failed)
+            else:
+                queue.failed += len(failed)
+
+    async def _insert(self, queue: CollectionQueue, batch: List[Dict]) -> List[Dict]:
+        """
+        Insert a batch and return the documents that were not stored.
+
+        Of a partly failed batch only the documents the bulk write rejected
+        are returned; those rejected as an already stored _id count as flushed.
+        """
+        start_time = time.perf_counter()
+        try:
+            await self.db.insert_many(queue.name, batch)
+            failed = []
+        except BulkWriteError as e:
+            errors = e.details.get('writeErrors', [])
+            failed = [batch[error['index']] for error in errors if error.get('code') != DUPLICATE_KEY]
+            if failed:
+                logger.error(f"Failed to insert {len(failed)} of {len(batch)} documents into {queue.name}: "
+                             f"{errors[0].get('errmsg')}")
+        except Exception as e:
+            logger.error(f"Failed to insert {len(batch)} documents into {queue.name}: {e}")
+            failed = batch
+        queue.flushed += len(batch) - len(failed)
+        queue.last_flush_ms = (time.perf_counter() - start_time) * 1000
+        return failed
+
+    def _spill_path(self, queue: CollectionQueue) -> str:
+        return os.path.join(self.spill_dir, f"{queue.name}.ndjson")
+
+    def _write_spill(self, queue: CollectionQueue, docs: List[Dict]):
+        os.makedirs(self.spill_dir, exist_ok=True)
+        with open(self._spill_path(queue), 'a', encoding='utf-8') as f:
+            for doc in docs:
+                f.write(json_util.dumps(doc))
+                f.write('\n')
+        queue.spilled += len(docs)
+
+    @staticmethod
+    def _load_spilled(line: str) -> Dict:
+        doc = json_util.loads(line)
+        if isinstance(doc.get('_id'), str):
+            # Plain JSON spilled by earlier versions turned the ObjectId into a string; let MongoDB assign a new one
+            del doc['_id']
+        return doc
+
+    def _spill(self, queue: CollectionQueue, docs: List[Dict]):
+        try:
+            self._write_spill(queue, docs)
+        except Exception as e:
+            logger.error(f"Failed to spill {queue.name} documents to disk: {e}")
+            queue.dropped += len(docs)
+
+    async def _drain_spill(self, queue: CollectionQueue):
+        """
+        Re-insert spilled documents once the in-memory queue is empty.
+
+        Whatever the policy, a batch that fails goes back to the spill file
+        with every document after it, and the `.draining` file is removed
+        only once all of its documents are stored or spilled again.
+        """
+        path = self._spill_path(queue)
+        pending = path + '.draining'
+        # A leftover `.draining` file means a previous drain was interrupted
+        if not os.path.exists(pending):
+            if not os.path.exists(path):
+                return
+            os.replace(path, pending)
+        with open(pending, 'r', encoding='utf-8') as f:
+            while True:
+                batch = [self._load_spilled(line) for line in islice(f, self.batch_size)]
+                if not batch:
+                    break
+                failed = await self._insert(queue, batch)
+                if failed:
+                    # Database is still unavailable; keep the failed and remaining documents on disk
+                    self._write_spill(queue, failed + [self._load_spilled(rest) for rest in f])
+                    break
+        os.remove(pending)
+
+    def stats(self) -> Dict[str, Dict]:
+        """Return queue depth and queued/flushed/dropped counters per collection."""
+        return {name: queue.stats() for name, queue in self.queues.items()}
@@ -27,6 +27,8 @@ const LiveMarketData: React.FC = () => {
     ws.onopen = () => {
       console.log('Connected to market data WebSocket');
       setIsConnected(true);
+      // Top of book and trades, coalesced to 4 updates per second
+      ws.send(JSON.stringify({ op: 'subscribe', channels: ['ticker', 'trades'], depth: 1, maxRate: 4 }));
     };
 
     ws.onmessage = (event) => {
@@ -41,16 +43,15 @@ const LiveMarketData: React.FC = () => {
           volume24h: data.volume24h,
           change24h: data.change24h,
         });
-      } else if (data.type === 'trade') {
-        setRecentTrades(prev => [
-          {
-            price: data.price,
-            size: data.size,
-            side: data.side,
-            timestamp: data.timestamp,
-          },
-          ...prev.slice(0, 9), // Keep only last 10 trades
-        ]);
+      } else if (data.type === 'trades') {
+        // Batched as [price, size, side, timestamp], oldest first
+        const trades: Trade[] = data.trades.map(([price, size, side, timestamp]: [string, string, 'buy' | 'sell', string]) => ({
+          price: Number(price),
+          size: Number(size),
+          side,
+          timestamp,
+        }));
+        setRecentTrades(prev => [...trades.reverse(), ...prev].slice(0, 10)); // Keep only last 10 trades
       }
     };
 